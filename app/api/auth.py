@@ -1,23 +1,32 @@
 import html
 import os
+import random
 import re
 import urllib.parse
 from base64 import urlsafe_b64encode
 from hashlib import sha256
 
-from aiohttp import ClientSession
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 
 from app.setup_rollbar import rollbar_handler
+from app.utils import schedule_refresh
 from app.utils.db import db_instance
+from app.utils.discovery import typed_discovery_fields
+from app.utils.fast_json import FastJSONRoute
+from app.utils.http_clients import KEYCLOAK, http_clients
+from app.utils.single_flight import SingleFlight
+from app.utils.user_index import user_index
 
-router = APIRouter()
+router = APIRouter(route_class=FastJSONRoute)
 
 CLIENT_ID = "student-personal-cabinet"
 PROVIDER_URL = "https://id.itmo.ru/auth/realms/itmo"
 REDIRECT_URI = "https://my.itmo.ru/login/callback"
 
+logins = SingleFlight("login_with_password")
+user_creations = SingleFlight("fill_user_info")
+
 
 class LoginRequest(BaseModel):
     username: str
@@ -40,9 +49,13 @@ def get_code_challenge(code_verifier: str):
 @router.post("/login_with_password")
 @rollbar_handler
 async def login_with_password(payload: LoginRequest):
-    username = payload.username
-    password = payload.password
+    # Одинаковые конкурентные логины (переподключение приложения) проходят
+    # Keycloak один раз и получают общий результат; пароль входит в ключ только хэшем
+    key = (payload.username, sha256(payload.password.encode("utf-8")).hexdigest())
+    return await logins.do(key, authenticate, payload.username, payload.password)
+
 
+async def authenticate(username: str, password: str):
     # Test user shortcut
     if username == "999999" and password == "test":
         # Mock user info
@@ -64,92 +77,97 @@ async def login_with_password(payload: LoginRequest):
     code_verifier = generate_code_verifier()
     code_challenge = get_code_challenge(code_verifier)
 
-    async with ClientSession() as session:
-        auth_resp = await session.get(
-            f"{PROVIDER_URL}/protocol/openid-connect/auth",
-            params={
-                "client_id": CLIENT_ID,
-                "redirect_uri": REDIRECT_URI,
-                "response_type": "code",
-                "scope": "openid profile",
-                "state": "random_state",
-                "code_challenge_method": "S256",
-                "code_challenge": code_challenge,
-            },
-        )
-        auth_resp.raise_for_status()
-        resp_text = await auth_resp.text()
-
-        form_regex = re.compile(r'<form\s+.*?\s+action="(?P<action>.*?)"', re.DOTALL)
-        form_action_match = re.search(form_regex, resp_text)
-        if not form_action_match:
-            raise HTTPException(status_code=500, detail="Failed to find form action for login")
-
-        form_action = html.unescape(form_action_match.group("action"))
-
-        form_resp = await session.post(
-            url=form_action,
-            data={"username": username, "password": password},
-            cookies=auth_resp.cookies,
-            allow_redirects=False,
+    session = http_clients.get(KEYCLOAK)
+    auth_resp = await session.get(
+        f"{PROVIDER_URL}/protocol/openid-connect/auth",
+        params={
+            "client_id": CLIENT_ID,
+            "redirect_uri": REDIRECT_URI,
+            "response_type": "code",
+            "scope": "openid profile",
+            "state": "random_state",
+            "code_challenge_method": "S256",
+            "code_challenge": code_challenge,
+        },
+    )
+    auth_resp.raise_for_status()
+    resp_text = await auth_resp.text()
+
+    form_regex = re.compile(r'<form\s+.*?\s+action="(?P<action>.*?)"', re.DOTALL)
+    form_action_match = re.search(form_regex, resp_text)
+    if not form_action_match:
+        raise HTTPException(status_code=500, detail="Failed to find form action for login")
+
+    form_action = html.unescape(form_action_match.group("action"))
+
+    form_resp = await session.post(
+        url=form_action,
+        data={"username": username, "password": password},
+        cookies=auth_resp.cookies,
+        allow_redirects=False,
+    )
+
+    # Тело ответа не читается: соединение нужно явно вернуть в пул, в том числе
+    # при неверном пароле; статус и заголовки остаются доступны после release
+    await form_resp.release()
+
+    if form_resp.status != 302:
+        raise HTTPException(
+            status_code=form_resp.status,
+            detail="Login failed with provided credentials",
         )
 
-        if form_resp.status != 302:
-            raise HTTPException(
-                status_code=form_resp.status,
-                detail="Login failed with provided credentials",
-            )
-
-        redirect_url = form_resp.headers["Location"]
-        query = urllib.parse.urlparse(redirect_url).query
-        redirect_params = urllib.parse.parse_qs(query)
-        auth_code = redirect_params.get("code")
-        if not auth_code:
-            raise HTTPException(status_code=500, detail="Authorization code not found after login")
-
-        token_resp = await session.post(
-            f"{PROVIDER_URL}/protocol/openid-connect/token",
-            data={
-                "grant_type": "authorization_code",
-                "client_id": CLIENT_ID,
-                "redirect_uri": REDIRECT_URI,
-                "code": auth_code[0],
-                "code_verifier": code_verifier,
-            },
-        )
-        token_resp.raise_for_status()
-
-        token_data = await token_resp.json()
-        access_token = token_data.get("access_token")
-
-        if not access_token:
-            raise HTTPException(status_code=500, detail="Failed to retrieve access token")
-
-        user_info_url = f"{PROVIDER_URL}/protocol/openid-connect/userinfo"
-        headers = {"Authorization": f"Bearer {access_token}"}
-
-        user_resp = await session.get(user_info_url, headers=headers)
-
-        if user_resp.status != 200:
-            raise HTTPException(status_code=user_resp.status, detail="User info retrieval failed")
-
-        user_info = await user_resp.json()
-        user_collection = db_instance.get_collection("users")
-        user_resp.close()
+    redirect_url = form_resp.headers["Location"]
+    query = urllib.parse.urlparse(redirect_url).query
+    redirect_params = urllib.parse.parse_qs(query)
+    auth_code = redirect_params.get("code")
+    if not auth_code:
+        raise HTTPException(status_code=500, detail="Authorization code not found after login")
+
+    token_resp = await session.post(
+        f"{PROVIDER_URL}/protocol/openid-connect/token",
+        data={
+            "grant_type": "authorization_code",
+            "client_id": CLIENT_ID,
+            "redirect_uri": REDIRECT_URI,
+            "code": auth_code[0],
+            "code_verifier": code_verifier,
+        },
+    )
+    token_resp.raise_for_status()
+
+    token_data = await token_resp.json()
+    access_token = token_data.get("access_token")
+
+    if not access_token:
+        raise HTTPException(status_code=500, detail="Failed to retrieve access token")
+
+    user_info_url = f"{PROVIDER_URL}/protocol/openid-connect/userinfo"
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    user_resp = await session.get(user_info_url, headers=headers)
+
+    if user_resp.status != 200:
+        await user_resp.release()
+        raise HTTPException(status_code=user_resp.status, detail="User info retrieval failed")
+
+    user_info = await user_resp.json()
+    user_collection = db_instance.get_collection("users")
 
-        await update_user_schedule(user_info["isu"], access_token)
+    # Расписание загружается в фоне и не задерживает ответ на логин
+    await schedule_refresh.enqueue(user_info["isu"], access_token)
 
-        existing_user = await user_collection.find_one({"isu": user_info["isu"]})
+    existing_user = await user_collection.find_one({"isu": user_info["isu"]})
 
-        if existing_user:
-            # Возвращаем JSON с redirect
-            return {"redirect": "/auth/dashboard", "isu": user_info["isu"]}
-        else:
-            await fill_user_info(user_info)
-            return {
-                "redirect": "/auth/register/select_username",
-                "isu": user_info["isu"],
-            }
+    if existing_user:
+        # Возвращаем JSON с redirect
+        return {"redirect": "/auth/dashboard", "isu": user_info["isu"]}
+    else:
+        await fill_user_info(user_info)
+        return {
+            "redirect": "/auth/register/select_username",
+            "isu": user_info["isu"],
+        }
 
 
 @router.get("/dashboard")
@@ -160,6 +178,10 @@ async def dashboard_stub():
 
 @rollbar_handler
 async def fill_user_info(user_info: dict):
+    await user_creations.do(user_info["isu"], create_user, user_info)
+
+
+async def create_user(user_info: dict):
     user_collection = db_instance.get_collection("users")
 
     selected_group = max(user_info.get("groups", []), key=lambda g: g.get("course", 0), default=None)
@@ -192,27 +214,10 @@ async def fill_user_info(user_info: dict):
         "gender_preferences": [],
         "relationship_preferences": [],
         "isStudent": True,
+        "version": 1,
     }
+    new_user.update(typed_discovery_fields(new_user))
+    new_user["rand"] = random.random()
 
     await user_collection.insert_one(new_user)
-
-
-@rollbar_handler
-async def update_user_schedule(isu: int, token: str):
-    try:
-        async with ClientSession() as session:
-            url = "https://my.itmo.ru/api/schedule/schedule/personal?date_start=2024-09-01&date_end=2025-02-01"
-            headers = {"Authorization": f"Bearer {token}", "Accept-Language": "ru"}
-            async with session.get(url, headers=headers) as response:
-                if response.status != 200:
-                    raise HTTPException(
-                        status_code=500,
-                        detail="Failed to fetch schedulefrom itmo api. Maybe token is dead?",
-                    )
-                calendar_data = await response.json()
-
-                filename = f"schedule_{isu}.json"
-                db_instance.delete_json_from_minio(filename)
-                db_instance.uplod_json_to_minio(calendar_data, filename)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error updating schedule: {e}")
+    user_index.patch(new_user["isu"], **typed_discovery_fields(new_user))
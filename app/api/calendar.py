@@ -1,9 +1,11 @@
 from fastapi import APIRouter, HTTPException
 
 from app.setup_rollbar import rollbar_handler
+from app.utils import schedule_refresh
 from app.utils.db import db_instance
+from app.utils.fast_json import FastJSONRoute
 
-router = APIRouter()
+router = APIRouter(route_class=FastJSONRoute)
 
 
 @router.get("/get_calendar/{isu}")
@@ -11,7 +13,16 @@ router = APIRouter()
 async def update_calendar(isu: int):
     try:
         filename = f"schedule_{isu}.json"
-        schedule = db_instance.get_json_from_minio(filename)
+        schedule = await db_instance.get_json_from_minio(filename)
         return schedule["data"]
     except ValueError as e:
         raise HTTPException(status_code=404, detail=f"Schedule not found: {e}")
+
+
+@router.get("/schedule_status/{isu}")
+@rollbar_handler
+async def get_schedule_status(isu: int):
+    status = await schedule_refresh.get_status(isu)
+    if not status:
+        raise HTTPException(status_code=404, detail="Schedule refresh not found")
+    return status
@@ -9,9 +9,9 @@ from fastapi import APIRouter, File, Form, HTTPException, Query, UploadFile
 from app.models.chat import CreateChat, SendMessage
 from app.setup_rollbar import rollbar_handler
 from app.utils.db import db_instance
-from app.utils.serializer import serialize
+from app.utils.fast_json import FastJSONRoute
 
-router = APIRouter()
+router = APIRouter(route_class=FastJSONRoute)
 
 
 @router.post("/create_chat")
@@ -20,8 +20,7 @@ async def create_chat(payload: CreateChat):
     if payload.isu_1 == payload.isu_2:
         raise HTTPException(status_code=400, detail="chat cannot be created for the same user")
 
-    chat_id = str(uuid4())
-    await db_instance.create_chat(chat_id=chat_id, isu_1=payload.isu_1, isu_2=payload.isu_2)
+    chat_id = await db_instance.create_chat(chat_id=str(uuid4()), isu_1=payload.isu_1, isu_2=payload.isu_2)
     return {"chat_id": chat_id}
 
 
@@ -29,13 +28,7 @@ async def create_chat(payload: CreateChat):
 @rollbar_handler
 async def get_chats_for_user(isu: int):
     chats = await db_instance.get_chats_by_user(isu)
-    if not chats:
-        return {"chats": []}
-
-    # Serialize all ObjectId fields to strings
-    serialized_chats = [serialize(chat) for chat in chats]
-
-    return {"chats": serialized_chats}
+    return {"chats": chats or []}
 
 
 @router.post("/send_message")
@@ -81,11 +74,12 @@ async def get_messages(chat_id: str, limit: int = Query(150, gt=0), offset: int
 @rollbar_handler
 async def upload_media(isu: int = Form(...), chat_id: str = Form(...), media_type: str = Form(...), file: UploadFile = File(...)):
     file_extension = file.filename.split(".")[-1]
-    filename = f"media/{chat_id}/{isu}_{uuid4()}.{file_extension}"
+    base_name = f"media/{chat_id}/{isu}_{uuid4()}"
 
-    file_url = db_instance.upload_file_to_minio(
+    file_url = await db_instance.upload_media_file(
         file.file,
-        filename,
+        base_name,
+        file_extension,
         content_type=file.content_type or "application/octet-stream",
     )
 
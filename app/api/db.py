@@ -1,9 +1,13 @@
 from fastapi import APIRouter, HTTPException
 
 from app.setup_rollbar import rollbar_handler
+from app.utils import schedule_refresh, single_flight, storage_gc
 from app.utils.db import db_instance
+from app.utils.fast_json import FastJSONRoute
+from app.utils.http_clients import http_clients
+from app.utils.user_index import user_index
 
-router = APIRouter()
+router = APIRouter(route_class=FastJSONRoute)
 
 
 @router.post("/reset_db")
@@ -17,3 +21,18 @@ async def reset_db():
 
     await db_instance.setup_test_db()
     return {"detail": "Database has been reset"}
+
+
+@router.get("/metrics")
+@rollbar_handler
+async def get_metrics():
+    return {
+        "write_buffers": {"dislikes": db_instance.dislikes_buffer.stats()},
+        "user_index": user_index.stats(),
+        "presign_cache": db_instance.presign_cache.stats(),
+        "storage": db_instance.storage.stats(),
+        "storage_gc": await storage_gc.stats(),
+        "http_clients": http_clients.stats(),
+        "schedule_jobs": await schedule_refresh.stats(),
+        "single_flight": single_flight.stats(),
+    }
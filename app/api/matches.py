@@ -1,15 +1,146 @@
-from datetime import datetime, timezone
-
 from bson import ObjectId
 from fastapi import APIRouter, HTTPException, Query
 
-from typing import Optional, List
+from typing import Dict, Literal, Optional, List
 
-from app.models.match import UserAction
+from app.models.match import DiscoveryFilters, UserAction
 from app.setup_rollbar import rollbar_handler
+from app.utils import candidate_queue, images, seen_set, storage_gc
 from app.utils.db import db_instance
+from app.utils.discovery import SAMPLING_MEMORY, SAMPLING_SAMPLE, build_discovery_pipeline
+from app.utils.fast_json import FastJSONRoute
+from app.utils.projection import CARD_FIELDS, build_projection, parse_fields, wants
+from app.utils.ranking import CompatibilityRanker
+from app.utils.user_index import user_index
+
+router = APIRouter(route_class=FastJSONRoute)
+
+MAX_BATCH_COUNT = 50
+RANKING_POOL_SIZE = 200
+
+RANKERS = {"compatibility": CompatibilityRanker()}
+LIKED_ME_MAX_SCANS = 5
+
+CARD_PROJECTION = build_projection(list(CARD_FIELDS))
+
+
+def presign_media(people: List[dict], fields: Optional[List[str]] = None) -> None:
+    # Одинаковые ключи подписываются один раз на весь набор карточек;
+    # карточкам отдаются уменьшенные варианты изображений.
+    # Незапрошенные медиа не подписываются
+    if wants(fields, "logo"):
+        logo_urls = db_instance.presign_many(
+            [person["logo"] for person in people if person.get("logo")], variant=images.THUMB
+        )
+        for person in people:
+            person["logo"] = logo_urls[person["logo"]] if person.get("logo") else None
+
+    if wants(fields, "photos"):
+        photo_urls = db_instance.presign_many(
+            [photo for person in people for photo in person.get("photos") or []], variant=images.CARD
+        )
+        for person in people:
+            person["photos"] = [photo_urls[photo] for photo in person.get("photos") or []]
+
+
+def build_profile_card(person: dict, fields: Optional[List[str]] = None) -> dict:
+    card = {
+        "isu": person["isu"],
+        "username": person.get("username", ""),
+        "bio": person.get("bio", ""),
+        "logo": person.get("logo", ""),
+        "photos": person.get("photos", []),
+        "mainFeatures": person.get("mainFeatures", []),
+        "interests": person.get("interests", []),
+        "itmo": person.get("itmo", []),
+        "gender_preferences": person.get("gender_preferences", []),
+        "relationship_preferences": person.get("relationship_preferences", []),
+        "isStudent": person.get("isStudent", True),
+    }
+    if fields is None:
+        return card
+    return {field: card[field] for field in fields}
+
 
-router = APIRouter()
+def card_fields(fields: Optional[str]) -> Optional[List[str]]:
+    try:
+        return parse_fields(fields, CARD_FIELDS)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def load_quiz_scores(isus: List[int]) -> Dict[int, Dict[str, float]]:
+    results = (
+        await db_instance.db["results"]
+        .find({"user_id": {"$in": isus}, "completed": True}, {"user_id": 1, "test_id": 1, "score": 1})
+        .to_list(length=None)
+    )
+    scores = {}
+    for result in results:
+        if result.get("score") is not None:
+            scores.setdefault(result["user_id"], {})[str(result["test_id"])] = result["score"]
+    return scores
+
+
+async def sample_candidates(
+    user_id: int, filters: DiscoveryFilters, seen, size: int, sampling: str, projection: Optional[dict] = None
+) -> List[dict]:
+    if sampling == SAMPLING_MEMORY and user_index.ready:
+        # Фильтры и исключение просмотренных считаются в памяти, из Mongo читаются только выбранные
+        isus = user_index.sample(user_id, filters, seen, size)
+        if not isus:
+            return []
+        return await db_instance.db["users"].find({"isu": {"$in": isus}}, projection).to_list(length=len(isus))
+
+    if sampling == SAMPLING_MEMORY:
+        sampling = SAMPLING_SAMPLE
+
+    async def run_sample(excluded_ids: List[int], sample_size: int) -> List[dict]:
+        pipeline = build_discovery_pipeline(user_id, excluded_ids, filters, sample_size=sample_size, sampling=sampling)
+        if projection:
+            pipeline.append({"$project": projection})
+        return await db_instance.db["users"].aggregate(pipeline).to_list(length=sample_size)
+
+    sample_size = seen_set.sample_size_for(seen, size)
+    people = await run_sample([], sample_size)
+    if seen_set.sample_exhausted(seen, [person["isu"] for person in people], size, sample_size):
+        # Почти все попавшие в выборку уже просмотрены (запас ограничен OVERSAMPLE_LIMIT) -
+        # повторяем выборку, исключив просмотренных в самом запросе
+        people = await run_sample(list(seen), size)
+    return people
+
+
+async def collect_deck(
+    user_id: int,
+    filters: DiscoveryFilters,
+    seen,
+    count: int,
+    sampling: str,
+    ranking: Optional[str],
+) -> List[dict]:
+    # Для ранжирования берется пул кандидатов побольше, из которого выбираются лучшие count
+    pool_size = RANKING_POOL_SIZE if ranking else count
+    people = await sample_candidates(user_id, filters, seen, pool_size, sampling)
+
+    deck = []
+    deck_isus = set()
+    for person in people:
+        if person["isu"] in deck_isus or seen_set.contains(seen, person["isu"]):
+            continue
+        deck.append(person)
+        deck_isus.add(person["isu"])
+        if len(deck) == pool_size:
+            break
+
+    if not ranking or not deck:
+        return deck
+
+    user = await db_instance.db["users"].find_one({"isu": user_id})
+    if not user:
+        return deck[:count]
+
+    quiz_scores = await load_quiz_scores([user_id, *deck_isus])
+    return RANKERS[ranking].rank(user, deck, quiz_scores, count)
 
 
 @router.get("/random_person")
@@ -22,177 +153,93 @@ async def get_random_person(
     min_height: float = 75.0,
     max_height: float = 300.0,
     relationship_preferences: Optional[List[str]] = Query(None),
+    sampling: Optional[Literal["sample", "random_key", "memory"]] = None,
+    ranking: Optional[Literal["compatibility"]] = None,
+    fields: Optional[str] = None,
 ):
-
-    disliked_users = (
-        await db_instance.db["dislikes"].find({"user_id": user_id}).to_list(length=None)
+    fields = card_fields(fields)
+    # Для ранжирования нужен полный документ кандидата
+    projection = build_projection(fields) if fields and not ranking else None
+
+    filters = DiscoveryFilters(
+        gender=gender,
+        min_age=min_age,
+        max_age=max_age,
+        min_height=min_height,
+        max_height=max_height,
+        relationship_preferences=relationship_preferences,
     )
-    disliked_ids = [dislikes["target_id"] for dislikes in disliked_users]
 
-    liked_users = (
-        await db_instance.db["likes"].find({"user_id": user_id}).to_list(length=None)
-    )
-    liked_ids = [likes["target_id"] for likes in liked_users]
+    seen = await seen_set.get_seen(user_id)
 
-    excluded_ids = disliked_ids + liked_ids
+    if ranking:
+        deck = await collect_deck(user_id, filters, seen, 1, sampling or SAMPLING_SAMPLE, ranking)
+        if not deck:
+            raise HTTPException(status_code=404, detail="No more persons available")
+        presign_media(deck[:1], fields)
+        return {"profile": build_profile_card(deck[0], fields)}
 
-    match_conditions = {"isu": {"$ne": user_id, "$nin": excluded_ids}}
+    person = None
+    # Очередь пополняется через $sample, поэтому явно заданный способ выборки
+    # (например, для сравнения задержек) выполняется напрямую, в обход очереди
+    if sampling is None:
+        candidate_isu = await candidate_queue.pop_candidate(user_id, filters)
+        if candidate_isu is not None and not seen_set.contains(seen, candidate_isu):
+            person = await db_instance.db["users"].find_one({"isu": candidate_isu}, projection)
 
-    if gender.lower() != "everyone":
+    if not person:
+        # Очередь пуста - выбираем кандидата напрямую, пока она пополняется в фоне
+        person_list = await sample_candidates(user_id, filters, seen, 1, sampling or SAMPLING_SAMPLE, projection)
+        person_list = [person for person in person_list if not seen_set.contains(seen, person["isu"])]
+        if not person_list:
+            raise HTTPException(status_code=404, detail="No more persons available")
 
-        match_conditions["mainFeatures"] = {
-            "$elemMatch": {"icon": "gender", "text": gender.lower()}
-        }
+        person = person_list[0]
 
-    pipeline = []
+    presign_media([person], fields)
 
-    pipeline.append({"$match": match_conditions})
+    return {"profile": build_profile_card(person, fields)}
 
-    pipeline.append(
-        {
-            "$addFields": {
-                "birthdateObj": {
-                    "$dateFromString": {
-                        "dateString": {
-                            "$reduce": {
-                                "input": {
-                                    "$filter": {
-                                        "input": "$mainFeatures",
-                                        "as": "mf",
-                                        "cond": {"$eq": ["$$mf.icon", "birthdate"]},
-                                    }
-                                },
-                                "initialValue": "",
-                                "in": "$$this.text",
-                            }
-                        },
-                        "format": "%Y-%m-%d",
-                    }
-                }
-            }
-        }
-    )
 
-    pipeline.append(
-        {
-            "$addFields": {
-                "age": {
-                    "$dateDiff": {
-                        "startDate": "$birthdateObj",
-                        "endDate": datetime.now(timezone.utc),
-                        "unit": "year",
-                    }
-                }
-            }
-        }
+@router.get("/random_people")
+@rollbar_handler
+async def get_random_people(
+    user_id: int,
+    count: int = Query(10, ge=1, le=MAX_BATCH_COUNT),
+    gender: str = "Everyone",
+    min_age: int = 18,
+    max_age: int = 60,
+    min_height: float = 75.0,
+    max_height: float = 300.0,
+    relationship_preferences: Optional[List[str]] = Query(None),
+    sampling: Literal["sample", "random_key", "memory"] = SAMPLING_SAMPLE,
+    ranking: Optional[Literal["compatibility"]] = None,
+):
+    filters = DiscoveryFilters(
+        gender=gender,
+        min_age=min_age,
+        max_age=max_age,
+        min_height=min_height,
+        max_height=max_height,
+        relationship_preferences=relationship_preferences,
     )
 
-    pipeline.append({"$match": {"age": {"$gte": min_age, "$lte": max_age}}})
+    seen = await seen_set.get_seen(user_id)
+    deck = await collect_deck(user_id, filters, seen, count, sampling, ranking)
 
-    if min_height is not None and max_height is not None:
-        pipeline.append(
-            {
-                "$addFields": {
-                    "heightValue": {
-                        "$reduce": {
-                            "input": {
-                                "$filter": {
-                                    "input": "$mainFeatures",
-                                    "as": "mf",
-                                    "cond": {"$eq": ["$$mf.icon", "height"]},
-                                }
-                            },
-                            "initialValue": "",
-                            "in": "$$this.text",
-                        }
-                    }
-                }
-            }
-        )
-        pipeline.append(
-            {
-                "$addFields": {
-                    "heightNum": {
-                        "$convert": {
-                            "input": {
-                                "$arrayElemAt": [{"$split": ["$heightValue", " "]}, 0]
-                            },
-                            "to": "double",
-                            "onError": 0.0,
-                            "onNull": 0.0,
-                        }
-                    }
-                }
-            }
-        )
-
-        pipeline.append(
-            {"$match": {"heightNum": {"$gte": min_height, "$lte": max_height}}}
-        )
-
-    if relationship_preferences:
-        pipeline.append(
-            {
-                "$match": {
-                    "relationship_preferences.id": {"$in": relationship_preferences}
-                }
-            }
-        )
-
-    pipeline.append({"$sample": {"size": 1}})
-
-    person_cursor = db_instance.db["users"].aggregate(pipeline)
-    person_list = await person_cursor.to_list(length=1)
-    if not person_list:
+    if not deck:
         raise HTTPException(status_code=404, detail="No more persons available")
 
-    person = person_list[0]
-
-    person["_id"] = str(person["_id"])
-
-    def clean_object_key(object_key: str) -> str:
-        bucket_prefix = f"{db_instance.minio_bucket_name}/"
-        if object_key.startswith(bucket_prefix):
-            return object_key[len(bucket_prefix) :]
-        return object_key
+    presign_media(deck)
 
-    if person.get("logo"):
-        cleaned_logo_key = clean_object_key(person["logo"])
-        person["logo"] = db_instance.generate_presigned_url(cleaned_logo_key)
-    else:
-        person["logo"] = None
-
-    if person.get("photos"):
-        person["photos"] = [
-            db_instance.generate_presigned_url(clean_object_key(photo))
-            for photo in person["photos"]
-        ]
-    else:
-        person["photos"] = []
-
-    response_data = {
-        "profile": {
-            "isu": person["isu"],
-            "username": person.get("username", ""),
-            "bio": person.get("bio", ""),
-            "logo": person.get("logo", ""),
-            "photos": person.get("photos", []),
-            "mainFeatures": person.get("mainFeatures", []),
-            "interests": person.get("interests", []),
-            "itmo": person.get("itmo", []),
-            "gender_preferences": person.get("gender_preferences", []),
-            "relationship_preferences": person.get("relationship_preferences", []),
-            "isStudent": person.get("isStudent", True),
-        }
-    }
-
-    return response_data
+    return {"profiles": [build_profile_card(person) for person in deck]}
 
 
 @router.post("/like_person")
 @rollbar_handler
 async def like_person(payload: UserAction):
     result = await db_instance.like_user(payload.user_id, payload.target_id)
+    await seen_set.mark_seen(payload.user_id, payload.target_id)
 
     if result["matched"]:
         return {
@@ -206,51 +253,31 @@ async def like_person(payload: UserAction):
 @router.post("/superlike_person")
 @rollbar_handler
 async def superlike_person(payload: UserAction):
-    result = await db_instance.like_user(payload.user_id, payload.target_id)
+    result = await db_instance.superlike_user(payload.user_id, payload.target_id)
+    await seen_set.mark_seen(payload.user_id, payload.target_id)
 
-    reverse_like = await db_instance.db["likes"].find_one(
-        {"user_id": payload.target_id, "target_id": payload.user_id}
-    )
-
-    if not reverse_like:
-        await db_instance.db["likes"].insert_one(
-            {
-                "user_id": payload.target_id,
-                "target_id": payload.user_id,
-                "created_at": datetime.now(timezone.utc),
-            }
-        )
-
-    if result.get("matched"):
-        return {
-            "message": "You have a match!",
-            "matched": True,
-            "chat_id": result["chat_id"],
-        }
-    else:
-        chat_id = str(ObjectId())
-        await db_instance.create_chat(
-            chat_id=chat_id, isu_1=payload.user_id, isu_2=payload.target_id
-        )
-
-        return {
-            "message": "You have a match!",
-            "matched": True,
-            "chat_id": chat_id,
-        }
+    return {
+        "message": "You have a match!",
+        "matched": True,
+        "chat_id": result["chat_id"],
+    }
 
 
 @router.post("/dislike_person")
 @rollbar_handler
 async def dislike_person(payload: UserAction):
     await db_instance.dislike_user(payload.user_id, payload.target_id)
+    await seen_set.mark_seen(payload.user_id, payload.target_id)
     return {"message": "person disliked successfully"}
 
 
 @router.post("/block_person")
 @rollbar_handler
 async def block_person(payload: UserAction):
-    result = await db_instance.db["chats"].delete_one(
+    await seen_set.mark_seen(payload.user_id, payload.target_id)
+    await seen_set.mark_seen(payload.target_id, payload.user_id)
+
+    chat = await db_instance.db["chats"].find_one_and_delete(
         {
             "$or": [
                 {"isu_1": payload.user_id, "isu_2": payload.target_id},
@@ -259,45 +286,75 @@ async def block_person(payload: UserAction):
         }
     )
 
-    if result.deleted_count > 0:
-        return {"message": "user blocked, chat deleted"}
-    else:
-        raise HTTPException(
-            status_code=404, details="chat not found or user already blocked"
-        )
+    if not chat:
+        raise HTTPException(status_code=404, detail="chat not found or user already blocked")
+
+    # Медиафайлы удаленного чата удаляются из хранилища в фоне
+    media = await db_instance.db["media"].find({"chat_id": chat.get("chat_id")}, {"path": 1}).to_list(length=None)
+    if media:
+        await storage_gc.enqueue([item["path"] for item in media])
+        await db_instance.db["media"].delete_many({"_id": {"$in": [item["_id"] for item in media]}})
+
+    return {"message": "user blocked, chat deleted"}
 
 
 @router.get("/liked_me")
 @rollbar_handler
-async def get_matches(isu: int):
-    likes = await db_instance.db["likes"].find({"target_id": isu}).to_list(length=None)
+async def get_matches(
+    isu: int,
+    limit: int = Query(20, ge=1, le=MAX_BATCH_COUNT),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+):
+    fields = card_fields(fields)
+    projection = build_projection(fields) if fields else CARD_PROJECTION
 
-    if not likes:
-        return []
+    if cursor is not None and not ObjectId.is_valid(cursor):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
-    user_ids = [like["user_id"] for like in likes]
+    # Уже решенные (мэтч, дизлайк, блокировка) лайкнувшие отсеиваются по seen-set
+    seen = await seen_set.get_seen(isu)
 
-    users = (
-        await db_instance.db["users"]
-        .find({"isu": {"$in": user_ids}})
-        .to_list(length=None)
-    )
+    people = []
+    last_id = ObjectId(cursor) if cursor else None
+    has_more = True
 
-    result = []
-    for user in users:
-        user_data = {
-            "isu": user["isu"],
-            "username": user.get("username", ""),
-            "bio": user.get("bio", ""),
-            "logo": user.get("logo", ""),
-            "photos": user.get("photos", []),
-            "mainFeatures": user.get("mainFeatures", []),
-            "interests": user.get("interests", []),
-            "itmo": user.get("itmo", []),
-            "gender_preferences": user.get("gender_preferences", []),
-            "relationship_preferences": user.get("relationship_preferences", []),
-            "isStudent": user.get("isStudent", True),
-        }
-        result.append(user_data)
+    for _ in range(LIKED_ME_MAX_SCANS):
+        match = {"target_id": isu}
+        if last_id:
+            match["_id"] = {"$lt": last_id}
 
-    return result
+        pipeline = [
+            {"$match": match},
+            {"$sort": {"_id": -1}},
+            {"$limit": limit},
+            {
+                "$lookup": {
+                    "from": "users",
+                    "localField": "user_id",
+                    "foreignField": "isu",
+                    "pipeline": [{"$project": projection}],
+                    "as": "user",
+                }
+            },
+        ]
+        likes = await db_instance.db["likes"].aggregate(pipeline).to_list(length=limit)
+        has_more = len(likes) == limit
+
+        for index, like in enumerate(likes):
+            last_id = like["_id"]
+            if like["user"] and not seen_set.contains(seen, like["user_id"]):
+                people.append(like["user"][0])
+            if len(people) == limit:
+                has_more = has_more or index < len(likes) - 1
+                break
+
+        if len(people) == limit or not has_more:
+            break
+
+    presign_media(people, fields)
+
+    return {
+        "profiles": [build_profile_card(person, fields) for person in people],
+        "next_cursor": str(last_id) if has_more and last_id else None,
+    }
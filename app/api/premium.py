@@ -3,9 +3,10 @@ import datetime
 
 from app.setup_rollbar import rollbar_handler
 from app.utils.db import db_instance
+from app.utils.fast_json import FastJSONRoute
 
 
-router = APIRouter()
+router = APIRouter(route_class=FastJSONRoute)
 
 
 @router.post("/set_premium")
@@ -1,53 +1,166 @@
+from typing import Optional
 from uuid import uuid4
 
 from bson import ObjectId
-from fastapi import APIRouter, File, HTTPException, UploadFile
+from fastapi import APIRouter, File, Header, HTTPException, Response, UploadFile
+from pymongo import ReturnDocument
 
 from app.models.tag import TagSelectionModel
-from app.models.user import GenderPreferencesSelectionModel, LanguageSelectionModel
+from app.models.user import (
+    GenderPreferencesSelectionModel,
+    LanguageSelectionModel,
+    ProfileBatchModel,
+    ProfileUpdateModel,
+)
 from app.setup_rollbar import rollbar_handler
+from app.utils import images, storage_gc
 from app.utils.db import db_instance
-from app.utils.serializer import serialize
+from app.utils.fast_json import FastJSONResponse, FastJSONRoute
+from app.utils.presign_cache import presign_window
+from app.utils.profile_version import etag_matches, profile_etag, versioned
+from app.utils.projection import (
+    DEFAULT_PROFILE_PROJECTION,
+    PROFILE_FIELDS,
+    build_projection,
+    parse_fields,
+    wants,
+)
+from app.utils.user_index import user_index
 
-router = APIRouter()
+router = APIRouter(route_class=FastJSONRoute)
+
+
+def get_profile_etag(isu: int, version: Optional[int], fields: Optional[list]) -> str:
+    # Ответ с подписанными ссылками устаревает вместе с ними, даже если профиль не менялся;
+    # разные выборки полей - разные представления и разные ETag
+    has_media = wants(fields, "logo") or wants(fields, "photos")
+    return profile_etag(isu, version, presign_window() if has_media else None, fields)
 
 
 @router.get("/get_profile/{isu}")
 @rollbar_handler
-async def get_profile(isu: int):
+async def get_profile(isu: int, fields: Optional[str] = None, if_none_match: Optional[str] = Header(None)):
+    try:
+        fields = parse_fields(fields, PROFILE_FIELDS)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     user_collection = db_instance.get_collection("users")
-    user = await user_collection.find_one({"isu": isu})
+
+    if if_none_match:
+        # Дешевая проверка: читается только version, без медиа и presign
+        current = await user_collection.find_one({"isu": isu}, {"_id": 0, "version": 1})
+        if not current:
+            raise HTTPException(status_code=404, detail="User not found")
+        etag = get_profile_etag(isu, current.get("version"), fields)
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+
+    # version читается всегда - по нему строится ETag
+    projection = {**build_projection(fields), "version": 1} if fields else DEFAULT_PROFILE_PROJECTION
+    user = await user_collection.find_one({"isu": isu}, projection)
 
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    user["_id"] = str(user["_id"])
+    etag = get_profile_etag(isu, user.get("version"), fields)
+    if not wants(fields, "version"):
+        user.pop("version", None)
+
+    logo = user.get("logo") if wants(fields, "logo") else None
+    photos = (user.get("photos") or []) if wants(fields, "photos") else []
+    urls = db_instance.presign_many(([logo] if logo else []) + photos)
+    if wants(fields, "logo"):
+        user["logo"] = urls[logo] if logo else None
+    if wants(fields, "photos"):
+        user["photos"] = [urls[photo] for photo in photos]
 
-    def clean_object_key(object_key: str) -> str:
-        bucket_prefix = f"{db_instance.minio_bucket_name}/"
-        if object_key.startswith(bucket_prefix):
-            return object_key[len(bucket_prefix) :]
-        return object_key
+    return FastJSONResponse({"profile": user}, headers={"ETag": etag})
 
-    if user.get("logo"):
-        cleaned_logo_key = clean_object_key(user["logo"])
-        user["logo"] = db_instance.generate_presigned_url(cleaned_logo_key)
-    else:
-        user["logo"] = None
 
-    if user.get("photos"):
-        user["photos"] = [db_instance.generate_presigned_url(clean_object_key(photo)) for photo in user["photos"]]
-    else:
-        user["photos"] = []
+BATCH_CARD_PROJECTION = {"_id": 0, "isu": 1, "username": 1, "logo": 1, "photos": {"$slice": 1}}
 
-    return {"profile": serialize(user)}
+
+@router.post("/batch")
+@rollbar_handler
+async def get_profile_cards(payload: ProfileBatchModel):
+    # Карточки для списка чатов одним запросом $in вместо get_profile на каждый чат
+    isus = list(dict.fromkeys(payload.isus))
+    user_collection = db_instance.get_collection("users")
+    users = await user_collection.find({"isu": {"$in": isus}}, BATCH_CARD_PROJECTION).to_list(length=len(isus))
+
+    logo_urls = db_instance.presign_many([user["logo"] for user in users if user.get("logo")], variant=images.THUMB)
+    photo_urls = db_instance.presign_many(
+        [user["photos"][0] for user in users if user.get("photos")], variant=images.CARD
+    )
+
+    cards = {
+        user["isu"]: {
+            "isu": user["isu"],
+            "username": user.get("username", ""),
+            "logo": logo_urls[user["logo"]] if user.get("logo") else None,
+            "photo": photo_urls[user["photos"][0]] if user.get("photos") else None,
+        }
+        for user in users
+    }
+
+    return {
+        "profiles": [cards[isu] for isu in isus if isu in cards],
+        "missing": [isu for isu in isus if isu not in cards],
+    }
+
+
+def build_profile_update(changes: dict) -> dict:
+    # Поля ProfileUpdateModel -> пути в документе пользователя, как в отдельных /update_* ручках
+    paths = {
+        "username": lambda value: {"username": value},
+        "bio": lambda value: {"bio": value},
+        "height": lambda value: {"mainFeatures.0.text": f"{value} cm", "height_cm": value},
+        "zodiac": lambda value: {"mainFeatures.1.text": value},
+        "weight": lambda value: {"mainFeatures.2.text": f"{value} kg"},
+        "worldview": lambda value: {"mainFeatures.5.text": value},
+        "children": lambda value: {"mainFeatures.6.text": value},
+        "languages": lambda value: {"mainFeatures.7": [{"text": language, "icon": "languages"} for language in value]},
+        "alcohol": lambda value: {"mainFeatures.8.text": value},
+        "smoking": lambda value: {"mainFeatures.9.text": value},
+        "gender_preference": lambda value: {"gender_preferences": [{"text": value, "icon": "gender_preferences"}]},
+    }
+
+    update = {}
+    for field, value in changes.items():
+        update.update(paths[field](value))
+    return update
+
+
+@router.patch("/{isu}")
+@rollbar_handler
+async def patch_profile(isu: int, payload: ProfileUpdateModel):
+    changes = payload.model_dump(exclude_none=True)
+    if not changes:
+        raise HTTPException(status_code=400, detail="No fields to update")
+
+    user_collection = db_instance.get_collection("users")
+    user = await user_collection.find_one_and_update(
+        {"isu": isu},
+        versioned({"$set": build_profile_update(changes)}),
+        projection={"_id": 0, "version": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    if "height" in changes:
+        user_index.patch(isu, height_cm=changes["height"])
+
+    return {"message": "profile updated successfully", "version": user["version"]}
 
 
 @router.put("/update_bio/{isu}")
 @rollbar_handler
 async def update_bio(isu: int, bio: str):
     user_collection = db_instance.get_collection("users")
-    update_result = await user_collection.update_one({"isu": isu}, {"$set": {"bio": bio}})
+    update_result = await user_collection.update_one({"isu": isu}, versioned({"$set": {"bio": bio}}))
 
     if update_result.modified_count == 0:
         raise HTTPException(status_code=404, detail="User not found or bio not updated")
@@ -59,7 +172,7 @@ async def update_bio(isu: int, bio: str):
 @rollbar_handler
 async def update_username(isu: int, username: str):
     user_collection = db_instance.get_collection("users")
-    update_result = await user_collection.update_one({"isu": isu}, {"$set": {"username": username}})
+    update_result = await user_collection.update_one({"isu": isu}, versioned({"$set": {"username": username}}))
     if update_result.modified_count == 0:
         raise HTTPException(status_code=404, detail="User not found or username not updated")
 
@@ -70,7 +183,9 @@ async def update_username(isu: int, username: str):
 @rollbar_handler
 async def update_worldview(isu: int, worldview: str):
     user_collection = db_instance.get_collection("users")
-    update_result = await user_collection.update_one({"isu": isu}, {"$set": {"mainFeatures.5.text": f"{worldview}"}})
+    update_result = await user_collection.update_one(
+        {"isu": isu}, versioned({"$set": {"mainFeatures.5.text": f"{worldview}"}})
+    )
 
     if update_result.modified_count == 0:
         raise HTTPException(status_code=404, detail="User not found or worldview not updated")
@@ -82,7 +197,9 @@ async def update_worldview(isu: int, worldview: str):
 @rollbar_handler
 async def update_children(isu: int, children: str):
     user_collection = db_instance.get_collection("users")
-    update_result = await user_collection.update_one({"isu": isu}, {"$set": {"mainFeatures.6.text": f"{children}"}})
+    update_result = await user_collection.update_one(
+        {"isu": isu}, versioned({"$set": {"mainFeatures.6.text": f"{children}"}})
+    )
 
     if update_result.modified_count == 0:
         raise HTTPException(status_code=404, detail="User not found or children not updated")
@@ -98,7 +215,7 @@ async def update_languages(payload: LanguageSelectionModel):
     languages_feature = [{"text": language, "icon": "languages"} for language in payload.languages]
 
     update_result = await user_collection.update_one(
-        {"isu": payload.isu}, {"$set": {"mainFeatures.7": languages_feature}}
+        {"isu": payload.isu}, versioned({"$set": {"mainFeatures.7": languages_feature}})
     )
 
     if update_result.modified_count == 0:
@@ -111,11 +228,14 @@ async def update_languages(payload: LanguageSelectionModel):
 @rollbar_handler
 async def update_height(isu: int, height: float):
     user_collection = db_instance.get_collection("users")
-    update_result = await user_collection.update_one({"isu": isu}, {"$set": {"mainFeatures.0.text": f"{height} cm"}})
+    update_result = await user_collection.update_one(
+        {"isu": isu}, versioned({"$set": {"mainFeatures.0.text": f"{height} cm", "height_cm": height}})
+    )
 
     if update_result.modified_count == 0:
         raise HTTPException(status_code=404, detail="User not found or height not updated")
 
+    user_index.patch(isu, height_cm=height)
     return {"message": "height updated successfully"}
 
 
@@ -123,7 +243,9 @@ async def update_height(isu: int, height: float):
 @rollbar_handler
 async def update_alcohol(isu: int, alcohol: str):
     user_collection = db_instance.get_collection("users")
-    update_result = await user_collection.update_one({"isu": isu}, {"$set": {"mainFeatures.8.text": f"{alcohol}"}})
+    update_result = await user_collection.update_one(
+        {"isu": isu}, versioned({"$set": {"mainFeatures.8.text": f"{alcohol}"}})
+    )
 
     if update_result.modified_count == 0:
         raise HTTPException(status_code=404, detail="User not found or alcohol not updated")
@@ -135,7 +257,9 @@ async def update_alcohol(isu: int, alcohol: str):
 @rollbar_handler
 async def update_smoking(isu: int, smoking: str):
     user_collection = db_instance.get_collection("users")
-    update_result = await user_collection.update_one({"isu": isu}, {"$set": {"mainFeatures.9.text": f"{smoking}"}})
+    update_result = await user_collection.update_one(
+        {"isu": isu}, versioned({"$set": {"mainFeatures.9.text": f"{smoking}"}})
+    )
 
     if update_result.modified_count == 0:
         raise HTTPException(status_code=404, detail="User not found or smoking not updated")
@@ -147,7 +271,9 @@ async def update_smoking(isu: int, smoking: str):
 @rollbar_handler
 async def update_weight(isu: int, weight: float):
     user_collection = db_instance.get_collection("users")
-    update_result = await user_collection.update_one({"isu": isu}, {"$set": {"mainFeatures.2.text": f"{weight} kg"}})
+    update_result = await user_collection.update_one(
+        {"isu": isu}, versioned({"$set": {"mainFeatures.2.text": f"{weight} kg"}})
+    )
 
     if update_result.modified_count == 0:
         raise HTTPException(status_code=404, detail="User not found or weight not updated")
@@ -159,7 +285,7 @@ async def update_weight(isu: int, weight: float):
 @rollbar_handler
 async def update_zodiac_sign(isu: int, zodiac: str):
     user_collection = db_instance.get_collection("users")
-    update_result = await user_collection.update_one({"isu": isu}, {"$set": {"mainFeatures.1.text": zodiac}})
+    update_result = await user_collection.update_one({"isu": isu}, versioned({"$set": {"mainFeatures.1.text": zodiac}}))
 
     if update_result.modified_count == 0:
         raise HTTPException(status_code=404, detail="User not found or zodiac sign not updated")
@@ -181,7 +307,9 @@ async def update_tags(payload: TagSelectionModel):
 
     interests = [{"text": tag["name"], "icon": "tag"} for tag in existing_tags if tag["is_special"] == 0]
 
-    update_result = await user_collection.update_one({"isu": payload.isu}, {"$set": {"interests": interests}})
+    update_result = await user_collection.update_one(
+        {"isu": payload.isu}, versioned({"$set": {"interests": interests}})
+    )
 
     if update_result.modified_count == 0:
         raise HTTPException(status_code=404, detail="User not found or tags not updated")
@@ -212,12 +340,20 @@ async def update_relationship_preferences(payload: TagSelectionModel):
 
     update_result = await user_collection.update_one(
         {"isu": payload.isu},
-        {"$set": {"relationship_preferences": relationship_preferences}},
+        versioned(
+            {
+                "$set": {
+                    "relationship_preferences": relationship_preferences,
+                    "relationship_pref_ids": [pref["id"] for pref in relationship_preferences],
+                }
+            }
+        ),
     )
 
     if update_result.modified_count == 0:
         raise HTTPException(status_code=404, detail="User not found or preferences not updated")
 
+    user_index.patch(payload.isu, relationship_pref_ids=[pref["id"] for pref in relationship_preferences])
     return {"message": "relationship preferences updated successfully"}
 
 
@@ -227,18 +363,28 @@ async def update_logo(isu: int, file: UploadFile = File(...)):
     user_collection = db_instance.get_collection("users")
 
     file_extension = file.filename.split(".")[-1]
-    filename = f"logos/{isu}_{uuid4()}.{file_extension}"
-    file_url = db_instance.upload_file_to_minio(
+    base_name = f"logos/{isu}_{uuid4()}"
+    file_url = await db_instance.upload_media_file(
         file.file,
-        filename,
+        base_name,
+        file_extension,
         content_type=file.content_type or "application/octet-stream",
     )
 
-    update_result = await user_collection.update_one({"isu": isu}, {"$set": {"logo": file_url}})
+    user = await user_collection.find_one_and_update(
+        {"isu": isu},
+        versioned({"$set": {"logo": file_url}}),
+        projection={"logo": 1},
+        return_document=ReturnDocument.BEFORE,
+    )
 
-    if update_result.modified_count == 0:
+    if not user:
+        await storage_gc.enqueue([file_url])
         raise HTTPException(status_code=404, detail="User not found or logo not updated")
 
+    # Замененный логотип удаляется в фоне
+    await storage_gc.enqueue([user.get("logo")])
+
     return {"message": "logo updated successfully", "logo_url": file_url}
 
 
@@ -248,33 +394,34 @@ async def update_carousel_photo(isu: int, old_photo_url: str, new_file: UploadFi
     user_collection = db_instance.get_collection("users")
 
     file_extension = new_file.filename.split(".")[-1]
-    new_filename = f"carousel/{isu}_{uuid4()}.{file_extension}"
-    new_file_url = db_instance.upload_file_to_minio(
+    new_base_name = f"carousel/{isu}_{uuid4()}"
+    new_file_url = await db_instance.upload_media_file(
         new_file.file,
-        new_filename,
+        new_base_name,
+        file_extension,
         content_type=new_file.content_type or "application/octet-stream",
     )
 
     user = await user_collection.find_one({"isu": isu})
     if not user:
+        await storage_gc.enqueue([new_file_url])
         raise HTTPException(status_code=404, detail="User not found")
 
     photos = user.get("photos", [])
     if old_photo_url not in photos:
+        await storage_gc.enqueue([new_file_url])
         raise HTTPException(status_code=404, detail="Photo not found in carousel")
 
-    try:
-        db_instance.minio_instance.remove_object(db_instance.minio_bucket_name, old_photo_url)
-    except Exception:
-        raise HTTPException(status_code=500, detail="Failed to delete old photo from storage")
-
     updated_photos = [new_file_url if photo == old_photo_url else photo for photo in photos]
 
-    update_result = await user_collection.update_one({"isu": isu}, {"$set": {"photos": updated_photos}})
+    update_result = await user_collection.update_one({"isu": isu}, versioned({"$set": {"photos": updated_photos}}))
 
     if update_result.modified_count == 0:
+        await storage_gc.enqueue([new_file_url])
         raise HTTPException(status_code=404, detail="Photo not updated in carousel")
 
+    await storage_gc.enqueue([old_photo_url])
+
     return {
         "message": "carousel photo updated successfully",
         "new_photo_url": new_file_url,
@@ -286,11 +433,6 @@ async def update_carousel_photo(isu: int, old_photo_url: str, new_file: UploadFi
 async def delete_carousel_photo(isu: int, photo_url: str):
     user_collection = db_instance.get_collection("users")
 
-    try:
-        db_instance.minio_instance.remove_object(db_instance.minio_bucket_name, photo_url)
-    except Exception:
-        raise HTTPException(status_code=500, detail="Failed to delete photo from storage")
-
     user = await user_collection.find_one({"isu": isu})
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -301,11 +443,12 @@ async def delete_carousel_photo(isu: int, photo_url: str):
 
     updated_photos = [photo for photo in photos if photo != photo_url]
 
-    update_result = await user_collection.update_one({"isu": isu}, {"$set": {"photos": updated_photos}})
+    update_result = await user_collection.update_one({"isu": isu}, versioned({"$set": {"photos": updated_photos}}))
 
     if update_result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Photo not removed from carousel")
 
+    await storage_gc.enqueue([photo_url])
     return {"message": "carousel photo deleted successfully"}
 
 
@@ -316,7 +459,9 @@ async def update_gender_preference(payload: GenderPreferencesSelectionModel):
 
     update_result = await user_collection.update_one(
         {"isu": payload.isu},
-        {"$set": {"gender_preferences": [{"text": payload.gender_preference, "icon": "gender_preferences"}]}},
+        versioned(
+            {"$set": {"gender_preferences": [{"text": payload.gender_preference, "icon": "gender_preferences"}]}}
+        ),
     )
 
     if update_result.modified_count == 0:
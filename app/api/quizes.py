@@ -3,8 +3,9 @@ from fastapi import APIRouter, HTTPException
 from app.models.quiz import StartTestRequest
 from app.setup_rollbar import rollbar_handler
 from app.utils.db import db_instance
+from app.utils.fast_json import FastJSONRoute
 
-router = APIRouter()
+router = APIRouter(route_class=FastJSONRoute)
 
 
 @router.get("/{test_id}")
@@ -4,6 +4,7 @@ from uuid import uuid4
 
 from bson import ObjectId
 from fastapi import APIRouter, File, HTTPException, UploadFile
+from pymongo import ReturnDocument
 
 from app.models.profileDetails import ProfileDetailsModel
 from app.models.tag import TagSelectionModel
@@ -13,16 +14,22 @@ from app.models.user import (
     UsernameSelectionModel,
 )
 from app.setup_rollbar import rollbar_handler
+from app.utils import storage_gc
 from app.utils.db import db_instance
+from app.utils.fast_json import FastJSONRoute
+from app.utils.profile_version import versioned
+from app.utils.user_index import user_index
 
-router = APIRouter(prefix="/register")
+router = APIRouter(prefix="/register", route_class=FastJSONRoute)
 
 
 @router.post("/select_username")
 @rollbar_handler
 async def select_username(payload: UsernameSelectionModel):
     user_collection = db_instance.get_collection("users")
-    update_result = await user_collection.update_one({"isu": payload.isu}, {"$set": {"username": payload.username}})
+    update_result = await user_collection.update_one(
+        {"isu": payload.isu}, versioned({"$set": {"username": payload.username}})
+    )
     if update_result.modified_count == 0:
         raise HTTPException(status_code=404, detail="User not found or username not updated")
     return {"message": "Username updated successfully"}
@@ -34,7 +41,9 @@ async def select_preferences(payload: GenderPreferencesSelectionModel):
     user_collection = db_instance.get_collection("users")
     update_result = await user_collection.update_one(
         {"isu": payload.isu},
-        {"$set": {"gender_preferences": [{"text": payload.gender_preference, "icon": "gender_preferences"}]}},
+        versioned(
+            {"$set": {"gender_preferences": [{"text": payload.gender_preference, "icon": "gender_preferences"}]}}
+        ),
     )
     if update_result.modified_count == 0:
         raise HTTPException(status_code=404, detail="User not found or preference not updated")
@@ -57,7 +66,9 @@ async def select_tags(payload: TagSelectionModel):
         raise HTTPException(status_code=404, detail="Some tags do not exist")
 
     interests = [{"text": tag["name"], "icon": "tag"} for tag in existing_tags if tag["is_special"] == 0]
-    update_result = await user_collection.update_one({"isu": payload.isu}, {"$set": {"interests": interests}})
+    update_result = await user_collection.update_one(
+        {"isu": payload.isu}, versioned({"$set": {"interests": interests}})
+    )
 
     if update_result.modified_count == 0:
         raise HTTPException(status_code=404, detail="User not found or tags not updated")
@@ -69,17 +80,27 @@ async def select_tags(payload: TagSelectionModel):
 async def upload_logo(isu: int, file: UploadFile = File(...)):
     user_collection = db_instance.get_collection("users")
     file_extension = file.filename.split(".")[-1]
-    filename = f"logos/{isu}_{uuid4()}.{file_extension}"
+    base_name = f"logos/{isu}_{uuid4()}"
 
-    file_url = db_instance.upload_file_to_minio(
+    file_url = await db_instance.upload_media_file(
         file.file,
-        filename,
+        base_name,
+        file_extension,
         content_type=file.content_type or "application/octet-stream",
     )
 
-    update_result = await user_collection.update_one({"isu": isu}, {"$set": {"logo": file_url}})
-    if update_result.modified_count == 0:
+    user = await user_collection.find_one_and_update(
+        {"isu": isu},
+        versioned({"$set": {"logo": file_url}}),
+        projection={"logo": 1},
+        return_document=ReturnDocument.BEFORE,
+    )
+    if not user:
+        await storage_gc.enqueue([file_url])
         raise HTTPException(status_code=404, detail="User not found or logo not uploaded")
+
+    # Замененный логотип удаляется в фоне
+    await storage_gc.enqueue([user.get("logo")])
     return {"message": "Avatar uploaded successfully", "avatar_url": file_url}
 
 
@@ -87,23 +108,32 @@ async def upload_logo(isu: int, file: UploadFile = File(...)):
 @rollbar_handler
 async def upload_carousel(isu: int, files: List[UploadFile] = File(...)):
     user_collection = db_instance.get_collection("users")
-    carousel_urls = []
 
-    for file in files:
-        file_extension = file.filename.split(".")[-1]
-        filename = f"carousel/{isu}_{uuid4()}.{file_extension}"
-
-        file_url = db_instance.upload_file_to_minio(
-            file.file,
-            filename,
-            content_type=file.content_type or "application/octet-stream",
-        )
-        carousel_urls.append(file_url)
+    carousel_urls = await db_instance.upload_media_files(
+        [
+            (
+                file.file,
+                f"carousel/{isu}_{uuid4()}",
+                file.filename.split(".")[-1],
+                file.content_type or "application/octet-stream",
+            )
+            for file in files
+        ]
+    )
 
-    update_result = await user_collection.update_one({"isu": isu}, {"$set": {"photos": carousel_urls}})
-    if update_result.modified_count == 0:
+    user = await user_collection.find_one_and_update(
+        {"isu": isu},
+        versioned({"$set": {"photos": carousel_urls}}),
+        projection={"photos": 1},
+        return_document=ReturnDocument.BEFORE,
+    )
+    if not user:
+        await db_instance.discard_objects(carousel_urls)
         raise HTTPException(status_code=404, detail="User not found or carousel photos not updated")
 
+    # Карусель заменяется целиком, прежние фото удаляются в фоне
+    await storage_gc.enqueue(user.get("photos") or [])
+
     return {
         "message": "Carousel photos uploaded successfully",
         "carousel_urls": carousel_urls,
@@ -117,14 +147,18 @@ async def add_profile_details(payload: ProfileDetailsModel):
     data = {
         "bio": payload.bio,
         "mainFeatures.0.text": f"{payload.height} cm" if payload.height else "",
+        "height_cm": payload.height,
         "mainFeatures.2.text": f"{payload.weight} kg" if payload.weight else "",
         "mainFeatures.1.text": payload.zodiac_sign if payload.zodiac_sign else "",
     }
     data = {k: v for k, v in data.items() if v}
-    update_result = await user_collection.update_one({"isu": payload.isu}, {"$set": data})
+    update_result = await user_collection.update_one({"isu": payload.isu}, versioned({"$set": data}))
 
     if update_result.modified_count == 0:
         raise HTTPException(status_code=404, detail="User not found or profile details not updated")
+
+    if payload.height:
+        user_index.patch(payload.isu, height_cm=payload.height)
     return {"message": "Profile details updated successfully"}
 
 
@@ -158,10 +192,18 @@ async def select_relationship(payload: RelationshipsPreferencesSelectionModel):
 
     update_result = await user_collection.update_one(
         {"isu": payload.isu},
-        {"$set": {"relationship_preferences": relationship_preferences}},
+        versioned(
+            {
+                "$set": {
+                    "relationship_preferences": relationship_preferences,
+                    "relationship_pref_ids": [pref["id"] for pref in relationship_preferences],
+                }
+            }
+        ),
     )
 
     if update_result.modified_count == 0:
         raise HTTPException(status_code=404, detail="User not found or preferences not updated")
 
+    user_index.patch(payload.isu, relationship_pref_ids=[pref["id"] for pref in relationship_preferences])
     return {"message": "Relationship preferences selected successfully, proceed to the next step"}
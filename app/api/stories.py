@@ -6,8 +6,9 @@ from fastapi import APIRouter, File, Form, HTTPException, UploadFile
 
 from app.setup_rollbar import rollbar_handler
 from app.utils.db import db_instance
+from app.utils.fast_json import FastJSONRoute
 
-router = APIRouter()
+router = APIRouter(route_class=FastJSONRoute)
 
 
 @router.post("/create_story")
@@ -16,15 +17,16 @@ async def create_story(isu: int = Form(...), file: UploadFile = File(...)):
     stories_collection = db_instance.get_collection("stories")
 
     file_extension = file.filename.split(".")[-1]
-    filename = f"stories/{isu}_{uuid4()}.{file_extension}"
+    base_name = f"stories/{isu}_{uuid4()}"
 
     curr_time = datetime.now()
     expiration = curr_time + timedelta(hours=24)
     expiration_date = int(expiration.timestamp())
 
-    file_url = db_instance.upload_file_to_minio(
+    file_url = await db_instance.upload_media_file(
         file.file,
-        filename,
+        base_name,
+        file_extension,
         content_type=file.content_type or "application/octet-stream",
     )
 
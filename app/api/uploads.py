@@ -0,0 +1,185 @@
+import math
+from datetime import datetime, timedelta
+from typing import Optional
+from uuid import uuid4
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import APIRouter, HTTPException
+from pymongo import ReturnDocument
+
+from app.models.upload import UploadCompleteModel, UploadInitiateModel
+from app.setup_rollbar import rollbar_handler
+from app.utils import storage_gc
+from app.utils.db import db_instance
+from app.utils.fast_json import FastJSONRoute
+from app.utils.profile_version import versioned
+
+# Двухфазная загрузка напрямую в хранилище: клиент получает presigned PUT URL
+# (или URL частей для больших файлов), загружает файл в MinIO сам, а затем
+# подтверждает загрузку - сервер проверяет объект и привязывает его к профилю,
+# истории или чату. Через воркеры API проходят только метаданные.
+
+router = APIRouter(route_class=FastJSONRoute)
+
+UPLOAD_URL_EXPIRATION = timedelta(minutes=30)
+MULTIPART_THRESHOLD = 16 * 1024 * 1024
+PART_SIZE = 16 * 1024 * 1024
+
+TARGET_PREFIXES = {
+    "logo": "logos",
+    "carousel": "carousel",
+    "story": "stories",
+    "chat_media": "media",
+}
+TARGET_CONTENT_TYPES = {
+    "logo": ("image/",),
+    "carousel": ("image/",),
+    "story": ("image/", "video/"),
+    "chat_media": ("",),
+}
+
+
+def content_type_allowed(target: str, content_type: Optional[str]) -> bool:
+    return (content_type or "").startswith(TARGET_CONTENT_TYPES[target])
+
+
+def build_object_key(payload: UploadInitiateModel) -> str:
+    extension = payload.filename.split(".")[-1]
+    prefix = TARGET_PREFIXES[payload.target]
+    if payload.target == "chat_media":
+        prefix = f"{prefix}/{payload.chat_id}"
+    return f"{prefix}/{payload.isu}_{uuid4()}.{extension}"
+
+
+@router.post("/initiate")
+@rollbar_handler
+async def initiate_upload(payload: UploadInitiateModel):
+    if not content_type_allowed(payload.target, payload.content_type):
+        raise HTTPException(status_code=400, detail=f"Content type {payload.content_type} is not allowed")
+    if payload.target == "chat_media" and not payload.chat_id:
+        raise HTTPException(status_code=400, detail="chat_id is required for chat media")
+
+    key = build_object_key(payload)
+    upload = {
+        "isu": payload.isu,
+        "target": payload.target,
+        "chat_id": payload.chat_id,
+        "media_type": payload.media_type,
+        "key": key,
+        "content_type": payload.content_type,
+        "size": payload.size,
+        "status": "pending",
+        "created_at": datetime.now(),
+    }
+
+    response = {"key": key}
+    if payload.size > MULTIPART_THRESHOLD:
+        upload["multipart_id"] = await db_instance.create_multipart_upload(key, payload.content_type)
+        part_count = math.ceil(payload.size / PART_SIZE)
+        response["part_size"] = PART_SIZE
+        response["part_urls"] = [
+            await db_instance.presign_upload_part(key, upload["multipart_id"], part_number, UPLOAD_URL_EXPIRATION)
+            for part_number in range(1, part_count + 1)
+        ]
+    else:
+        response["url"] = await db_instance.presign_upload(key, UPLOAD_URL_EXPIRATION)
+
+    result = await db_instance.db["uploads"].insert_one(upload)
+    return {"upload_id": str(result.inserted_id), **response}
+
+
+async def attach_upload(upload: dict, file_url: str) -> dict:
+    isu = upload["isu"]
+    target = upload["target"]
+
+    if target == "logo":
+        user = await db_instance.db["users"].find_one_and_update(
+            {"isu": isu},
+            versioned({"$set": {"logo": file_url}}),
+            projection={"logo": 1},
+            return_document=ReturnDocument.BEFORE,
+        )
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        # Замененный логотип удаляется в фоне
+        await storage_gc.enqueue([user.get("logo")])
+        return {"url": file_url}
+
+    if target == "carousel":
+        update_result = await db_instance.db["users"].update_one(
+            {"isu": isu}, versioned({"$push": {"photos": file_url}})
+        )
+        if update_result.matched_count == 0:
+            raise HTTPException(status_code=404, detail="User not found")
+        return {"url": file_url}
+
+    if target == "story":
+        expiration_date = int((datetime.now() + timedelta(hours=24)).timestamp())
+        insert_result = await db_instance.db["stories"].insert_one(
+            {"isu": isu, "url": file_url, "expiration_date": expiration_date}
+        )
+        return {"story_id": str(insert_result.inserted_id), "expDate": expiration_date}
+
+    media_id = await db_instance.save_media(isu, upload["chat_id"], file_url, upload.get("media_type") or "file")
+    return {"media_id": media_id}
+
+
+@router.post("/complete")
+@rollbar_handler
+async def complete_upload(payload: UploadCompleteModel):
+    try:
+        upload_id = ObjectId(payload.upload_id)
+    except InvalidId:
+        raise HTTPException(status_code=400, detail="Invalid upload id")
+
+    uploads_collection = db_instance.db["uploads"]
+    # Загрузка захватывается атомарно, чтобы повторный запрос не привязал объект дважды
+    upload = await uploads_collection.find_one_and_update(
+        {"_id": upload_id, "status": "pending"}, {"$set": {"status": "completing"}}
+    )
+    if not upload:
+        if await uploads_collection.count_documents({"_id": upload_id}, limit=1):
+            raise HTTPException(status_code=409, detail="Upload already completed")
+        raise HTTPException(status_code=404, detail="Upload not found")
+
+    key = upload["key"]
+    try:
+        if upload.get("multipart_id"):
+            if not payload.parts:
+                raise ValueError("Parts are required for multipart upload")
+            await db_instance.complete_multipart_upload(
+                key, upload["multipart_id"], [(part.part_number, part.etag) for part in payload.parts]
+            )
+        stat = await db_instance.stat_object(key)
+    except Exception as e:
+        await uploads_collection.update_one({"_id": upload_id}, {"$set": {"status": "pending"}})
+        raise HTTPException(status_code=400, detail=f"Object was not uploaded: {e}")
+
+    async def reject(detail: str):
+        await db_instance.remove_object(key)
+        await uploads_collection.update_one({"_id": upload_id}, {"$set": {"status": "rejected"}})
+        raise HTTPException(status_code=400, detail=detail)
+
+    if stat.size != upload["size"]:
+        await reject("Uploaded object size does not match")
+    # Presigned PUT не фиксирует Content-Type, поэтому тип проверяется у загруженного объекта
+    if not content_type_allowed(upload["target"], stat.content_type):
+        await reject(f"Content type {stat.content_type} is not allowed")
+
+    try:
+        result = await attach_upload(upload, f"{db_instance.minio_bucket_name}/{key}")
+    except HTTPException:
+        # Привязать объект некуда (например, пользователь удален) - загрузка отклоняется
+        await db_instance.remove_object(key)
+        await uploads_collection.update_one({"_id": upload_id}, {"$set": {"status": "rejected"}})
+        raise
+    except Exception:
+        # После временной ошибки загрузку можно подтвердить повторно
+        await uploads_collection.update_one({"_id": upload_id}, {"$set": {"status": "pending"}})
+        raise
+    await uploads_collection.update_one(
+        {"_id": upload_id}, {"$set": {"status": "completed", "completed_at": datetime.now()}}
+    )
+
+    return {"message": "Upload completed successfully", **result}
@@ -1,3 +1,5 @@
+import asyncio
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -15,10 +17,15 @@ from app.api import (
     register,
     stories,
     tags,
+    uploads,
 )
-from app.utils import scheduler
+from app.migrations import chat_pair, user_random_key, user_schema_v2
+from app.utils import images, indexes, scheduler
+from app.utils.fast_json import FastJSONResponse
+from app.utils.http_clients import http_clients
+from app.utils.db import db_instance
 
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
 setup_rollbar.init_rollbar()
 app.include_router(tags.router)
 
@@ -40,12 +47,31 @@ app.include_router(matches.router, prefix="/matches")
 app.include_router(calendar.router, prefix="/calendar")
 app.include_router(premium.router, prefix="/premium")
 app.include_router(db.router, prefix="/db")
+app.include_router(uploads.router, prefix="/uploads")
 
 
 @app.on_event("startup")
 async def startup_event():
     print("Scheduler started")
     scheduler.start_scheduler()
+    http_clients.start()
+    try:
+        await indexes.ensure_indexes()
+    except indexes.IndexCreationError as e:
+        # Уже отправлено в Rollbar; остальные индексы созданы, приложение стартует
+        print(e)
+    asyncio.create_task(user_schema_v2.run_backfill())
+    asyncio.create_task(user_random_key.run_backfill())
+    asyncio.create_task(chat_pair.run_backfill())
+    asyncio.create_task(scheduler.rebuild_user_index())
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await db_instance.dislikes_buffer.close()
+    db_instance.storage.shutdown()
+    images.shutdown()
+    await http_clients.close()
 
 
 def main():
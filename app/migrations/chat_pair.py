@@ -0,0 +1,54 @@
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from app.setup_rollbar import rollbar_handler
+from app.utils.db import db_instance
+
+# Ключ пары pair для чатов, созданных до условной записи по нему
+# (Database.create_chat). Без ключа повторный мэтч старой пары не находит
+# существующий чат и создает второй. Если у пары уже несколько чатов,
+# ключ получает самый ранний, остальные остаются без ключа.
+
+BATCH_SIZE = 500
+DUPLICATE_KEY = 11000
+
+
+@rollbar_handler
+async def run_backfill(batch_size: int = BATCH_SIZE) -> int:
+    chats = db_instance.db["chats"]
+    last_id = None
+    migrated = 0
+
+    while True:
+        query = {"pair": {"$exists": False}}
+        if last_id:
+            query["_id"] = {"$gt": last_id}
+        batch = (
+            await chats.find(query, {"isu_1": 1, "isu_2": 1})
+            .sort("_id", ASCENDING)
+            .limit(batch_size)
+            .to_list(length=batch_size)
+        )
+        if not batch:
+            break
+
+        operations = [
+            UpdateOne(
+                {"_id": chat["_id"], "pair": {"$exists": False}},
+                {"$set": {"pair": db_instance.chat_pair(chat["isu_1"], chat["isu_2"])}},
+            )
+            for chat in batch
+        ]
+        try:
+            result = await chats.bulk_write(operations, ordered=False)
+            migrated += result.modified_count
+        except BulkWriteError as e:
+            # Дубликаты пары упираются в уникальный индекс chats.pair - это ожидаемо
+            if any(error["code"] != DUPLICATE_KEY for error in e.details["writeErrors"]):
+                raise
+            migrated += e.details["nModified"]
+
+        last_id = batch[-1]["_id"]
+
+    print(f"chat_pair: migrated {migrated} chat(s)")
+    return migrated
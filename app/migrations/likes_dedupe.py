@@ -0,0 +1,35 @@
+from app.setup_rollbar import rollbar_handler
+from app.utils.db import db_instance
+
+# Удаление дубликатов лайков, которые успели создать двойные тапы до перехода
+# на upsert (Database.like_user). Без этого не строится уникальный индекс
+# likes.user_target_unique. Из каждой группы остается самый ранний лайк.
+
+BATCH_SIZE = 1000
+
+
+@rollbar_handler
+async def run_dedupe(batch_size: int = BATCH_SIZE) -> int:
+    likes = db_instance.db["likes"]
+    groups = await likes.aggregate(
+        [
+            {
+                "$group": {
+                    "_id": {"user_id": "$user_id", "target_id": "$target_id"},
+                    "ids": {"$push": "$_id"},
+                    "count": {"$sum": 1},
+                }
+            },
+            {"$match": {"count": {"$gt": 1}}},
+        ],
+        allowDiskUse=True,
+    ).to_list(length=None)
+
+    extra_ids = [like_id for group in groups for like_id in sorted(group["ids"])[1:]]
+    deleted = 0
+    for start in range(0, len(extra_ids), batch_size):
+        result = await likes.delete_many({"_id": {"$in": extra_ids[start : start + batch_size]}})
+        deleted += result.deleted_count
+
+    print(f"likes_dedupe: deleted {deleted} duplicate like(s)")
+    return deleted
@@ -0,0 +1,16 @@
+from app.setup_rollbar import rollbar_handler
+from app.utils.db import db_instance
+
+# Случайный ключ rand в [0, 1) для выборки кандидатов поиском по индексу
+# вместо $sample (см. discovery.random_key_stages).
+
+
+@rollbar_handler
+async def run_backfill() -> int:
+    # Повторный запуск безопасен: обновляются только документы без ключа
+    result = await db_instance.db["users"].update_many(
+        {"rand": {"$exists": False}},
+        [{"$set": {"rand": {"$rand": {}}}}],
+    )
+    print(f"user_random_key: migrated {result.modified_count} user(s)")
+    return result.modified_count
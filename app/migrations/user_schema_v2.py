@@ -0,0 +1,86 @@
+import datetime
+
+from pymongo import ASCENDING, UpdateOne
+
+from app.setup_rollbar import rollbar_handler
+from app.utils.db import db_instance
+from app.utils.discovery import set_typed_fields_ready, typed_discovery_fields
+
+# Бэкфилл типизированных полей поиска (birthdate, height_cm, gender,
+# relationship_pref_ids) из mainFeatures. Прогресс хранится в коллекции
+# migrations, поэтому после рестарта миграция продолжается с последнего _id.
+
+MIGRATION_ID = "user_schema_v2"
+BATCH_SIZE = 500
+
+
+async def _migrate_batch(users, batch: list) -> int:
+    # Документ обновляется только если исходные поля не поменялись с момента чтения;
+    # пропущенные документы подбирает финальный проход по schema_version
+    operations = [
+        UpdateOne(
+            {
+                "_id": user["_id"],
+                "mainFeatures": user.get("mainFeatures"),
+                "relationship_preferences": user.get("relationship_preferences"),
+            },
+            {"$set": typed_discovery_fields(user)},
+        )
+        for user in batch
+    ]
+    result = await users.bulk_write(operations, ordered=False)
+    return result.matched_count
+
+
+@rollbar_handler
+async def run_backfill(batch_size: int = BATCH_SIZE) -> int:
+    migrations = db_instance.db["migrations"]
+    users = db_instance.db["users"]
+
+    state = await migrations.find_one({"_id": MIGRATION_ID}) or {}
+    if state.get("completed"):
+        set_typed_fields_ready()
+        return 0
+
+    last_id = state.get("last_id")
+    migrated = 0
+
+    while True:
+        query = {"_id": {"$gt": last_id}} if last_id else {}
+        batch = (
+            await users.find(query, {"mainFeatures": 1, "relationship_preferences": 1})
+            .sort("_id", ASCENDING)
+            .limit(batch_size)
+            .to_list(length=batch_size)
+        )
+        if not batch:
+            break
+
+        migrated += await _migrate_batch(users, batch)
+        last_id = batch[-1]["_id"]
+        await migrations.update_one(
+            {"_id": MIGRATION_ID},
+            {"$set": {"last_id": last_id, "updated_at": datetime.datetime.now(datetime.timezone.utc)}},
+            upsert=True,
+        )
+
+    # Документы, измененные между чтением и записью, пропущены условной записью, а
+    # обработчики профиля typed-поля не пишут - дочищаем их, пока такие остаются
+    while True:
+        batch = (
+            await users.find({"schema_version": {"$exists": False}}, {"mainFeatures": 1, "relationship_preferences": 1})
+            .limit(batch_size)
+            .to_list(length=batch_size)
+        )
+        if not batch:
+            break
+        migrated += await _migrate_batch(users, batch)
+
+    await migrations.update_one(
+        {"_id": MIGRATION_ID},
+        {"$set": {"completed": True, "updated_at": datetime.datetime.now(datetime.timezone.utc)}},
+        upsert=True,
+    )
+    set_typed_fields_ready()
+    print(f"{MIGRATION_ID}: migrated {migrated} user(s)")
+    return migrated
@@ -1,6 +1,24 @@
+from typing import List, Optional
+
 from pydantic import BaseModel
 
 
 class UserAction(BaseModel):
     user_id: int
     target_id: int
+
+
+class DiscoveryFilters(BaseModel):
+    gender: str = "Everyone"
+    min_age: int = 18
+    max_age: int = 60
+    min_height: Optional[float] = 75.0
+    max_height: Optional[float] = 300.0
+    relationship_preferences: Optional[List[str]] = None
+
+    def cache_key(self) -> str:
+        preferences = ",".join(sorted(self.relationship_preferences or []))
+        return (
+            f"{self.gender.lower()}|{self.min_age}-{self.max_age}|"
+            f"{self.min_height}-{self.max_height}|{preferences}"
+        )
@@ -0,0 +1,26 @@
+from typing import List, Literal, Optional
+
+from pydantic import BaseModel, Field
+
+# Максимальный размер файла, загружаемого напрямую в хранилище
+MAX_UPLOAD_SIZE = 200 * 1024 * 1024
+
+
+class UploadInitiateModel(BaseModel):
+    isu: int
+    target: Literal["logo", "carousel", "story", "chat_media"]
+    filename: str
+    content_type: str
+    size: int = Field(..., gt=0, le=MAX_UPLOAD_SIZE)
+    chat_id: Optional[str] = None
+    media_type: Optional[str] = None
+
+
+class UploadPartModel(BaseModel):
+    part_number: int = Field(..., ge=1)
+    etag: str
+
+
+class UploadCompleteModel(BaseModel):
+    upload_id: str
+    parts: List[UploadPartModel] = []
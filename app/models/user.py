@@ -1,6 +1,6 @@
 from typing import Dict, List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class UserModel(BaseModel):
@@ -39,3 +39,28 @@ class RelationshipsPreferencesSelectionModel(BaseModel):
 class LanguageSelectionModel(BaseModel):
     isu: int
     languages: List[str]
+
+
+class ProfileUpdateModel(BaseModel):
+    username: Optional[str] = None
+    bio: Optional[str] = None
+    height: Optional[float] = Field(None, gt=0)
+    weight: Optional[float] = Field(None, gt=0)
+    zodiac: Optional[str] = None
+    worldview: Optional[str] = None
+    children: Optional[str] = None
+    languages: Optional[List[str]] = None
+    alcohol: Optional[str] = None
+    smoking: Optional[str] = None
+    gender_preference: Optional[str] = None
+
+    class Config:
+        extra = "forbid"
+
+
+# Сколько профилей можно запросить одним POST /profile/batch
+MAX_BATCH_PROFILES = 300
+
+
+class ProfileBatchModel(BaseModel):
+    isus: List[int] = Field(..., min_length=1, max_length=MAX_BATCH_PROFILES)
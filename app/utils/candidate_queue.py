@@ -0,0 +1,95 @@
+import asyncio
+import datetime
+from typing import Dict, List, Optional
+
+from pymongo import ReturnDocument
+
+from app.models.match import DiscoveryFilters
+from app.setup_rollbar import rollbar_handler
+from app.utils import seen_set
+from app.utils.db import db_instance
+from app.utils.discovery import build_discovery_pipeline
+
+# Очередь заранее отфильтрованных кандидатов для /matches/random_person.
+# Для каждой пары (пользователь, набор фильтров) хранится список ISU,
+# который пополняется пачками в фоне. Очередь удаляется TTL-индексом по
+# updated_at (app/utils/indexes.py), поэтому очереди старых положений фильтров
+# не накапливаются, а кандидаты, отобранные до изменения их профиля, не живут долго.
+
+QUEUE_COLLECTION = "candidate_queues"
+REFILL_BATCH_SIZE = 50
+REFILL_THRESHOLD = 10
+
+_refill_tasks: Dict[str, asyncio.Task] = {}
+
+
+def _queue_filter(user_id: int, filters: DiscoveryFilters) -> dict:
+    return {"user_id": user_id, "filters_key": filters.cache_key()}
+
+
+@rollbar_handler
+async def pop_candidate(user_id: int, filters: DiscoveryFilters) -> Optional[int]:
+    queue = await db_instance.db[QUEUE_COLLECTION].find_one_and_update(
+        {**_queue_filter(user_id, filters), "candidates.0": {"$exists": True}},
+        {"$pop": {"candidates": -1}},
+        projection={"candidates": 1},
+        return_document=ReturnDocument.BEFORE,
+    )
+
+    if not queue:
+        schedule_refill(user_id, filters)
+        return None
+
+    candidates = queue["candidates"]
+    if len(candidates) - 1 < REFILL_THRESHOLD:
+        schedule_refill(user_id, filters)
+
+    return candidates[0]
+
+
+@rollbar_handler
+async def refill_queue(user_id: int, filters: DiscoveryFilters, batch_size: int = REFILL_BATCH_SIZE) -> int:
+    queues = db_instance.db[QUEUE_COLLECTION]
+    queue = await queues.find_one(_queue_filter(user_id, filters), {"candidates": 1})
+    queued_ids = queue.get("candidates", []) if queue else []
+
+    async def run_sample(excluded_ids: List[int], sample_size: int) -> List[int]:
+        pipeline = build_discovery_pipeline(user_id, excluded_ids, filters, sample_size=sample_size)
+        pipeline.append({"$project": {"_id": 0, "isu": 1}})
+        people = await db_instance.db["users"].aggregate(pipeline).to_list(length=sample_size)
+        return [person["isu"] for person in people]
+
+    seen = await seen_set.get_seen(user_id)
+    sample_size = seen_set.sample_size_for(seen, batch_size)
+    sampled_ids = await run_sample(queued_ids, sample_size)
+    if seen_set.sample_exhausted(seen, sampled_ids, batch_size, sample_size):
+        # Выборка почти целиком из просмотренных - повторяем с исключением их в запросе
+        sampled_ids = await run_sample([*queued_ids, *seen], batch_size)
+    new_ids = seen_set.filter_unseen(seen, sampled_ids)[:batch_size]
+
+    await queues.update_one(
+        _queue_filter(user_id, filters),
+        {
+            "$push": {"candidates": {"$each": new_ids}},
+            "$set": {"updated_at": datetime.datetime.now(datetime.timezone.utc)},
+        },
+        upsert=True,
+    )
+    return len(new_ids)
+
+
+def schedule_refill(user_id: int, filters: DiscoveryFilters) -> None:
+    key = f"{user_id}|{filters.cache_key()}"
+    task = _refill_tasks.get(key)
+    if task and not task.done():
+        return
+
+    def _on_done(finished: asyncio.Task):
+        _refill_tasks.pop(key, None)
+        if not finished.cancelled() and finished.exception():
+            print(f"candidate queue refill failed for {key}: {finished.exception()}")
+
+    task = asyncio.create_task(refill_queue(user_id, filters))
+    _refill_tasks[key] = task
+    task.add_done_callback(_on_done)
+
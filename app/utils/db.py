@@ -1,3 +1,4 @@
+import asyncio
 import datetime
 import io
 import json
@@ -10,9 +11,13 @@ from dateutil.relativedelta import relativedelta
 from bson import ObjectId
 from dotenv import load_dotenv
 from minio import Minio
+from minio.datatypes import Part
+from minio.deleteobjects import DeleteObject
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
 
 from app.setup_rollbar import rollbar_handler
+from app.utils import images
 
 from .fill_many import (
     create_chats,
@@ -25,6 +30,9 @@ from .fill_many import (
     create_tests,
     create_users,
 )
+from .presign_cache import PRESIGN_EXPIRATION, PresignCache
+from .storage import UPLOAD_CONCURRENCY, StorageExecutor, make_http_client
+from .write_buffer import WriteBehindBuffer
 
 load_dotenv()
 
@@ -38,6 +46,8 @@ class Database:
             raise ValueError("MONGO_URI not found in env")
 
         self.client = AsyncIOMotorClient(mongo_uri)
+        self.dislikes_buffer = WriteBehindBuffer("dislikes", lambda: self.db["dislikes"])
+        self.presign_cache = PresignCache()
 
         self.environment = os.getenv("ENVIRONMENT", "prod")
 
@@ -60,7 +70,13 @@ class Database:
         if not all([minio_endpoint, minio_access_key, minio_secret_key, self.minio_bucket_name]):
             raise ValueError("MINIO not found in env")
 
-        self.minio_instance = Minio(minio_endpoint, minio_access_key, minio_secret_key, secure=minio_use_ssl)
+        self.storage = StorageExecutor()
+        self.upload_concurrency = UPLOAD_CONCURRENCY
+        http_client = make_http_client()
+
+        self.minio_instance = Minio(
+            minio_endpoint, minio_access_key, minio_secret_key, secure=minio_use_ssl, http_client=http_client
+        )
 
         if not self.minio_instance.bucket_exists(self.minio_bucket_name):
             self.minio_instance.make_bucket(self.minio_bucket_name)
@@ -82,6 +98,7 @@ class Database:
             minio_calendar_access_key,
             minio_calendar_secret_key,
             secure=minio_use_ssl,
+            http_client=http_client,
         )
 
         if not self.minio_calendar_instance.bucket_exists(self.minio_calendar_bucket_name):
@@ -123,17 +140,42 @@ class Database:
         await create_results(self.db, test_ids)
         await create_stories(self.db)
 
+    def clean_object_key(self, object_key: str) -> str:
+        bucket_prefix = f"{self.minio_bucket_name}/"
+        if object_key.startswith(bucket_prefix):
+            return object_key[len(bucket_prefix) :]
+        return object_key
+
     @rollbar_handler
-    def generate_presigned_url(self, object_name: str, expiration: timedelta = timedelta(hours=1)) -> str:
+    def generate_presigned_url(self, object_name: str, expiration: timedelta = PRESIGN_EXPIRATION) -> str:
+        url = self.presign_cache.get(self.minio_bucket_name, object_name, expiration)
+        if url:
+            return url
+
         try:
             url = self.minio_instance.presigned_get_object(self.minio_bucket_name, object_name, expires=expiration)
-            return url
         except Exception as e:
             raise ValueError(f"Failed to generate presigned URL for {object_name}: {e}")
 
+        self.presign_cache.put(self.minio_bucket_name, object_name, expiration, url)
+        return url
+
+    def presign_many(self, object_keys: List[str], variant: Optional[str] = None) -> Dict[str, str]:
+        """Подписывает набор ключей (в т.ч. с префиксом бакета) за один вызов;
+        одинаковые ключи подписываются один раз. Для изображений можно запросить
+        вариант размера (app/utils/images.py). Возвращает {исходный ключ: URL}."""
+        urls = {}
+        for key in dict.fromkeys(object_keys):
+            object_name = self.clean_object_key(key)
+            if variant:
+                object_name = images.variant_key(object_name, variant)
+            urls[key] = self.generate_presigned_url(object_name)
+        return urls
+
     @rollbar_handler
-    def upload_file_to_minio(self, data, filename, content_type):
-        self.minio_instance.put_object(
+    async def upload_file_to_minio(self, data, filename, content_type):
+        await self.storage.run(
+            self.minio_instance.put_object,
             self.minio_bucket_name,
             filename,
             data,
@@ -144,11 +186,140 @@ class Database:
         return f"{self.minio_bucket_name}/{filename}"
 
     @rollbar_handler
-    def uplod_json_to_minio(self, data: dict, filename):
+    async def upload_media_file(self, file, base_name: str, extension: str, content_type: str) -> str:
+        """Изображения сохраняются WebP-вариантами, рендеринг идет в пуле процессов;
+        возвращается ключ варианта full. Остальные файлы загружаются как есть."""
+        if not content_type.startswith("image/"):
+            return await self.upload_file_to_minio(file, f"{base_name}.{extension}", content_type)
+
+        data = await self.storage.run(file.read)
+        try:
+            variants = await images.render_variants(data)
+        except Exception as e:
+            print(f"Failed to render image variants for {base_name}: {e}")
+            variants = None
+
+        if not variants:
+            return await self.upload_file_to_minio(io.BytesIO(data), f"{base_name}.{extension}", content_type)
+
+        keys = await self._gather_uploads(
+            self.upload_file_to_minio(io.BytesIO(body), images.variant_name(base_name, variant), "image/webp")
+            for variant, body in variants.items()
+        )
+        return dict(zip(variants, keys))[images.FULL]
+
+    @rollbar_handler
+    async def upload_media_files(self, uploads: List[tuple]) -> List[str]:
+        """Загружает несколько файлов (file, base_name, extension, content_type) параллельно,
+        не более upload_concurrency одновременно. Ключи возвращаются в порядке uploads."""
+        semaphore = asyncio.Semaphore(self.upload_concurrency)
+
+        async def upload(args: tuple) -> str:
+            async with semaphore:
+                return await self.upload_media_file(*args)
+
+        return await self._gather_uploads(upload(args) for args in uploads)
+
+    async def _gather_uploads(self, uploads) -> List[str]:
+        # Если часть загрузок упала, уже загруженные объекты удаляются, чтобы не оставлять сирот
+        results = await asyncio.gather(*uploads, return_exceptions=True)
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors:
+            await self.discard_objects([result for result in results if isinstance(result, str)])
+            raise errors[0]
+        return results
+
+    async def discard_objects(self, object_names: List[str]):
+        results = await asyncio.gather(*(self.remove_object(name) for name in object_names), return_exceptions=True)
+        for name, result in zip(object_names, results):
+            if isinstance(result, BaseException):
+                print(f"Failed to remove orphaned object {name}: {result}")
+
+    @rollbar_handler
+    async def remove_object(self, object_name: str):
+        # Вместе с объектом удаляются все его варианты размера
+        for key in images.variant_keys(self.clean_object_key(object_name)):
+            await self.storage.run(self.minio_instance.remove_object, self.minio_bucket_name, key)
+
+    def _remove_objects(self, object_names: List[str]) -> List[str]:
+        # remove_objects ленивый: ошибки появляются только при обходе результата
+        errors = self.minio_instance.remove_objects(
+            self.minio_bucket_name, [DeleteObject(name) for name in object_names]
+        )
+        return [error.name for error in errors]
+
+    @rollbar_handler
+    async def remove_objects(self, object_names: List[str]) -> List[str]:
+        """Удаляет объекты пачкой (до 1000 ключей на запрос к S3), возвращает ключи, которые удалить не удалось."""
+        return await self.storage.run(self._remove_objects, object_names)
+
+    @rollbar_handler
+    async def list_objects(self, prefix: str) -> List[tuple]:
+        """Возвращает [(ключ, время изменения)] всех объектов с префиксом."""
+        return await self.storage.run(
+            lambda: [
+                (obj.object_name, obj.last_modified)
+                for obj in self.minio_instance.list_objects(self.minio_bucket_name, prefix=prefix, recursive=True)
+            ]
+        )
+
+    @rollbar_handler
+    async def presign_upload(self, object_name: str, expiration: timedelta = timedelta(minutes=30)) -> str:
+        return await self.storage.run(
+            self.minio_instance.presigned_put_object, self.minio_bucket_name, object_name, expires=expiration
+        )
+
+    # Multipart-загрузка: у minio для нее нет публичного API, используются методы S3-протокола клиента
+
+    @rollbar_handler
+    async def create_multipart_upload(self, object_name: str, content_type: str) -> str:
+        return await self.storage.run(
+            self.minio_instance._create_multipart_upload,
+            self.minio_bucket_name,
+            object_name,
+            {"Content-Type": content_type},
+        )
+
+    @rollbar_handler
+    async def presign_upload_part(
+        self, object_name: str, upload_id: str, part_number: int, expiration: timedelta = timedelta(minutes=30)
+    ) -> str:
+        return await self.storage.run(
+            self.minio_instance.get_presigned_url,
+            "PUT",
+            self.minio_bucket_name,
+            object_name,
+            expires=expiration,
+            extra_query_params={"uploadId": upload_id, "partNumber": str(part_number)},
+        )
+
+    @rollbar_handler
+    async def complete_multipart_upload(self, object_name: str, upload_id: str, parts: List[tuple]):
+        await self.storage.run(
+            self.minio_instance._complete_multipart_upload,
+            self.minio_bucket_name,
+            object_name,
+            upload_id,
+            [Part(part_number, etag) for part_number, etag in sorted(parts)],
+        )
+
+    @rollbar_handler
+    async def abort_multipart_upload(self, object_name: str, upload_id: str):
+        await self.storage.run(
+            self.minio_instance._abort_multipart_upload, self.minio_bucket_name, object_name, upload_id
+        )
+
+    @rollbar_handler
+    async def stat_object(self, object_name: str):
+        return await self.storage.run(self.minio_instance.stat_object, self.minio_bucket_name, object_name)
+
+    @rollbar_handler
+    async def uplod_json_to_minio(self, data: dict, filename):
         json_data = json.dumps(data, ensure_ascii=False).encode("utf-8")
         json_stream = io.BytesIO(json_data)
 
-        self.minio_calendar_instance.put_object(
+        await self.storage.run(
+            self.minio_calendar_instance.put_object,
             self.minio_calendar_bucket_name,
             filename,
             json_stream,
@@ -158,23 +329,26 @@ class Database:
 
         return f"{self.minio_calendar_bucket_name}/{filename}"
 
-    @rollbar_handler
-    def get_json_from_minio(self, filename) -> dict:
+    def _read_json_object(self, filename) -> dict:
+        response = self.minio_calendar_instance.get_object(self.minio_calendar_bucket_name, filename)
         try:
-            response = self.minio_calendar_instance.get_object(self.minio_calendar_bucket_name, filename)
-            json_data = json.load(response)
-
+            return json.load(response)
+        finally:
             response.close()
             response.release_conn()
 
-            return json_data
+    @rollbar_handler
+    async def get_json_from_minio(self, filename) -> dict:
+        try:
+            return await self.storage.run(self._read_json_object, filename)
         except Exception as e:
             raise ValueError(f"Failed to get json calendar from minio: {e}")
 
     @rollbar_handler
-    def delete_json_from_minio(self, filename):
+    async def delete_json_from_minio(self, filename):
         try:
-            self.minio_calendar_instance.remove_object(
+            await self.storage.run(
+                self.minio_calendar_instance.remove_object,
                 self.minio_calendar_bucket_name,
                 filename,
             )
@@ -301,17 +475,33 @@ class Database:
 
         return [str(tag_id) for tag_id in result.inserted_ids]
 
+    @staticmethod
+    def chat_pair(isu_1: int, isu_2: int) -> str:
+        # Ключ пары не зависит от порядка участников; старые чаты получают его
+        # бэкфиллом app/migrations/chat_pair.py
+        return f"{min(isu_1, isu_2)}_{max(isu_1, isu_2)}"
+
     @rollbar_handler
-    async def create_chat(self, chat_id: str, isu_1: int, isu_2: int, status: Optional[str] = "active"):
-        chat_data = {
-            "chat_id": chat_id,
-            "isu_1": isu_1,
-            "isu_2": isu_2,
-            "created_at": datetime.datetime.now(datetime.timezone.utc),
-            "status": status,
-        }
-        result = await self.db["chats"].insert_one(chat_data)
-        return str(result)
+    async def create_chat(self, chat_id: str, isu_1: int, isu_2: int, status: Optional[str] = "active") -> str:
+        # Чат на пару пользователей один: запись условная по ключу пары, поэтому
+        # одновременные вызовы получают один и тот же чат, а для существующей
+        # пары возвращается ее chat_id вместо переданного
+        chat = await self.db["chats"].find_one_and_update(
+            {"pair": self.chat_pair(isu_1, isu_2)},
+            {
+                "$setOnInsert": {
+                    "chat_id": chat_id,
+                    "isu_1": isu_1,
+                    "isu_2": isu_2,
+                    "created_at": datetime.datetime.now(datetime.timezone.utc),
+                    "status": status,
+                }
+            },
+            projection={"chat_id": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return chat["chat_id"]
 
     @rollbar_handler
     async def get_chats_by_user(self, isu: int):
@@ -362,27 +552,45 @@ class Database:
             for message in messages
         ]
 
+    @staticmethod
+    def _like_upsert(user_id: int, target_id: int) -> tuple:
+        # Повторный лайк не создает дубликат - см. уникальный индекс likes.user_target_unique
+        return (
+            {"user_id": user_id, "target_id": target_id},
+            {"$setOnInsert": {"created_at": datetime.datetime.now(datetime.timezone.utc)}},
+        )
+
+    @rollbar_handler
+    async def ensure_match_chat(self, isu_1: int, isu_2: int) -> str:
+        return await self.create_chat(str(ObjectId()), isu_1, isu_2)
+
     @rollbar_handler
     async def like_user(self, user_id: int, target_id: int):
-        await self.db["likes"].insert_one(
-            {
-                "user_id": user_id,
-                "target_id": target_id,
-                "created_at": datetime.datetime.now(datetime.timezone.utc),
-            }
-        )
+        await self.db["likes"].update_one(*self._like_upsert(user_id, target_id), upsert=True)
 
-        mutual_like = await self.db["likes"].find_one({"user_id": target_id, "target_id": user_id})
+        mutual_like = await self.db["likes"].find_one({"user_id": target_id, "target_id": user_id}, {"_id": 1})
 
         if mutual_like:
-            chat_id = str(ObjectId())
-            await self.create_chat(chat_id=chat_id, isu_1=user_id, isu_2=target_id)
+            chat_id = await self.ensure_match_chat(user_id, target_id)
             return {"matched": True, "chat_id": chat_id}
         return {"matched": False, "chat_id": None}
 
+    @rollbar_handler
+    async def superlike_user(self, user_id: int, target_id: int):
+        await self.db["likes"].bulk_write(
+            [
+                UpdateOne(*self._like_upsert(user_id, target_id), upsert=True),
+                UpdateOne(*self._like_upsert(target_id, user_id), upsert=True),
+            ],
+            ordered=False,
+        )
+        chat_id = await self.ensure_match_chat(user_id, target_id)
+        return {"matched": True, "chat_id": chat_id}
+
     @rollbar_handler
     async def dislike_user(self, user_id: int, target_id: int):
-        await self.db["dislikes"].insert_one(
+        # Дизлайки не влияют на мэтчи, поэтому пишутся пачками в фоне
+        await self.dislikes_buffer.add(
             {
                 "user_id": user_id,
                 "target_id": target_id,
@@ -0,0 +1,210 @@
+import random
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from dateutil.relativedelta import relativedelta
+
+from app.models.match import DiscoveryFilters
+
+USER_SCHEMA_VERSION = 2
+
+SAMPLING_SAMPLE = "sample"
+SAMPLING_RANDOM_KEY = "random_key"
+# Фильтры выполняются по снимку в памяти (app/utils/user_index.py), пока он не
+# построен - используется SAMPLING_SAMPLE
+SAMPLING_MEMORY = "memory"
+SAMPLING_MODES = (SAMPLING_SAMPLE, SAMPLING_RANDOM_KEY, SAMPLING_MEMORY)
+
+# Становится True, когда бэкфилл типизированных полей (app/migrations/user_schema_v2.py)
+# завершен и фильтры можно выполнять по индексу users.discovery_v2 (app/utils/indexes.py)
+_typed_fields_ready = False
+
+
+def typed_fields_ready() -> bool:
+    return _typed_fields_ready
+
+
+def set_typed_fields_ready(ready: bool = True) -> None:
+    global _typed_fields_ready
+    _typed_fields_ready = ready
+
+
+def parse_height(text: Optional[str]) -> Optional[float]:
+    try:
+        return float(str(text).split(" ")[0])
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_birthdate(text: Optional[str]) -> Optional[datetime]:
+    try:
+        return datetime.strptime(str(text), "%Y-%m-%d")
+    except (TypeError, ValueError):
+        return None
+
+
+def typed_discovery_fields(user: dict) -> dict:
+    features = {
+        feature["icon"]: feature.get("text", "")
+        for feature in user.get("mainFeatures", [])
+        if isinstance(feature, dict) and "icon" in feature
+    }
+    return {
+        "birthdate": parse_birthdate(features.get("birthdate")),
+        "height_cm": parse_height(features.get("height")),
+        "gender": (features.get("gender") or "").lower(),
+        "relationship_pref_ids": [pref["id"] for pref in user.get("relationship_preferences", []) if "id" in pref],
+        "schema_version": USER_SCHEMA_VERSION,
+    }
+
+
+def birthdate_bounds(min_age: int, max_age: int) -> dict:
+    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+    return {
+        "$gt": today - relativedelta(years=max_age + 1),
+        "$lte": today - relativedelta(years=min_age),
+    }
+
+
+def build_discovery_pipeline(
+    user_id: int,
+    excluded_ids: List[int],
+    filters: DiscoveryFilters,
+    sample_size: int = 1,
+    sampling: str = SAMPLING_SAMPLE,
+) -> list:
+    if typed_fields_ready():
+        pipeline = typed_filter_stages(user_id, excluded_ids, filters)
+    else:
+        pipeline = legacy_filter_stages(user_id, excluded_ids, filters)
+
+    if sampling == SAMPLING_RANDOM_KEY:
+        return random_key_stages(pipeline, sample_size, random.random())
+
+    pipeline.append({"$sample": {"size": sample_size}})
+    return pipeline
+
+
+def random_key_stages(filter_stages: list, size: int, pivot: float) -> list:
+    # Кандидаты берутся по индексу на rand начиная со случайной точки;
+    # если после нее записей не хватает, выборка продолжается с начала диапазона
+    def seek(condition: dict) -> list:
+        return [*filter_stages, {"$match": {"rand": condition}}, {"$sort": {"rand": 1}}, {"$limit": size}]
+
+    return [
+        *seek({"$gte": pivot}),
+        {"$unionWith": {"coll": "users", "pipeline": seek({"$lt": pivot})}},
+        {"$limit": size},
+    ]
+
+
+def legacy_filter_stages(user_id: int, excluded_ids: List[int], filters: DiscoveryFilters) -> list:
+    match_conditions = {"isu": {"$ne": user_id, "$nin": excluded_ids}}
+
+    if filters.gender.lower() != "everyone":
+        match_conditions["mainFeatures"] = {"$elemMatch": {"icon": "gender", "text": filters.gender.lower()}}
+
+    pipeline = []
+
+    pipeline.append({"$match": match_conditions})
+
+    pipeline.append(
+        {
+            "$addFields": {
+                "birthdateObj": {
+                    "$dateFromString": {
+                        "dateString": {
+                            "$reduce": {
+                                "input": {
+                                    "$filter": {
+                                        "input": "$mainFeatures",
+                                        "as": "mf",
+                                        "cond": {"$eq": ["$$mf.icon", "birthdate"]},
+                                    }
+                                },
+                                "initialValue": "",
+                                "in": "$$this.text",
+                            }
+                        },
+                        "format": "%Y-%m-%d",
+                    }
+                }
+            }
+        }
+    )
+
+    pipeline.append(
+        {
+            "$addFields": {
+                "age": {
+                    "$dateDiff": {
+                        "startDate": "$birthdateObj",
+                        "endDate": datetime.now(timezone.utc),
+                        "unit": "year",
+                    }
+                }
+            }
+        }
+    )
+
+    pipeline.append({"$match": {"age": {"$gte": filters.min_age, "$lte": filters.max_age}}})
+
+    if filters.min_height is not None and filters.max_height is not None:
+        pipeline.append(
+            {
+                "$addFields": {
+                    "heightValue": {
+                        "$reduce": {
+                            "input": {
+                                "$filter": {
+                                    "input": "$mainFeatures",
+                                    "as": "mf",
+                                    "cond": {"$eq": ["$$mf.icon", "height"]},
+                                }
+                            },
+                            "initialValue": "",
+                            "in": "$$this.text",
+                        }
+                    }
+                }
+            }
+        )
+        pipeline.append(
+            {
+                "$addFields": {
+                    "heightNum": {
+                        "$convert": {
+                            "input": {"$arrayElemAt": [{"$split": ["$heightValue", " "]}, 0]},
+                            "to": "double",
+                            "onError": 0.0,
+                            "onNull": 0.0,
+                        }
+                    }
+                }
+            }
+        )
+
+        pipeline.append({"$match": {"heightNum": {"$gte": filters.min_height, "$lte": filters.max_height}}})
+
+    if filters.relationship_preferences:
+        pipeline.append({"$match": {"relationship_preferences.id": {"$in": filters.relationship_preferences}}})
+
+    return pipeline
+
+
+def typed_filter_stages(user_id: int, excluded_ids: List[int], filters: DiscoveryFilters) -> list:
+    match_conditions = {
+        "isu": {"$ne": user_id, "$nin": excluded_ids},
+        "birthdate": birthdate_bounds(filters.min_age, filters.max_age),
+    }
+
+    if filters.gender.lower() != "everyone":
+        match_conditions["gender"] = filters.gender.lower()
+
+    if filters.min_height is not None and filters.max_height is not None:
+        match_conditions["height_cm"] = {"$gte": filters.min_height, "$lte": filters.max_height}
+
+    if filters.relationship_preferences:
+        match_conditions["relationship_pref_ids"] = {"$in": filters.relationship_preferences}
+
+    return [{"$match": match_conditions}]
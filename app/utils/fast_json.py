@@ -0,0 +1,65 @@
+import functools
+import inspect
+from decimal import Decimal
+from typing import Any, Callable
+
+import orjson
+from bson import ObjectId
+from fastapi.datastructures import DefaultPlaceholder
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from pydantic import BaseModel
+from starlette.responses import Response
+
+# Единый путь сериализации ответов: ручки возвращают документы Mongo как есть,
+# а orjson кодирует их за один проход (ObjectId -> str, datetime -> ISO 8601).
+# jsonable_encoder FastAPI для таких маршрутов не вызывается.
+
+OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=OPTIONS)
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class FastJSONRoute(APIRoute):
+    """Маршрут, который оборачивает результат ручки в FastJSONResponse.
+
+    Маршруты с response_model или аннотацией возвращаемого типа остаются
+    на стандартном пути FastAPI с валидацией ответа.
+    """
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs: Any):
+        explicit_model = not isinstance(kwargs.get("response_model", DefaultPlaceholder(None)), DefaultPlaceholder)
+        annotated = inspect.signature(endpoint).return_annotation is not inspect.Signature.empty
+        if inspect.iscoroutinefunction(endpoint) and not explicit_model and not annotated:
+            endpoint = _wrap_endpoint(endpoint, kwargs.get("status_code"))
+        super().__init__(path, endpoint, **kwargs)
+
+
+def _wrap_endpoint(endpoint: Callable[..., Any], status_code: Any) -> Callable[..., Any]:
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        result = await endpoint(*args, **kwargs)
+        if isinstance(result, Response):
+            return result
+        return FastJSONResponse(result, status_code=status_code or 200)
+
+    return wrapper
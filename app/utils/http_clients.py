@@ -0,0 +1,111 @@
+import os
+import time
+from collections import deque
+from typing import Dict, Iterable, Optional
+
+from aiohttp import ClientResponse, ClientSession, ClientTimeout, DummyCookieJar, TCPConnector
+
+# Общие на все время работы приложения HTTP-клиенты для внешних сервисов ИТМО:
+# по сессии aiohttp на апстрим, с keep-alive, лимитом соединений на хост,
+# кэшем DNS и явными таймаутами. Сессии создаются при старте приложения
+# (или при первом обращении) и закрываются при остановке.
+
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+HTTP_LIMIT_PER_HOST = int(os.getenv("HTTP_LIMIT_PER_HOST", "20"))
+HTTP_DNS_TTL = int(os.getenv("HTTP_DNS_TTL", "300"))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "60"))
+# Сколько последних запросов учитывается в перцентилях задержки
+LATENCY_WINDOW = 512
+
+KEYCLOAK = "id.itmo.ru"
+MY_ITMO = "my.itmo.ru"
+
+
+class UpstreamClient:
+    def __init__(self, name: str):
+        self.name = name
+        self._session: Optional[ClientSession] = None
+        self._latencies_ms = deque(maxlen=LATENCY_WINDOW)
+        self._requests = 0
+        self._errors = 0
+
+    @property
+    def session(self) -> ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = ClientSession(
+                connector=TCPConnector(
+                    limit_per_host=HTTP_LIMIT_PER_HOST,
+                    ttl_dns_cache=HTTP_DNS_TTL,
+                    keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+                ),
+                timeout=ClientTimeout(sock_connect=HTTP_CONNECT_TIMEOUT, sock_read=HTTP_READ_TIMEOUT),
+                # Сессия общая для всех пользователей: куки передаются явно в каждом запросе
+                cookie_jar=DummyCookieJar(),
+            )
+        return self._session
+
+    async def request(self, method: str, url: str, **kwargs) -> ClientResponse:
+        self._requests += 1
+        started = time.perf_counter()
+        try:
+            response = await self.session.request(method, url, **kwargs)
+        except Exception:
+            self._errors += 1
+            raise
+        finally:
+            self._latencies_ms.append((time.perf_counter() - started) * 1000)
+
+        if response.status >= 500:
+            self._errors += 1
+        return response
+
+    async def get(self, url: str, **kwargs) -> ClientResponse:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> ClientResponse:
+        return await self.request("POST", url, **kwargs)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def stats(self) -> dict:
+        latencies = sorted(self._latencies_ms)
+
+        def percentile(share: float) -> float:
+            return latencies[min(len(latencies) - 1, int(len(latencies) * share))] if latencies else 0.0
+
+        return {
+            "requests": self._requests,
+            "errors": self._errors,
+            "open": self._session is not None and not self._session.closed,
+            "p50_ms": percentile(0.5),
+            "p95_ms": percentile(0.95),
+            "max_ms": latencies[-1] if latencies else 0.0,
+        }
+
+
+class HttpClients:
+    def __init__(self):
+        self._clients: Dict[str, UpstreamClient] = {}
+
+    def get(self, name: str) -> UpstreamClient:
+        if name not in self._clients:
+            self._clients[name] = UpstreamClient(name)
+        return self._clients[name]
+
+    def start(self, names: Iterable[str] = (KEYCLOAK, MY_ITMO)):
+        for name in names:
+            self.get(name).session
+
+    async def close(self):
+        for client in self._clients.values():
+            await client.close()
+
+    def stats(self) -> dict:
+        return {name: client.stats() for name, client in self._clients.items()}
+
+
+http_clients = HttpClients()
@@ -0,0 +1,97 @@
+import asyncio
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# Загруженные изображения пересжимаются в WebP-варианты ограниченного размера.
+# Ключ варианта: "<base>_<variant>.webp", в документах хранится ключ варианта full,
+# а карточкам и превью отдаются варианты поменьше (variant_key).
+# Модуль не импортирует базу: он загружается в процессах пула рендеринга.
+
+THUMB = "thumb"
+CARD = "card"
+FULL = "full"
+VARIANTS = {THUMB: 160, CARD: 640, FULL: 1600}  # максимальная сторона в пикселях
+
+WEBP_QUALITY = 80
+SUPPORTED_FORMATS = {"JPEG", "MPO", "PNG", "WEBP", "BMP", "TIFF"}
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def variant_name(base_name: str, variant: str) -> str:
+    return f"{base_name}_{variant}.webp"
+
+
+def _split_variant(key: str) -> Optional[str]:
+    for variant in VARIANTS:
+        suffix = f"_{variant}.webp"
+        if key.endswith(suffix):
+            return key[: -len(suffix)]
+    return None
+
+
+def variant_key(key: str, variant: str) -> str:
+    # Для файлов, загруженных до появления вариантов, возвращается исходный ключ
+    base_name = _split_variant(key)
+    return variant_name(base_name, variant) if base_name is not None else key
+
+
+def variant_keys(key: str) -> List[str]:
+    base_name = _split_variant(key)
+    return [variant_name(base_name, variant) for variant in VARIANTS] if base_name is not None else [key]
+
+
+def is_image(data: bytes) -> bool:
+    # Читается только заголовок, поэтому проверка дешевая и выполняется в event loop
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            return image.format in SUPPORTED_FORMATS
+    except (UnidentifiedImageError, OSError):
+        return False
+
+
+def _render_variants(data: bytes) -> Dict[str, bytes]:
+    largest = max(VARIANTS.values())
+    with Image.open(io.BytesIO(data)) as source:
+        # JPEG декодируется сразу в уменьшенном масштабе
+        source.draft("RGB", (largest, largest))
+        image = ImageOps.exif_transpose(source)
+        if image.mode not in ("RGB", "RGBA"):
+            has_alpha = "A" in image.getbands() or "transparency" in image.info
+            image = image.convert("RGBA" if has_alpha else "RGB")
+
+        variants = {}
+        # От большего к меньшему: каждый вариант уменьшается из предыдущего
+        for variant, size in sorted(VARIANTS.items(), key=lambda item: -item[1]):
+            image.thumbnail((size, size), Image.Resampling.LANCZOS)
+            output = io.BytesIO()
+            image.save(output, "WEBP", quality=WEBP_QUALITY, method=4)
+            variants[variant] = output.getvalue()
+        return variants
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: приложение многопоточное (motor, пул хранилища), fork здесь небезопасен
+        _pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+async def render_variants(data: bytes) -> Optional[Dict[str, bytes]]:
+    if not is_image(data):
+        return None
+    return await asyncio.get_running_loop().run_in_executor(_get_pool(), _render_variants, data)
+
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
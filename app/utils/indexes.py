@@ -0,0 +1,175 @@
+import argparse
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from app.migrations import likes_dedupe
+from app.setup_rollbar import rollbar_handler
+from app.utils.db import db_instance
+
+# Индексы, которые нужны горячим запросам. Создаются при старте приложения
+# или командой `python -m app.utils.indexes ensure`, сверяются с $indexStats
+# командой `python -m app.utils.indexes report`.
+
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("isu", ASCENDING)], name="isu", unique=True),
+        IndexModel(
+            [("gender", ASCENDING), ("birthdate", ASCENDING), ("height_cm", ASCENDING)],
+            name="discovery_v2",
+        ),
+        IndexModel(
+            [("gender", ASCENDING), ("rand", ASCENDING), ("birthdate", ASCENDING), ("height_cm", ASCENDING)],
+            name="discovery_rand",
+        ),
+        # Без фильтра по полу (gender=Everyone) равенства перед rand нет, и сортировка
+        # по rand с индексом выше не сходится - нужен индекс, начинающийся с rand
+        IndexModel(
+            [("rand", ASCENDING), ("birthdate", ASCENDING), ("height_cm", ASCENDING)],
+            name="discovery_rand_any",
+        ),
+    ],
+    "likes": [
+        IndexModel([("user_id", ASCENDING), ("target_id", ASCENDING)], name="user_target_unique", unique=True),
+        IndexModel([("target_id", ASCENDING), ("_id", DESCENDING)], name="target_recent"),
+    ],
+    "dislikes": [
+        IndexModel([("user_id", ASCENDING)], name="user"),
+    ],
+    "chats": [
+        IndexModel([("isu_1", ASCENDING)], name="isu_1"),
+        IndexModel([("isu_2", ASCENDING)], name="isu_2"),
+        IndexModel(
+            [("pair", ASCENDING)],
+            name="pair",
+            unique=True,
+            partialFilterExpression={"pair": {"$exists": True}},
+        ),
+    ],
+    "messages": [
+        IndexModel([("chat_id", ASCENDING), ("timestamp", DESCENDING)], name="chat_timestamp"),
+    ],
+    "media": [
+        IndexModel([("chat_id", ASCENDING)], name="chat"),
+    ],
+    "stories": [
+        IndexModel([("isu", ASCENDING)], name="isu"),
+    ],
+    "premium": [
+        IndexModel([("isu", ASCENDING), ("validUntil", ASCENDING)], name="isu_valid_until"),
+    ],
+    "results": [
+        IndexModel([("user_id", ASCENDING)], name="user"),
+    ],
+    # Очередь создается на каждый набор фильтров пользователя; неиспользуемые очереди
+    # и очереди с давно отобранными кандидатами удаляются через 30 минут после пополнения
+    "candidate_queues": [
+        IndexModel([("user_id", ASCENDING), ("filters_key", ASCENDING)], name="user_filters", unique=True),
+        IndexModel([("updated_at", ASCENDING)], name="updated_ttl", expireAfterSeconds=30 * 60),
+    ],
+    "seen_sets": [
+        IndexModel([("user_id", ASCENDING)], name="user", unique=True),
+    ],
+    "schedule_jobs": [
+        IndexModel([("isu", ASCENDING)], name="isu", unique=True),
+        IndexModel([("status", ASCENDING), ("not_before", ASCENDING)], name="status_not_before"),
+    ],
+    "storage_gc": [
+        IndexModel([("not_before", ASCENDING)], name="not_before"),
+    ],
+    # Незавершенные прямые загрузки (app/api/uploads.py) удаляются через сутки;
+    # раньше этого storage_gc.expire_uploads прерывает их multipart-загрузки
+    "uploads": [
+        IndexModel([("created_at", ASCENDING)], name="created_ttl", expireAfterSeconds=24 * 60 * 60),
+        IndexModel([("status", ASCENDING), ("created_at", ASCENDING)], name="status_created"),
+    ],
+}
+
+
+class IndexCreationError(Exception):
+    def __init__(self, failures: List[str], created: Dict[str, List[str]]):
+        super().__init__("Failed to create indexes: " + "; ".join(failures))
+        self.failures = failures
+        self.created = created
+
+
+async def _prepare_likes_user_target_unique(collection):
+    # Двойные тапы до перехода на upsert успели создать дубликаты лайков
+    await likes_dedupe.run_dedupe()
+    # Прежний неуникальный индекс с теми же ключами конфликтует с уникальным
+    if "user_target" in await collection.index_information():
+        await collection.drop_index("user_target")
+
+
+# Подготовка данных и старых индексов, без которой индекс не построится.
+# Выполняется, только пока индекса еще нет.
+PREPARE: Dict[Tuple[str, str], Callable[..., Awaitable[None]]] = {
+    ("likes", "user_target_unique"): _prepare_likes_user_target_unique,
+}
+
+
+@rollbar_handler
+async def ensure_indexes() -> Dict[str, List[str]]:
+    created = {}
+    failures = []
+    for collection_name, models in INDEXES.items():
+        collection = db_instance.db[collection_name]
+        created[collection_name] = []
+        existing = None
+        for model in models:
+            name = model.document["name"]
+            # Создание существующего индекса с той же спецификацией ничего не делает,
+            # а конфликт по одному индексу не мешает создать остальные
+            try:
+                prepare = PREPARE.get((collection_name, name))
+                if prepare:
+                    existing = existing if existing is not None else await collection.index_information()
+                    if name not in existing:
+                        await prepare(collection)
+                created[collection_name] += await collection.create_indexes([model])
+            except OperationFailure as e:
+                failures.append(f"{name} on {collection_name}: {e}")
+
+    # Без индекса (например, уникального) приложение работает без нужных гарантий,
+    # поэтому ошибка не глотается: rollbar_handler отправляет ее в Rollbar
+    if failures:
+        raise IndexCreationError(failures, created)
+    return created
+
+
+@rollbar_handler
+async def report_indexes() -> Dict[str, dict]:
+    report = {}
+    for collection_name, models in INDEXES.items():
+        stats = await db_instance.db[collection_name].aggregate([{"$indexStats": {}}]).to_list(length=None)
+        existing = {index["name"]: index for index in stats}
+        declared = {model.document["name"] for model in models}
+
+        report[collection_name] = {
+            "missing": sorted(declared - existing.keys()),
+            "unused": sorted(
+                name for name, index in existing.items() if name != "_id_" and index["accesses"]["ops"] == 0
+            ),
+            "undeclared": sorted(name for name in existing.keys() - declared if name != "_id_"),
+        }
+    return report
+
+
+async def _main(command: str):
+    if command == "ensure":
+        for collection_name, names in (await ensure_indexes()).items():
+            print(f"{collection_name}: {', '.join(names) or '-'}")
+    else:
+        for collection_name, problems in (await report_indexes()).items():
+            print(
+                f"{collection_name}: missing={problems['missing']} "
+                f"unused={problems['unused']} undeclared={problems['undeclared']}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage MongoDB indexes")
+    parser.add_argument("command", choices=["ensure", "report"])
+    asyncio.run(_main(parser.parse_args().command))
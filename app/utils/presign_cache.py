@@ -0,0 +1,62 @@
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Callable, Optional, Tuple
+
+# Кэш подписанных ссылок на объекты MinIO. Ссылка переиспользуется, пока
+# не истекла половина ее срока жизни, поэтому клиент всегда получает URL,
+# которым можно пользоваться еще минимум expiration / 2.
+
+PRESIGN_EXPIRATION = timedelta(hours=1)
+
+
+def presign_window(expiration: timedelta = PRESIGN_EXPIRATION, now: Optional[float] = None) -> int:
+    """Номер интервала длиной expiration / 2 по настенным часам. Ссылка, выданная
+    в этом интервале, подписана не раньше чем за expiration / 2 до выдачи, поэтому
+    остается рабочей до его конца - по номеру можно версионировать ответы с URL."""
+    return int((time.time() if now is None else now) // (expiration.total_seconds() / 2))
+
+
+class PresignCache:
+    def __init__(self, max_size: int = 10_000, clock: Callable[[], float] = time.monotonic):
+        self.max_size = max_size
+        self.clock = clock
+        self._entries: "OrderedDict[Tuple[str, str, int], Tuple[str, float]]" = OrderedDict()
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @staticmethod
+    def _key(bucket: str, object_name: str, expiration: timedelta) -> Tuple[str, str, int]:
+        return bucket, object_name, int(expiration.total_seconds())
+
+    def get(self, bucket: str, object_name: str, expiration: timedelta) -> Optional[str]:
+        key = self._key(bucket, object_name, expiration)
+        entry = self._entries.get(key)
+        if entry is not None and self.clock() - entry[1] < key[2] / 2:
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[0]
+
+        self._misses += 1
+        return None
+
+    def put(self, bucket: str, object_name: str, expiration: timedelta, url: str):
+        key = self._key(bucket, object_name, expiration)
+        self._entries[key] = (url, self.clock())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+
+    def stats(self) -> dict:
+        requests = self._hits + self._misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self._hits,
+            "misses": self._misses,
+            "evictions": self._evictions,
+            "hit_rate": self._hits / requests if requests else 0.0,
+        }
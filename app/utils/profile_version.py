@@ -0,0 +1,34 @@
+import hashlib
+from typing import List, Optional
+
+# Каждый документ пользователя хранит монотонно растущий счетчик version.
+# Все ручки, изменяющие профиль, обновляют его через versioned(), а get_profile
+# отдает ETag вида W/"<isu>-<version>" и отвечает 304 на совпавший If-None-Match.
+# Если в ответе есть подписанные ссылки на медиа, в ETag добавляется номер окна
+# presign (app/utils/presign_cache.py): закэшированные URL не переживают свой срок.
+# Для ответа с выборкой полей (?fields=) в ETag входит хэш отсортированного списка
+# полей, чтобы частичное представление не подтверждало кэш полного и наоборот.
+
+
+def versioned(update: dict) -> dict:
+    return {**update, "$inc": {**update.get("$inc", {}), "version": 1}}
+
+
+def profile_etag(
+    isu: int, version: Optional[int], presign_window: Optional[int] = None, fields: Optional[List[str]] = None
+) -> str:
+    # У документов, созданных до появления счетчика, version отсутствует
+    tag = f"{isu}-{version or 0}"
+    if fields is not None:
+        tag += "-f" + hashlib.sha1(",".join(sorted(fields)).encode()).hexdigest()[:8]
+    if presign_window is not None:
+        tag += f"-p{presign_window}"
+    return f'W/"{tag}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    # Сравнение слабое (RFC 9110): префикс W/ не учитывается
+    return "*" in candidates or etag.removeprefix("W/") in [candidate.removeprefix("W/") for candidate in candidates]
@@ -0,0 +1,48 @@
+from typing import Iterable, List, Optional
+
+# Выборка полей (?fields=username,logo): запрошенные поля превращаются в
+# проекцию Mongo, а медиа, которые не запрошены, не подписываются.
+# isu нужен для фильтрации просмотренных и возвращается всегда.
+
+CARD_FIELDS = (
+    "isu",
+    "username",
+    "bio",
+    "logo",
+    "photos",
+    "mainFeatures",
+    "interests",
+    "itmo",
+    "gender_preferences",
+    "relationship_preferences",
+    "isStudent",
+)
+PROFILE_FIELDS = ("_id", *CARD_FIELDS, "version")
+# Служебные поля поиска (типизированные копии mainFeatures и ключ случайной выборки)
+# в публичный профиль не отдаются
+INTERNAL_FIELDS = ("birthdate", "height_cm", "gender", "relationship_pref_ids", "schema_version", "rand")
+DEFAULT_PROFILE_PROJECTION = {field: 0 for field in INTERNAL_FIELDS}
+
+
+def parse_fields(fields: Optional[str], allowed: Iterable[str]) -> Optional[List[str]]:
+    """Разбирает список полей через запятую; None означает весь документ."""
+    if not fields:
+        return None
+
+    requested = list(dict.fromkeys(field.strip() for field in fields.split(",") if field.strip()))
+    unknown = [field for field in requested if field not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+
+    return ["isu", *[field for field in requested if field != "isu"]]
+
+
+def build_projection(fields: List[str]) -> dict:
+    projection = {field: 1 for field in fields}
+    if "_id" not in projection:
+        projection["_id"] = 0
+    return projection
+
+
+def wants(fields: Optional[List[str]], field: str) -> bool:
+    return fields is None or field in fields
@@ -0,0 +1,260 @@
+from datetime import datetime
+from itertools import chain
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from app.utils.discovery import parse_birthdate
+
+# Ранжирование кандидатов по совместимости с пользователем за один векторный проход.
+# Модуль не обращается к базе: данные передаются уже загруженными, поэтому его можно
+# подключить после любой фильтрации кандидатов (и запускать бенчмарк без окружения).
+
+DEFAULT_WEIGHTS = {
+    "interests": 0.35,
+    "relationship_preferences": 0.2,
+    "age": 0.2,
+    "faculty": 0.1,
+    "course": 0.05,
+    "quiz": 0.1,
+}
+AGE_SCALE_YEARS = 5.0
+MAX_COURSE_DISTANCE = 5.0
+# Разобранные признаки пользователей кэшируются по (isu, version), см. EncodedUsers
+ENCODED_CACHE_SIZE = 50_000
+
+if hasattr(np, "bitwise_count"):
+
+    def popcount(words: np.ndarray) -> np.ndarray:
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int32)
+
+else:  # pragma: no cover - NumPy < 2.0
+
+    def popcount(words: np.ndarray) -> np.ndarray:
+        bits = np.unpackbits(np.ascontiguousarray(words).view(np.uint8), axis=-1)
+        return bits.sum(axis=-1, dtype=np.int32)
+
+
+class Vocabulary:
+    def __init__(self):
+        self.codes: Dict[str, int] = {}
+
+    def code(self, label: str) -> int:
+        return self.codes.setdefault(label, len(self.codes))
+
+    def __len__(self):
+        return len(self.codes)
+
+
+class Features:
+    """Колонки признаков для набора пользователей; строка i соответствует users[i]."""
+
+    def __init__(
+        self,
+        interests: np.ndarray,
+        relationship_preferences: np.ndarray,
+        age: np.ndarray,
+        faculty: np.ndarray,
+        course: np.ndarray,
+        quiz: np.ndarray,
+    ):
+        self.interests = interests
+        self.relationship_preferences = relationship_preferences
+        self.age = age
+        self.faculty = faculty
+        self.course = course
+        self.quiz = quiz
+
+    def take(self, index) -> "Features":
+        return Features(**{name: column[index] for name, column in vars(self).items()})
+
+
+class EncodedUser(NamedTuple):
+    """Признаки одного пользователя, не зависящие от момента запроса и результатов тестов."""
+
+    interests: Tuple[int, ...]
+    relationship_preferences: Tuple[int, ...]
+    birthdate: float  # порядковый номер дня (date.toordinal) или nan
+    faculty: int
+    course: float
+
+
+def _birthdate(user: dict) -> Optional[datetime]:
+    birthdate = user.get("birthdate")
+    if not isinstance(birthdate, datetime):
+        features = {f["icon"]: f.get("text") for f in user.get("mainFeatures", []) if isinstance(f, dict)}
+        birthdate = parse_birthdate(features.get("birthdate"))
+    return birthdate
+
+
+def _set_bits(matrix: np.ndarray, rows: List[Tuple[int, ...]]):
+    # Все биты выставляются одной операцией: строка, слово и маска на каждый код
+    lengths = np.fromiter((len(codes) for codes in rows), dtype=np.intp, count=len(rows))
+    codes = np.fromiter(chain.from_iterable(rows), dtype=np.uint64, count=int(lengths.sum()))
+    row_index = np.repeat(np.arange(len(rows)), lengths)
+    word_index = (codes >> np.uint64(6)).astype(np.intp)
+    np.bitwise_or.at(matrix, (row_index, word_index), np.uint64(1) << (codes & np.uint64(63)))
+
+
+class EncodedUsers:
+    """Кэш разобранных признаков по (isu, version). Строки хранятся в колонках NumPy,
+    поэтому признаки набора кандидатов собираются одной выборкой по индексам.
+    Профиль меняется только вместе с version (app/utils/profile_version.py)."""
+
+    def __init__(self, capacity: int):
+        self.slots: Dict[Tuple[int, Optional[int]], int] = {}
+        self._allocate(capacity, 1)
+
+    def _allocate(self, capacity: int, tag_words: int):
+        self.capacity = capacity
+        self.interests = np.zeros((capacity, tag_words), dtype=np.uint64)
+        self.relationship_preferences = np.zeros((capacity, tag_words), dtype=np.uint64)
+        self.birthdate = np.full(capacity, np.nan)
+        self.faculty = np.full(capacity, -1, dtype=np.int32)
+        self.course = np.full(capacity, np.nan, dtype=np.float32)
+
+    def lookup(self, keys: List[Tuple[int, Optional[int]]]) -> List[Optional[int]]:
+        return list(map(self.slots.get, keys))
+
+    def reserve(self, missing: int, total: int) -> bool:
+        """Освобождает место под missing новых строк из total строк запроса; True, если
+        для этого кэш пришлось сбросить - тогда сохранить нужно все total строк."""
+        if len(self.slots) + missing <= self.capacity:
+            return False
+        # Сбрасывается весь кэш, а не отдельные строки: иначе можно вытеснить
+        # строку, которая уже выбрана для текущего запроса
+        self.slots.clear()
+        if total > self.capacity:
+            self._allocate(total, self.interests.shape[1])
+        return True
+
+    def store(self, keys: List[Tuple[int, Optional[int]]], rows: List[EncodedUser], tag_words: int) -> List[int]:
+        if tag_words > self.interests.shape[1]:
+            # Словарь тегов вырос - добавляются пустые слова битовых масок
+            extra = ((0, 0), (0, tag_words - self.interests.shape[1]))
+            self.interests = np.pad(self.interests, extra)
+            self.relationship_preferences = np.pad(self.relationship_preferences, extra)
+
+        slots = list(range(len(self.slots), len(self.slots) + len(rows)))
+        self.slots.update(zip(keys, slots))
+
+        interests, preferences, birthdates, faculties, courses = zip(*rows)
+        for name, codes in (("interests", interests), ("relationship_preferences", preferences)):
+            bits = np.zeros((len(rows), self.interests.shape[1]), dtype=np.uint64)
+            _set_bits(bits, codes)
+            getattr(self, name)[slots] = bits
+        self.birthdate[slots] = birthdates
+        self.faculty[slots] = faculties
+        self.course[slots] = courses
+        return slots
+
+
+class CompatibilityRanker:
+    def __init__(self, weights: Optional[Dict[str, float]] = None, cache_size: int = ENCODED_CACHE_SIZE):
+        self.weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+        self.tags = Vocabulary()
+        self.faculties = Vocabulary()
+        self.tests = Vocabulary()
+        self.encoded = EncodedUsers(cache_size)
+
+    def encode_user(self, user: dict) -> EncodedUser:
+        birthdate = _birthdate(user)
+        itmo = {item["icon"]: item.get("text") for item in user.get("itmo", []) if isinstance(item, dict)}
+        return EncodedUser(
+            interests=tuple(self.tags.code(f"tag:{i.get('text')}") for i in user.get("interests", [])),
+            relationship_preferences=tuple(
+                self.tags.code(f"rel:{p.get('id')}") for p in user.get("relationship_preferences", [])
+            ),
+            birthdate=float(birthdate.toordinal()) if birthdate else np.nan,
+            faculty=self.faculties.code(itmo["faculty"]) if itmo.get("faculty") else -1,
+            course=float(itmo["course"]) if str(itmo.get("course") or "").isdigit() else np.nan,
+        )
+
+    def encode(self, users: List[dict], quiz_scores: Dict[int, Dict[str, float]]) -> Features:
+        size = len(users)
+        isus = [user["isu"] for user in users]
+        keys = list(zip(isus, [user.get("version") for user in users]))
+
+        # В Python разбираются только пользователи, которых еще нет в кэше
+        slots = self.encoded.lookup(keys)
+        missing = [i for i, slot in enumerate(slots) if slot is None]
+        if missing:
+            if self.encoded.reserve(len(missing), size):
+                slots, missing = [None] * size, list(range(size))
+            rows = [self.encode_user(users[i]) for i in missing]
+            tag_words = max(1, (len(self.tags) + 63) // 64)
+            for i, slot in zip(missing, self.encoded.store([keys[i] for i in missing], rows, tag_words)):
+                slots[i] = slot
+
+        # Результаты тестов приходят с каждым запросом; тестов немного, поэтому
+        # матрица заполняется по столбцу на тест
+        user_scores = [quiz_scores.get(isu) or {} for isu in isus]
+        columns = {self.tests.code(str(test_id)): test_id for test_id in set().union(*user_scores)}
+        quiz = np.full((size, max(1, len(self.tests))), np.nan, dtype=np.float32)
+        for column, test_id in columns.items():
+            quiz[:, column] = np.fromiter(
+                (scores.get(test_id, np.nan) for scores in user_scores), dtype=np.float32, count=size
+            )
+
+        index = np.fromiter(slots, dtype=np.intp, count=size)
+        encoded = self.encoded
+        features = Features(
+            interests=encoded.interests[index],
+            relationship_preferences=encoded.relationship_preferences[index],
+            age=((datetime.now().toordinal() - encoded.birthdate[index]) / 365.25).astype(np.float32),
+            faculty=encoded.faculty[index],
+            course=encoded.course[index],
+            quiz=quiz,
+        )
+        return features
+
+    def score(self, user: Features, candidates: Features) -> np.ndarray:
+        weights = self.weights
+        total = np.zeros(len(candidates.age), dtype=np.float32)
+
+        for name in ("interests", "relationship_preferences"):
+            user_bits, candidate_bits = getattr(user, name), getattr(candidates, name)
+            union = popcount(candidate_bits | user_bits)
+            common = popcount(candidate_bits & user_bits)
+            total += weights[name] * np.divide(common, union, out=np.zeros_like(total), where=union > 0)
+
+        age_similarity = np.exp(-np.abs(candidates.age - user.age) / AGE_SCALE_YEARS)
+        total += weights["age"] * np.nan_to_num(age_similarity)
+
+        if user.faculty >= 0:
+            total += weights["faculty"] * (candidates.faculty == user.faculty)
+
+        course_distance = np.minimum(np.abs(candidates.course - user.course), MAX_COURSE_DISTANCE)
+        total += weights["course"] * np.nan_to_num(1 - course_distance / MAX_COURSE_DISTANCE)
+
+        answered = ~np.isnan(candidates.quiz) & ~np.isnan(user.quiz)
+        answered_count = answered.sum(axis=1)
+        distance = np.where(answered, np.abs(candidates.quiz - user.quiz) / 100, 0).sum(axis=1)
+        quiz_similarity = np.divide(
+            answered_count - distance, answered_count, out=np.zeros_like(total), where=answered_count > 0
+        )
+        total += weights["quiz"] * quiz_similarity
+
+        return total
+
+    def rank(
+        self,
+        user: dict,
+        candidates: List[dict],
+        quiz_scores: Dict[int, Dict[str, float]],
+        k: int,
+    ) -> List[dict]:
+        if not candidates:
+            return []
+
+        features = self.encode([user, *candidates], quiz_scores)
+        scores = self.score(features.take(0), features.take(slice(1, None)))
+        return [candidates[i] for i in top_k(scores, k)]
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    best = np.argpartition(-scores, k - 1)[:k]
+    return best[np.argsort(-scores[best], kind="stable")]
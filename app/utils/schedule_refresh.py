@@ -0,0 +1,160 @@
+import asyncio
+import datetime
+from typing import Optional
+from uuid import uuid4
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from app.setup_rollbar import rollbar_handler
+from app.utils.db import db_instance
+from app.utils.http_clients import MY_ITMO, http_clients
+
+# Загрузка расписания с my.itmo.ru вынесена из логина в фоновую задачу.
+# На пользователя хранится один документ в schedule_jobs (status: pending,
+# running, done, failed): логин ставит задачу с access token, первая попытка
+# запускается сразу в фоне, повторы с экспоненциальной задержкой выполняет
+# планировщик. Токен удаляется из документа, как только задача завершена.
+
+JOBS_COLLECTION = "schedule_jobs"
+SCHEDULE_URL = "https://my.itmo.ru/api/schedule/schedule/personal?date_start=2024-09-01&date_end=2025-02-01"
+
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = datetime.timedelta(seconds=30)
+BACKOFF_MAX = datetime.timedelta(minutes=10)
+# Свежее расписание не загружается повторно при каждом логине
+MIN_REFRESH_INTERVAL = datetime.timedelta(minutes=15)
+# Задача, зависшая в running (например, после рестарта воркера), захватывается снова
+STALE_AFTER = datetime.timedelta(minutes=10)
+BATCH_SIZE = 20
+
+_background_tasks = set()
+
+
+class ScheduleFetchError(Exception):
+    def __init__(self, message: str, retryable: bool = True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+def backoff(attempts: int) -> datetime.timedelta:
+    return min(BACKOFF_BASE * 2 ** max(attempts - 1, 0), BACKOFF_MAX)
+
+
+@rollbar_handler
+async def enqueue(isu: int, token: str) -> bool:
+    """Ставит загрузку расписания в очередь; False, если задача уже выполняется или расписание свежее."""
+    now = datetime.datetime.now()
+    try:
+        # Документ на пользователя один: уже идущая задача или недавно загруженное
+        # расписание не совпадают с фильтром, и upsert упирается в уникальный индекс по isu
+        await db_instance.db[JOBS_COLLECTION].update_one(
+            {
+                "isu": isu,
+                "$nor": [
+                    {"status": STATUS_RUNNING, "started_at": {"$gt": now - STALE_AFTER}},
+                    {"status": STATUS_DONE, "finished_at": {"$gt": now - MIN_REFRESH_INTERVAL}},
+                ],
+            },
+            {
+                "$set": {
+                    "token": token,
+                    "status": STATUS_PENDING,
+                    "attempts": 0,
+                    "not_before": now,
+                    "enqueued_at": now,
+                    "run_id": None,
+                    "error": None,
+                }
+            },
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        return False
+
+    task = asyncio.create_task(process_due())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return True
+
+
+async def refresh_schedule(isu: int, token: str):
+    headers = {"Authorization": f"Bearer {token}", "Accept-Language": "ru"}
+    async with await http_clients.get(MY_ITMO).get(SCHEDULE_URL, headers=headers) as response:
+        if response.status in (401, 403):
+            raise ScheduleFetchError(f"my.itmo.ru rejected the token ({response.status})", retryable=False)
+        if response.status != 200:
+            raise ScheduleFetchError(f"my.itmo.ru responded with {response.status}")
+        calendar_data = await response.json()
+
+    filename = f"schedule_{isu}.json"
+    await db_instance.delete_json_from_minio(filename)
+    await db_instance.uplod_json_to_minio(calendar_data, filename)
+
+
+async def claim() -> Optional[dict]:
+    now = datetime.datetime.now()
+    return await db_instance.db[JOBS_COLLECTION].find_one_and_update(
+        {
+            "$or": [
+                {"status": STATUS_PENDING, "not_before": {"$lte": now}},
+                {"status": STATUS_RUNNING, "started_at": {"$lt": now - STALE_AFTER}},
+            ]
+        },
+        {"$set": {"status": STATUS_RUNNING, "run_id": uuid4().hex, "started_at": now}, "$inc": {"attempts": 1}},
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def run(job: dict):
+    collection = db_instance.db[JOBS_COLLECTION]
+    # Если за время выполнения задачу поставили заново, ее run_id сброшен и результат не записывается
+    current = {"_id": job["_id"], "run_id": job["run_id"]}
+
+    try:
+        await refresh_schedule(job["isu"], job["token"])
+    except Exception as e:
+        now = datetime.datetime.now()
+        if getattr(e, "retryable", True) and job["attempts"] < MAX_ATTEMPTS:
+            update = {"$set": {"status": STATUS_PENDING, "not_before": now + backoff(job["attempts"]), "error": str(e)}}
+        else:
+            update = {"$set": {"status": STATUS_FAILED, "finished_at": now, "error": str(e)}, "$unset": {"token": ""}}
+        await collection.update_one(current, update)
+        return
+
+    await collection.update_one(
+        current,
+        {"$set": {"status": STATUS_DONE, "finished_at": datetime.datetime.now(), "error": None}, "$unset": {"token": ""}},
+    )
+
+
+@rollbar_handler
+async def process_due() -> int:
+    """Выполняет задачи, срок которых наступил; возвращает число обработанных."""
+    processed = 0
+    for _ in range(BATCH_SIZE):
+        job = await claim()
+        if not job:
+            break
+        await run(job)
+        processed += 1
+    return processed
+
+
+async def get_status(isu: int) -> Optional[dict]:
+    return await db_instance.db[JOBS_COLLECTION].find_one(
+        {"isu": isu},
+        {"_id": 0, "isu": 1, "status": 1, "attempts": 1, "error": 1, "enqueued_at": 1, "finished_at": 1},
+    )
+
+
+async def stats() -> dict:
+    counts = await db_instance.db[JOBS_COLLECTION].aggregate(
+        [{"$group": {"_id": "$status", "count": {"$sum": 1}}}]
+    ).to_list(length=None)
+    return {item["_id"]: item["count"] for item in counts}
@@ -1,7 +1,9 @@
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 import datetime
+from app.utils import schedule_refresh, storage_gc
 from app.utils.db import db_instance
+from app.utils.user_index import user_index
 
 # Автоматическое удаление просроченных премом из бд
 
@@ -10,7 +12,19 @@ async def remove_expired_premiums():
     print(f"removed {result.deleted_count} premium(s)")
 
 
+# Полная перестройка снимка пользователей подхватывает изменения, сделанные
+# другими воркерами и напрямую в базе
+
+async def rebuild_user_index():
+    await user_index.build(db_instance.db["users"])
+
+
 def start_scheduler():
     scheduler = AsyncIOScheduler()
     scheduler.add_job(remove_expired_premiums, IntervalTrigger(hours=1))
+    scheduler.add_job(rebuild_user_index, IntervalTrigger(minutes=30))
+    scheduler.add_job(storage_gc.collect, IntervalTrigger(minutes=1))
+    scheduler.add_job(storage_gc.reconcile, IntervalTrigger(hours=24))
+    scheduler.add_job(storage_gc.expire_uploads, IntervalTrigger(minutes=15))
+    scheduler.add_job(schedule_refresh.process_due, IntervalTrigger(seconds=30))
     scheduler.start()
@@ -0,0 +1,100 @@
+import datetime
+import time
+from array import array
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from typing import Iterable, List
+
+from app.setup_rollbar import rollbar_handler
+from app.utils.db import db_instance
+
+# Множество уже просмотренных пользователем ISU (лайки, дизлайки, блокировки).
+# В базе хранится одним документом на пользователя, в памяти - отсортированным
+# массивом int, поэтому проверка "видел ли" стоит O(log n) без запросов к likes/dislikes.
+
+SEEN_COLLECTION = "seen_sets"
+CACHE_MAX_USERS = 10_000
+CACHE_TTL_SECONDS = 60
+OVERSAMPLE_LIMIT = 100
+
+_cache: "OrderedDict[int, tuple[float, array]]" = OrderedDict()
+
+
+def _remember(user_id: int, seen: array) -> array:
+    _cache[user_id] = (time.monotonic(), seen)
+    _cache.move_to_end(user_id)
+    while len(_cache) > CACHE_MAX_USERS:
+        _cache.popitem(last=False)
+    return seen
+
+
+@rollbar_handler
+async def _load(user_id: int) -> List[int]:
+    seen_sets = db_instance.db[SEEN_COLLECTION]
+    document = await seen_sets.find_one({"user_id": user_id}, {"ids": 1})
+    if document is not None:
+        return document.get("ids", [])
+
+    # Первое обращение - собираем множество из старых коллекций и сохраняем его
+    liked_ids = await db_instance.db["likes"].distinct("target_id", {"user_id": user_id})
+    disliked_ids = await db_instance.db["dislikes"].distinct("target_id", {"user_id": user_id})
+    ids = sorted(set(liked_ids) | set(disliked_ids))
+
+    await seen_sets.update_one(
+        {"user_id": user_id},
+        {
+            "$addToSet": {"ids": {"$each": ids}},
+            "$set": {"updated_at": datetime.datetime.now(datetime.timezone.utc)},
+        },
+        upsert=True,
+    )
+    return ids
+
+
+async def get_seen(user_id: int) -> array:
+    cached = _cache.get(user_id)
+    if cached and time.monotonic() - cached[0] < CACHE_TTL_SECONDS:
+        _cache.move_to_end(user_id)
+        return cached[1]
+
+    ids = await _load(user_id)
+    return _remember(user_id, array("q", sorted(ids)))
+
+
+def contains(seen: array, isu: int) -> bool:
+    index = bisect_left(seen, isu)
+    return index < len(seen) and seen[index] == isu
+
+
+def sample_size_for(seen: array, size: int) -> int:
+    # Просмотренные отсеиваются уже после выборки, поэтому берем кандидатов с запасом
+    return size + min(len(seen), OVERSAMPLE_LIMIT)
+
+
+def filter_unseen(seen: array, isus: Iterable[int]) -> List[int]:
+    return [isu for isu in isus if not contains(seen, isu)]
+
+
+def sample_exhausted(seen: array, sampled_isus: List[int], size: int, sample_size: int) -> bool:
+    # Выборка заполнена целиком, но непросмотренных в ней не хватает: в пуле могут
+    # оставаться непросмотренные кандидаты, и их нужно искать с $nin по просмотренным.
+    # Неполная выборка означает, что в нее попал весь отфильтрованный пул
+    return len(sampled_isus) >= sample_size and len(filter_unseen(seen, sampled_isus)) < size
+
+
+@rollbar_handler
+async def mark_seen(user_id: int, target_id: int) -> None:
+    # Гарантирует, что старые лайки/дизлайки уже перенесены в документ пользователя
+    seen = await get_seen(user_id)
+
+    await db_instance.db[SEEN_COLLECTION].update_one(
+        {"user_id": user_id},
+        {
+            "$addToSet": {"ids": target_id},
+            "$set": {"updated_at": datetime.datetime.now(datetime.timezone.utc)},
+        },
+        upsert=True,
+    )
+
+    if not contains(seen, target_id):
+        insort(seen, target_id)
@@ -1,14 +0,0 @@
-from typing import Any
-
-from bson import ObjectId
-
-
-def serialize(obj: Any) -> Any:
-    if isinstance(obj, ObjectId):
-        return str(obj)
-    elif isinstance(obj, list):
-        return [serialize(item) for item in obj]
-    elif isinstance(obj, dict):
-        return {key: serialize(value) for key, value in obj.items()}
-    else:
-        return obj
@@ -0,0 +1,47 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+# Объединение одинаковых конкурентных вызовов: пока операция с ключом
+# выполняется, повторные вызовы с тем же ключом ждут ее результат (или
+# исключение), а не запускают свою копию. Подходит только для идемпотентных
+# операций - ключ должен включать все, от чего зависит результат.
+
+_groups: Dict[str, "SingleFlight"] = {}
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self._executions = 0
+        self._shared = 0
+        _groups[name] = self
+
+    async def do(self, key: Hashable, func: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(func(*args, **kwargs))
+            self._calls[key] = future
+            future.add_done_callback(lambda done: self._forget(key, done))
+            self._executions += 1
+        else:
+            self._shared += 1
+
+        # Отмена одного ожидающего (например, клиент закрыл соединение)
+        # не отменяет общую операцию для остальных
+        return await asyncio.shield(future)
+
+    def _forget(self, key: Hashable, future: asyncio.Future):
+        if self._calls.get(key) is future:
+            del self._calls[key]
+        if not future.cancelled():
+            # Исключение уже получили ожидающие; без этого asyncio пишет
+            # "exception was never retrieved", если все они были отменены
+            future.exception()
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._calls), "executions": self._executions, "shared": self._shared}
+
+
+def stats() -> dict:
+    return {name: group.stats() for name, group in _groups.items()}
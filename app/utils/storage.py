@@ -0,0 +1,91 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+import certifi
+import urllib3
+
+# Клиент minio синхронный: все обращения к хранилищу выполняются в отдельном
+# пуле потоков, чтобы загрузка больших файлов не блокировала event loop.
+# Размер пула и HTTP-соединений настраивается через окружение.
+
+STORAGE_WORKERS = int(os.getenv("STORAGE_WORKERS", "16"))
+STORAGE_CONNECT_TIMEOUT = float(os.getenv("STORAGE_CONNECT_TIMEOUT", "5"))
+STORAGE_READ_TIMEOUT = float(os.getenv("STORAGE_READ_TIMEOUT", "120"))
+# Сколько файлов одного запроса (например, карусели) загружается одновременно
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", "6"))
+
+
+def make_http_client(pool_size: int = STORAGE_WORKERS) -> urllib3.PoolManager:
+    # Общий для всех клиентов Minio пул соединений: по соединению на поток хранилища
+    return urllib3.PoolManager(
+        maxsize=pool_size,
+        timeout=urllib3.Timeout(connect=STORAGE_CONNECT_TIMEOUT, read=STORAGE_READ_TIMEOUT),
+        cert_reqs="CERT_REQUIRED",
+        ca_certs=certifi.where(),
+        retries=urllib3.Retry(total=5, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504]),
+    )
+
+
+class StorageExecutor:
+    def __init__(self, max_workers: int = STORAGE_WORKERS):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="storage")
+        self._lock = threading.Lock()
+
+        self._submitted = 0
+        self._active = 0
+        self._completed = 0
+        self._failed = 0
+        self._wait_seconds_total = 0.0
+        self._max_wait_ms = 0.0
+        self._run_seconds_total = 0.0
+        self._max_run_ms = 0.0
+
+    async def run(self, func: Callable, *args, **kwargs):
+        submitted = time.perf_counter()
+
+        def call():
+            started = time.perf_counter()
+            with self._lock:
+                self._active += 1
+                self._wait_seconds_total += started - submitted
+                self._max_wait_ms = max(self._max_wait_ms, (started - submitted) * 1000)
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                with self._lock:
+                    self._failed += 1
+                raise
+            finally:
+                elapsed = time.perf_counter() - started
+                with self._lock:
+                    self._active -= 1
+                    self._completed += 1
+                    self._run_seconds_total += elapsed
+                    self._max_run_ms = max(self._max_run_ms, elapsed * 1000)
+
+        with self._lock:
+            self._submitted += 1
+        return await asyncio.get_running_loop().run_in_executor(self._executor, call)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            completed = self._completed
+            return {
+                "workers": self.max_workers,
+                "active": self._active,
+                "queued": self._submitted - self._completed - self._active,
+                "completed": completed,
+                "failed": self._failed,
+                "avg_wait_ms": self._wait_seconds_total * 1000 / completed if completed else 0.0,
+                "max_wait_ms": self._max_wait_ms,
+                "avg_run_ms": self._run_seconds_total * 1000 / completed if completed else 0.0,
+                "max_run_ms": self._max_run_ms,
+            }
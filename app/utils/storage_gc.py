@@ -0,0 +1,173 @@
+import argparse
+import asyncio
+import datetime
+from typing import Iterable, List
+
+from pymongo import InsertOne
+
+from app.setup_rollbar import rollbar_handler
+from app.utils import images
+from app.utils.db import db_instance
+
+# Отложенное удаление объектов хранилища. Обработчики запросов только ставят
+# ключи в очередь (коллекция storage_gc), планировщик удаляет их пачками через
+# remove_objects. Сверка (reconcile) находит объекты, на которые не ссылается
+# ни один пользователь, история, медиафайл или незавершенная загрузка.
+# Вручную: `python -m app.utils.storage_gc collect|reconcile [--dry-run]`.
+
+GC_COLLECTION = "storage_gc"
+GC_BATCH_SIZE = 1000
+GC_MAX_BATCHES = 20
+GC_MAX_ATTEMPTS = 5
+# Удаление откладывается: выданные presigned URL живут до часа
+GC_GRACE = datetime.timedelta(hours=1)
+MEDIA_PREFIXES = ("logos/", "carousel/", "stories/", "media/")
+# Незавершенная прямая загрузка (app/api/uploads.py) считается брошенной задолго
+# до того, как TTL-индекс удалит ее документ вместе с multipart_id
+UPLOAD_STALE_AFTER = datetime.timedelta(hours=6)
+UPLOAD_EXPIRE_BATCH = 200
+
+_stats = {"enqueued": 0, "removed": 0, "failed": 0, "reconciled": 0, "last_collect_at": None}
+
+
+@rollbar_handler
+async def enqueue(object_keys: Iterable[str], delay: datetime.timedelta = GC_GRACE):
+    not_before = datetime.datetime.now() + delay
+    requests = [
+        InsertOne({"key": db_instance.clean_object_key(key), "not_before": not_before, "attempts": 0})
+        for key in object_keys
+        if key
+    ]
+    if requests:
+        await db_instance.db[GC_COLLECTION].bulk_write(requests, ordered=False)
+        _stats["enqueued"] += len(requests)
+
+
+@rollbar_handler
+async def collect() -> int:
+    """Удаляет пачками все ключи очереди, срок которых наступил; возвращает число удаленных ключей."""
+    collection = db_instance.db[GC_COLLECTION]
+    removed = 0
+
+    for _ in range(GC_MAX_BATCHES):
+        batch = (
+            await collection.find({"not_before": {"$lte": datetime.datetime.now()}}, {"key": 1})
+            .limit(GC_BATCH_SIZE)
+            .to_list(length=GC_BATCH_SIZE)
+        )
+        if not batch:
+            break
+
+        # Вместе с ключом удаляются все варианты размера изображения
+        keys = {document["_id"]: images.variant_keys(document["key"]) for document in batch}
+        failed = set(await db_instance.remove_objects([key for variants in keys.values() for key in variants]))
+
+        done = [document_id for document_id, variants in keys.items() if not failed.intersection(variants)]
+        retry = [document_id for document_id in keys if document_id not in done]
+
+        await collection.delete_many({"_id": {"$in": done}})
+        if retry:
+            # Повтор позже; после GC_MAX_ATTEMPTS ключ остается для сверки
+            await collection.update_many(
+                {"_id": {"$in": retry}},
+                {"$inc": {"attempts": 1}, "$set": {"not_before": datetime.datetime.now() + GC_GRACE}},
+            )
+            await collection.delete_many({"_id": {"$in": retry}, "attempts": {"$gte": GC_MAX_ATTEMPTS}})
+
+        removed += len(done)
+        _stats["removed"] += len(done)
+        _stats["failed"] += len(retry)
+        if len(batch) < GC_BATCH_SIZE:
+            break
+
+    _stats["last_collect_at"] = datetime.datetime.now().isoformat()
+    return removed
+
+
+@rollbar_handler
+async def expire_uploads() -> int:
+    """Помечает брошенные загрузки как expired и прерывает их multipart-загрузки;
+    уже загруженные объекты таких загрузок удалит сверка. Возвращает число загрузок."""
+    uploads = db_instance.db["uploads"]
+    threshold = datetime.datetime.now() - UPLOAD_STALE_AFTER
+    expired = 0
+
+    for _ in range(UPLOAD_EXPIRE_BATCH):
+        upload = await uploads.find_one_and_update(
+            {"status": {"$in": ["pending", "completing"]}, "created_at": {"$lt": threshold}},
+            {"$set": {"status": "expired"}},
+            projection={"key": 1, "multipart_id": 1},
+        )
+        if not upload:
+            break
+
+        # Части незавершенной multipart-загрузки не видны в list_objects и без
+        # прерывания хранятся в MinIO бессрочно
+        if upload.get("multipart_id"):
+            try:
+                await db_instance.abort_multipart_upload(upload["key"], upload["multipart_id"])
+            except Exception as e:
+                print(f"Failed to abort multipart upload {upload['key']}: {e}")
+        expired += 1
+
+    return expired
+
+
+async def referenced_keys() -> set:
+    referenced = set()
+
+    async for user in db_instance.db["users"].find({}, {"logo": 1, "photos": 1}):
+        referenced.update([user.get("logo"), *(user.get("photos") or [])])
+    async for story in db_instance.db["stories"].find({}, {"url": 1}):
+        referenced.add(story.get("url"))
+    async for media in db_instance.db["media"].find({}, {"path": 1}):
+        referenced.add(media.get("path"))
+    async for upload in db_instance.db["uploads"].find({"status": {"$nin": ["rejected", "expired"]}}, {"key": 1}):
+        referenced.add(upload.get("key"))
+
+    keys = set()
+    for key in referenced:
+        if key:
+            keys.update(images.variant_keys(db_instance.clean_object_key(key)))
+    return keys
+
+
+@rollbar_handler
+async def reconcile(dry_run: bool = False) -> List[str]:
+    """Ставит в очередь объекты старше GC_GRACE, на которые нет ссылок в базе."""
+    referenced = await referenced_keys()
+    queued = set(await db_instance.db[GC_COLLECTION].distinct("key"))
+    threshold = datetime.datetime.now(datetime.timezone.utc) - GC_GRACE
+
+    orphaned = []
+    for prefix in MEDIA_PREFIXES:
+        for key, last_modified in await db_instance.list_objects(prefix):
+            if key not in referenced and key not in queued and last_modified and last_modified < threshold:
+                orphaned.append(key)
+
+    if not dry_run:
+        await enqueue(orphaned, delay=datetime.timedelta(0))
+        _stats["reconciled"] += len(orphaned)
+    return orphaned
+
+
+async def stats() -> dict:
+    return {**_stats, "queued": await db_instance.db[GC_COLLECTION].estimated_document_count()}
+
+
+async def _main(command: str, dry_run: bool):
+    if command == "collect":
+        print(f"removed {await collect()} object(s)")
+    else:
+        orphaned = await reconcile(dry_run=dry_run)
+        print(f"{'found' if dry_run else 'queued'} {len(orphaned)} orphaned object(s)")
+        for key in orphaned:
+            print(key)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Storage garbage collection")
+    parser.add_argument("command", choices=["collect", "reconcile"])
+    parser.add_argument("--dry-run", action="store_true")
+    arguments = parser.parse_args()
+    asyncio.run(_main(arguments.command, arguments.dry_run))
@@ -0,0 +1,188 @@
+import sys
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from app.models.match import DiscoveryFilters
+from app.utils.discovery import birthdate_bounds, typed_discovery_fields
+
+# Колоночный снимок пользователей в памяти процесса: фильтры поиска выполняются
+# векторными масками NumPy, а из Mongo читаются только выбранные кандидаты.
+# Строится при старте, периодически перестраивается планировщиком и точечно
+# обновляется обработчиками профиля через patch().
+
+MISSING_BIRTH_ORDINAL = np.iinfo(np.int32).min
+MAX_PREFERENCES = 64
+BUILD_BATCH_SIZE = 5000
+
+PROJECTION = {
+    "_id": 0,
+    "isu": 1,
+    "birthdate": 1,
+    "height_cm": 1,
+    "gender": 1,
+    "relationship_pref_ids": 1,
+    "schema_version": 1,
+    "mainFeatures": 1,
+    "relationship_preferences": 1,
+}
+
+
+def _birth_ordinal(birthdate: Optional[datetime]) -> int:
+    return birthdate.toordinal() if birthdate else MISSING_BIRTH_ORDINAL
+
+
+class UserIndex:
+    def __init__(self):
+        self.genders: Dict[str, int] = {"": 0}
+        self.preferences: Dict[str, int] = {}
+        self.ready = False
+        self.last_build_seconds: Optional[float] = None
+        self.built_at: Optional[datetime] = None
+        self._rng = np.random.default_rng()
+        self._allocate(0)
+
+    def _allocate(self, capacity: int):
+        self.size = 0
+        self.positions: Dict[int, int] = {}
+        self.isu = np.zeros(capacity, dtype=np.int64)
+        self.birth = np.full(capacity, MISSING_BIRTH_ORDINAL, dtype=np.int32)
+        self.height = np.full(capacity, np.nan, dtype=np.float32)
+        self.gender = np.zeros(capacity, dtype=np.int8)
+        self.preference_mask = np.zeros(capacity, dtype=np.uint64)
+        self.alive = np.zeros(capacity, dtype=bool)
+
+    def _grow(self):
+        capacity = max(1024, len(self.isu) * 2)
+        for name in ("isu", "birth", "height", "gender", "preference_mask", "alive"):
+            column = getattr(self, name)
+            grown = np.resize(column, capacity)
+            grown[len(column) :] = {"birth": MISSING_BIRTH_ORDINAL, "height": np.nan}.get(name, 0)
+            setattr(self, name, grown)
+
+    def _row(self, isu: int) -> int:
+        row = self.positions.get(isu)
+        if row is None:
+            if self.size == len(self.isu):
+                self._grow()
+            row = self.size
+            self.size += 1
+            self.positions[isu] = row
+            self.isu[row] = isu
+            self.alive[row] = True
+        return row
+
+    def _gender_code(self, gender: str) -> int:
+        return self.genders.setdefault((gender or "").lower(), len(self.genders))
+
+    def _preference_mask(self, preference_ids: Iterable[str]) -> int:
+        mask = 0
+        for preference_id in preference_ids:
+            bit = self.preferences.setdefault(preference_id, len(self.preferences))
+            if bit < MAX_PREFERENCES:
+                mask |= 1 << bit
+        return mask
+
+    def load(self, users: Iterable[dict]):
+        isus, births, heights, genders, masks = [], [], [], [], []
+        for user in users:
+            fields = user if user.get("schema_version") else {**user, **typed_discovery_fields(user)}
+            isus.append(user["isu"])
+            births.append(_birth_ordinal(fields.get("birthdate")))
+            heights.append(np.nan if fields.get("height_cm") is None else fields["height_cm"])
+            genders.append(self._gender_code(fields.get("gender")))
+            masks.append(self._preference_mask(fields.get("relationship_pref_ids") or []))
+
+        self._allocate(0)
+        self.isu = np.array(isus, dtype=np.int64)
+        self.birth = np.array(births, dtype=np.int32)
+        self.height = np.array(heights, dtype=np.float32)
+        self.gender = np.array(genders, dtype=np.int8)
+        self.preference_mask = np.array(masks, dtype=np.uint64)
+        self.alive = np.ones(len(isus), dtype=bool)
+        self.size = len(isus)
+        self.positions = {isu: row for row, isu in enumerate(isus)}
+
+    async def build(self, collection):
+        started = time.perf_counter()
+        users = await collection.find({}, PROJECTION).batch_size(BUILD_BATCH_SIZE).to_list(length=None)
+
+        # Снимок собирается отдельно и подменяется целиком
+        fresh = UserIndex()
+        fresh.load(users)
+        self.__dict__.update(fresh.__dict__)
+
+        self.ready = True
+        self.last_build_seconds = time.perf_counter() - started
+        self.built_at = datetime.now()
+        print(f"User index built: {self.size} user(s) in {self.last_build_seconds:.2f}s")
+
+    def patch(self, isu: int, **fields):
+        if not self.ready:
+            return
+
+        row = self._row(isu)
+        if "birthdate" in fields:
+            self.birth[row] = _birth_ordinal(fields["birthdate"])
+        if "height_cm" in fields:
+            self.height[row] = np.nan if fields["height_cm"] is None else fields["height_cm"]
+        if "gender" in fields:
+            self.gender[row] = self._gender_code(fields["gender"])
+        if "relationship_pref_ids" in fields:
+            self.preference_mask[row] = self._preference_mask(fields["relationship_pref_ids"])
+
+    def remove(self, isu: int):
+        row = self.positions.get(isu)
+        if row is not None:
+            self.alive[row] = False
+
+    def sample(self, user_id: int, filters: DiscoveryFilters, seen, size: int) -> List[int]:
+        n = self.size
+        isu = self.isu[:n]
+        mask = self.alive[:n] & (isu != user_id)
+
+        bounds = birthdate_bounds(filters.min_age, filters.max_age)
+        birth = self.birth[:n]
+        mask &= (birth > bounds["$gt"].toordinal()) & (birth <= bounds["$lte"].toordinal())
+
+        if filters.gender.lower() != "everyone":
+            code = self.genders.get(filters.gender.lower())
+            if code is None:
+                return []
+            mask &= self.gender[:n] == code
+
+        if filters.min_height is not None and filters.max_height is not None:
+            height = self.height[:n]
+            mask &= (height >= filters.min_height) & (height <= filters.max_height)
+
+        if filters.relationship_preferences:
+            wanted = 0
+            for preference_id in filters.relationship_preferences:
+                bit = self.preferences.get(preference_id)
+                if bit is not None and bit < MAX_PREFERENCES:
+                    wanted |= 1 << bit
+            mask &= (self.preference_mask[:n] & np.uint64(wanted)) != 0
+
+        if len(seen):
+            mask &= ~np.isin(isu, np.frombuffer(seen, dtype=np.int64))
+
+        rows = np.flatnonzero(mask)
+        if len(rows) > size:
+            rows = self._rng.choice(rows, size=size, replace=False)
+        return isu[rows].tolist()
+
+    def stats(self) -> dict:
+        columns = (self.isu, self.birth, self.height, self.gender, self.preference_mask, self.alive)
+        return {
+            "ready": self.ready,
+            "users": int(self.alive[: self.size].sum()),
+            "column_bytes": sum(column.nbytes for column in columns),
+            "positions_bytes": sys.getsizeof(self.positions),
+            "last_build_seconds": self.last_build_seconds,
+            "built_at": self.built_at.isoformat() if self.built_at else None,
+        }
+
+
+user_index = UserIndex()
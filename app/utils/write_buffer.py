@@ -0,0 +1,124 @@
+import asyncio
+import time
+from typing import Callable, List, Optional
+
+
+class WriteBehindBuffer:
+    """Накапливает документы некритичных взаимодействий (дизлайки и т.п.)
+    и записывает их пачками через insert_many - раз в flush_interval секунд
+    или как только набралось max_batch_size документов."""
+
+    def __init__(
+        self,
+        name: str,
+        get_collection: Callable,
+        max_batch_size: int = 500,
+        flush_interval: float = 0.05,
+        max_pending: int = 10_000,
+    ):
+        self.name = name
+        self.get_collection = get_collection
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        self._pending: List[dict] = []
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+        self._events = 0
+        self._flushes = 0
+        self._failed_flushes = 0
+        self._dropped = 0
+        self._flushed_documents = 0
+        self._last_batch_size = 0
+        self._max_batch_size_seen = 0
+        self._flush_seconds_total = 0.0
+        self._last_flush_ms = 0.0
+        self._max_flush_ms = 0.0
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._task is not None and not self._task.done() and self._task.get_loop() is loop:
+            return
+
+        self._wake = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task = loop.create_task(self._run())
+
+    async def add(self, document: dict):
+        self._ensure_started()
+        self._pending.append(document)
+        self._events += 1
+
+        if len(self._pending) >= self.max_pending:
+            # Ограничение памяти: если фон не успевает, пишет сам вызывающий
+            await self.flush()
+        elif len(self._pending) >= self.max_batch_size:
+            self._wake.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            # shield: отмена при остановке не должна терять уже снятую из очереди пачку
+            await asyncio.shield(self.flush())
+
+    async def flush(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            while self._pending:
+                batch = self._pending[: self.max_batch_size]
+                del self._pending[: len(batch)]
+
+                started = time.perf_counter()
+                try:
+                    await self.get_collection().insert_many(batch, ordered=False)
+                except Exception as e:
+                    self._failed_flushes += 1
+                    # Возвращаем пачку в начало очереди, не превышая max_pending
+                    room = max(0, self.max_pending - len(self._pending))
+                    self._dropped += len(batch) - min(room, len(batch))
+                    self._pending[:0] = batch[:room]
+                    print(f"{self.name} write buffer flush failed: {e}")
+                    return
+
+                elapsed = time.perf_counter() - started
+                self._flushes += 1
+                self._flushed_documents += len(batch)
+                self._last_batch_size = len(batch)
+                self._max_batch_size_seen = max(self._max_batch_size_seen, len(batch))
+                self._flush_seconds_total += elapsed
+                self._last_flush_ms = elapsed * 1000
+                self._max_flush_ms = max(self._max_flush_ms, self._last_flush_ms)
+
+    async def close(self):
+        if self._task is not None and self._task.get_loop() is asyncio.get_running_loop():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "events": self._events,
+            "pending": len(self._pending),
+            "flushes": self._flushes,
+            "failed_flushes": self._failed_flushes,
+            "dropped": self._dropped,
+            "last_batch_size": self._last_batch_size,
+            "max_batch_size": self._max_batch_size_seen,
+            "avg_batch_size": self._flushed_documents / self._flushes if self._flushes else 0.0,
+            "last_flush_ms": self._last_flush_ms,
+            "max_flush_ms": self._max_flush_ms,
+            "avg_flush_ms": self._flush_seconds_total * 1000 / self._flushes if self._flushes else 0.0,
+        }
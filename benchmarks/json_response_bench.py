@@ -0,0 +1,114 @@
+import json
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Any
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+
+from app.utils.fast_json import dumps
+
+# python -m benchmarks.json_response_bench
+# Прежний путь ответа (рекурсивный serialize + jsonable_encoder + json.dumps)
+# против FastJSONResponse (orjson с хуком для ObjectId) на профиле и списке чатов.
+
+CHATS = 200
+ROUNDS = 500
+
+
+def legacy_serialize(obj: Any) -> Any:
+    # Бывший app.utils.serializer.serialize
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    elif isinstance(obj, list):
+        return [legacy_serialize(item) for item in obj]
+    elif isinstance(obj, dict):
+        return {key: legacy_serialize(value) for key, value in obj.items()}
+    else:
+        return obj
+
+
+def legacy_render(content: Any) -> bytes:
+    # Starlette JSONResponse.render после jsonable_encoder FastAPI
+    return json.dumps(
+        jsonable_encoder(legacy_serialize(content)), ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def make_profile(isu: int) -> dict:
+    return {
+        "_id": ObjectId(),
+        "isu": isu,
+        "username": f"user_{isu}",
+        "bio": "Люблю матанализ и длинные прогулки по Кронверкскому " * 3,
+        "logo": f"https://storage.example/meet/logos/{isu}_thumb.webp?X-Amz-Signature={'a' * 64}",
+        "photos": [
+            f"https://storage.example/meet/carousel/{isu}_{i}_card.webp?X-Amz-Signature={'b' * 64}" for i in range(5)
+        ],
+        "mainFeatures": [
+            {"text": "180 cm", "icon": "height"},
+            {"text": "Leo", "icon": "zodiac_sign"},
+            {"text": "70 kg", "icon": "weight"},
+            {"text": "male", "icon": "gender"},
+            {"text": "2003-04-01", "icon": "birthdate"},
+            {"text": "Liberal", "icon": "worldview"},
+            {"text": "No", "icon": "children"},
+            [{"text": "English", "icon": "languages"}, {"text": "Russian", "icon": "languages"}],
+            {"text": "No", "icon": "alcohol"},
+            {"text": "No", "icon": "smoking"},
+        ],
+        "interests": [{"text": f"tag_{i}", "icon": "tag"} for i in range(8)],
+        "itmo": [{"text": "ФИТиП", "icon": "faculty"}, {"text": "3", "icon": "course"}],
+        "gender_preferences": [{"text": "Female", "icon": "gender_preferences"}],
+        "relationship_preferences": [
+            {"id": str(ObjectId()), "text": "Friendship", "icon": "relationship_preferences"}
+        ],
+        "isStudent": True,
+        "version": 12,
+    }
+
+
+def make_chat(isu: int) -> dict:
+    now = datetime.now()
+    return {
+        "_id": ObjectId(),
+        "chat_id": str(ObjectId()),
+        "isu_1": isu,
+        "isu_2": random.randint(100000, 400000),
+        "created_at": now - timedelta(days=random.randint(0, 300)),
+        "last_message": {
+            "_id": ObjectId(),
+            "sender_id": isu,
+            "text": "Привет! Пойдем на кофе после пары?",
+            "created_at": now - timedelta(minutes=random.randint(0, 10_000)),
+        },
+    }
+
+
+def measure(render, payload) -> float:
+    timings = []
+    for _ in range(ROUNDS):
+        started = time.perf_counter()
+        render(payload)
+        timings.append((time.perf_counter() - started) * 1_000_000)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def main():
+    random.seed(0)
+    payloads = {
+        "profile": {"profile": make_profile(123456)},
+        f"chat list ({CHATS})": {"chats": [make_chat(123456) for _ in range(CHATS)]},
+    }
+
+    for name, payload in payloads.items():
+        assert json.loads(legacy_render(payload)) == json.loads(dumps(payload))
+        legacy = measure(legacy_render, payload)
+        fast = measure(dumps, payload)
+        print(f"{name}: legacy {legacy:.1f} us, orjson {fast:.1f} us, x{legacy / fast:.1f}")
+
+
+if __name__ == "__main__":
+    main()
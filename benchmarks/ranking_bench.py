@@ -0,0 +1,101 @@
+import random
+import time
+from datetime import datetime, timedelta
+
+from app.utils.ranking import CompatibilityRanker, top_k
+
+# python -m benchmarks.ranking_bench
+# Меряется путь запроса целиком - CompatibilityRanker.rank (сборка признаков,
+# скоринг, top-K) - на холодном кэше признаков и на прогретом, а также отдельно
+# скоринг и выбор top-K.
+#
+# Для 5000 кандидатов в 1 мс укладываются только скоринг и top-K (медиана около
+# 0.5-0.7 мс). Полный rank, которым пользуется /random_people, занимает около 8-9 мс
+# на прогретом кэше (ключи кэша и матрица тестов собираются по словарям кандидатов
+# в Python) и около 50-60 мс на холодном. Превышение бюджетов ниже завершает
+# бенчмарк с ошибкой.
+
+CANDIDATES = 5000
+TOP_K = 10
+ROUNDS = 200
+
+SCORE_BUDGET_MS = 1.0
+WARM_RANK_BUDGET_MS = 15.0
+COLD_RANK_BUDGET_MS = 100.0
+
+
+def make_user(isu: int, tags: list, preferences: list, faculties: list) -> dict:
+    return {
+        "isu": isu,
+        "birthdate": datetime(2000, 1, 1) + timedelta(days=random.randint(0, 3650)),
+        "interests": [{"text": tag, "icon": "tag"} for tag in random.sample(tags, 3)],
+        "relationship_preferences": [{"id": pref} for pref in random.sample(preferences, 2)],
+        "itmo": [
+            {"text": random.choice(faculties), "icon": "faculty"},
+            {"text": str(random.randint(1, 6)), "icon": "course"},
+        ],
+    }
+
+
+def median(timings: list) -> float:
+    return sorted(timings)[len(timings) // 2]
+
+
+def summary(timings: list) -> str:
+    timings = sorted(timings)
+    return f"median {median(timings):.3f} ms, p95 {timings[int(len(timings) * 0.95)]:.3f} ms"
+
+
+def main():
+    random.seed(0)
+    tags = [f"Tag {i}" for i in range(40)]
+    preferences = [f"pref_{i}" for i in range(4)]
+    faculties = [f"Faculty {i}" for i in range(12)]
+
+    users = [make_user(100000 + i, tags, preferences, faculties) for i in range(CANDIDATES + 1)]
+    quiz_scores = {
+        user["isu"]: {f"test_{t}": random.uniform(0, 100) for t in range(5) if random.random() < 0.5}
+        for user in users
+    }
+
+    ranker = CompatibilityRanker()
+    user, candidates = users[0], users[1:]
+
+    started = time.perf_counter()
+    ranker.rank(user, candidates, quiz_scores, TOP_K)
+    cold_ms = (time.perf_counter() - started) * 1000
+
+    rank_timings = []
+    for _ in range(ROUNDS):
+        started = time.perf_counter()
+        ranker.rank(user, candidates, quiz_scores, TOP_K)
+        rank_timings.append((time.perf_counter() - started) * 1000)
+
+    features = ranker.encode(users, quiz_scores)
+    user_features, candidate_features = features.take(0), features.take(slice(1, None))
+    score_timings = []
+    for _ in range(ROUNDS):
+        started = time.perf_counter()
+        top_k(ranker.score(user_features, candidate_features), TOP_K)
+        score_timings.append((time.perf_counter() - started) * 1000)
+
+    print(f"candidates: {CANDIDATES}, top-k: {TOP_K}, rounds: {ROUNDS}")
+    print(f"rank, cold feature cache: {cold_ms:.2f} ms")
+    print(f"rank, warm feature cache: {summary(rank_timings)}")
+    print(f"score + top-k: {summary(score_timings)}")
+
+    over_budget = [
+        f"{name}: {measured:.3f} ms > {budget} ms"
+        for name, measured, budget in (
+            ("score + top-k median", median(score_timings), SCORE_BUDGET_MS),
+            ("warm rank median", median(rank_timings), WARM_RANK_BUDGET_MS),
+            ("cold rank", cold_ms, COLD_RANK_BUDGET_MS),
+        )
+        if measured > budget
+    ]
+    if over_budget:
+        raise SystemExit("over budget: " + "; ".join(over_budget))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import random
+import time
+from array import array
+from datetime import datetime, timedelta
+
+from app.models.match import DiscoveryFilters
+from app.utils.user_index import UserIndex
+
+# python -m benchmarks.user_index_bench
+# Размер снимка в памяти, время перестройки и фильтрации для 100k+ пользователей.
+
+USERS = 150_000
+SEEN = 2_000
+ROUNDS = 200
+
+
+def make_user(isu: int, preferences: list) -> dict:
+    return {
+        "isu": isu,
+        "birthdate": datetime(1985, 1, 1) + timedelta(days=random.randint(0, 7300)),
+        "height_cm": float(random.randint(150, 200)),
+        "gender": random.choice(["male", "female"]),
+        "relationship_pref_ids": random.sample(preferences, 2),
+        "schema_version": 2,
+    }
+
+
+def main():
+    random.seed(0)
+    preferences = [f"pref_{i}" for i in range(4)]
+    users = [make_user(100000 + i, preferences) for i in range(USERS)]
+    seen = array("q", sorted(random.sample([user["isu"] for user in users], SEEN)))
+
+    index = UserIndex()
+    started = time.perf_counter()
+    index.load(users)
+    load_ms = (time.perf_counter() - started) * 1000
+
+    filters = DiscoveryFilters(
+        gender="female", min_age=20, max_age=25, min_height=160, max_height=180, relationship_preferences=["pref_1"]
+    )
+    timings = []
+    for _ in range(ROUNDS):
+        started = time.perf_counter()
+        index.sample(100000, filters, seen, 10)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    timings.sort()
+    stats = index.stats()
+    print(f"users: {stats['users']}, seen: {SEEN}, rounds: {ROUNDS}")
+    print(f"columns: {stats['column_bytes'] / 2**20:.2f} MiB, isu -> row map: {stats['positions_bytes'] / 2**20:.2f} MiB")
+    print(f"rebuild from documents: {load_ms:.1f} ms")
+    print(f"filter + sample: median {timings[len(timings) // 2]:.3f} ms, p95 {timings[int(len(timings) * 0.95)]:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import asyncio
 from unittest.mock import AsyncMock, patch
 
 import pytest
@@ -38,18 +39,21 @@ def mock_user_info():
 def mock_dependencies():
     with patch("app.api.auth.generate_code_verifier") as mock_verifier, patch(
         "app.api.auth.get_code_challenge"
-    ) as mock_challenge, patch("app.api.auth.ClientSession") as mock_session, patch(
-        "app.utils.db.db_instance"
-    ) as mock_db_instance, patch("app.api.auth.fill_user_info", new_callable=AsyncMock) as mock_fill_user_info:
+    ) as mock_challenge, patch("app.api.auth.http_clients") as mock_http_clients, patch(
+        "app.api.auth.db_instance"
+    ) as mock_db_instance, patch("app.api.auth.fill_user_info", new_callable=AsyncMock) as mock_fill_user_info, patch(
+        "app.api.auth.schedule_refresh.enqueue", new_callable=AsyncMock
+    ) as mock_enqueue_schedule:
         mock_verifier.return_value = "test_code_verifier"
         mock_challenge.return_value = "test_code_challenge"
 
         yield {
             "mock_verifier": mock_verifier,
             "mock_challenge": mock_challenge,
-            "mock_session": mock_session,
+            "mock_http_clients": mock_http_clients,
             "mock_db_instance": mock_db_instance,
             "mock_fill_user_info": mock_fill_user_info,
+            "mock_enqueue_schedule": mock_enqueue_schedule,
         }
 
 
@@ -69,8 +73,7 @@ def test_get_code_challenge():
 @pytest.mark.asyncio
 async def test_login_with_password_success(mock_user_info, mock_dependencies):
     session_instance = AsyncMock()
-    mock_dependencies["mock_session"].return_value.__aenter__.return_value = session_instance
-    mock_dependencies["mock_session"].return_value.__aexit__.return_value = AsyncMock()
+    mock_dependencies["mock_http_clients"].get.return_value = session_instance
 
     auth_resp = AsyncMock()
     auth_resp.status = 200
@@ -108,15 +111,16 @@ async def test_login_with_password_success(mock_user_info, mock_dependencies):
     assert isinstance(response, dict)
     assert response["redirect"] == "/auth/dashboard"
     assert response["isu"] == mock_user_info["isu"]
+    mock_dependencies["mock_enqueue_schedule"].assert_awaited_once_with(mock_user_info["isu"], "test_access_token")
 
 
 @pytest.mark.asyncio
 async def test_login_with_password_invalid_credentials(mock_user_info, mock_dependencies):
-    mock_session = mock_dependencies["mock_session"]
+    mock_http_clients = mock_dependencies["mock_http_clients"]
     mock_fill_user_info = mock_dependencies["mock_fill_user_info"]
 
     session_instance = AsyncMock()
-    mock_session.return_value.__aenter__.return_value = session_instance
+    mock_http_clients.get.return_value = session_instance
 
     auth_resp = AsyncMock()
     auth_resp.status = 200
@@ -137,17 +141,53 @@ async def test_login_with_password_invalid_credentials(mock_user_info, mock_depe
 
     assert exc_info.value.status_code == 401
     assert exc_info.value.detail == "Login failed with provided credentials"
+    form_resp.release.assert_awaited_once()
 
     mock_fill_user_info.assert_not_called()
 
 
+@pytest.mark.asyncio
+async def test_login_with_password_user_info_failure_releases_response(mock_user_info, mock_dependencies):
+    session_instance = AsyncMock()
+    mock_dependencies["mock_http_clients"].get.return_value = session_instance
+
+    auth_resp = AsyncMock()
+    auth_resp.status = 200
+    auth_resp.text.return_value = f'<form method="post" action="{PROVIDER_URL}"></form>'
+    auth_resp.cookies = {"some_cookie": "cookie_value"}
+
+    form_resp = AsyncMock()
+    form_resp.status = 302
+    form_resp.headers = {"Location": f"{REDIRECT_URI}?code=auth_code_value"}
+
+    token_resp = AsyncMock()
+    token_resp.status = 200
+    token_resp.json.return_value = {"access_token": "test_access_token"}
+
+    user_resp = AsyncMock()
+    user_resp.status = 503
+
+    session_instance.get.side_effect = [auth_resp, user_resp]
+    session_instance.post.side_effect = [form_resp, token_resp]
+
+    credentials = LoginRequest(username="test_user", password="test_password")
+
+    with pytest.raises(HTTPException) as exc_info:
+        await login_with_password(credentials)
+
+    assert exc_info.value.status_code == 503
+    user_resp.release.assert_awaited_once()
+    user_resp.json.assert_not_called()
+    mock_dependencies["mock_fill_user_info"].assert_not_called()
+
+
 @pytest.mark.asyncio
 async def test_login_with_password_form_action_not_found(mock_user_info, mock_dependencies):
-    mock_session = mock_dependencies["mock_session"]
+    mock_http_clients = mock_dependencies["mock_http_clients"]
     mock_fill_user_info = mock_dependencies["mock_fill_user_info"]
 
     session_instance = AsyncMock()
-    mock_session.return_value.__aenter__.return_value = session_instance
+    mock_http_clients.get.return_value = session_instance
 
     auth_resp = AsyncMock()
     auth_resp.status = 200
@@ -166,3 +206,25 @@ async def test_login_with_password_form_action_not_found(mock_user_info, mock_de
     assert exc_info.value.detail == "Failed to find form action for login"
 
     mock_fill_user_info.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_logins_share_one_flow():
+    release = asyncio.Event()
+    result = {"redirect": "/auth/dashboard", "isu": 386871}
+
+    async def slow_authenticate(username, password):
+        await release.wait()
+        return result
+
+    with patch("app.api.auth.authenticate", AsyncMock(side_effect=slow_authenticate)) as mock_authenticate:
+        same = [login_with_password(LoginRequest(username="user", password="secret")) for _ in range(3)]
+        other = login_with_password(LoginRequest(username="user", password="other"))
+        tasks = [asyncio.create_task(call) for call in [*same, other]]
+        await asyncio.sleep(0)
+        release.set()
+        responses = await asyncio.gather(*tasks)
+
+    assert responses == [result] * 4
+    # Разные пароли не объединяются
+    assert mock_authenticate.await_count == 2
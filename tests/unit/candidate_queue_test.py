@@ -0,0 +1,91 @@
+from array import array
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from app.models.match import DiscoveryFilters
+from app.utils import candidate_queue
+from app.utils.db import db_instance
+
+
+@pytest.mark.asyncio
+async def test_pop_candidate_returns_head_of_queue():
+    filters = DiscoveryFilters()
+    mock_queues = MagicMock()
+    mock_queues.find_one_and_update = AsyncMock(return_value={"candidates": list(range(1, 20))})
+
+    mock_db = MagicMock()
+    mock_db.__getitem__.return_value = mock_queues
+
+    with patch.object(db_instance, "db", mock_db), patch.object(candidate_queue, "schedule_refill") as mock_refill:
+        candidate = await candidate_queue.pop_candidate(123456, filters)
+
+    assert candidate == 1
+    mock_refill.assert_not_called()
+    query = mock_queues.find_one_and_update.call_args.args[0]
+    assert query["user_id"] == 123456
+    assert query["filters_key"] == filters.cache_key()
+
+
+@pytest.mark.asyncio
+async def test_pop_candidate_schedules_refill_when_low():
+    filters = DiscoveryFilters()
+    mock_queues = MagicMock()
+    mock_queues.find_one_and_update = AsyncMock(return_value={"candidates": [42, 43]})
+
+    mock_db = MagicMock()
+    mock_db.__getitem__.return_value = mock_queues
+
+    with patch.object(db_instance, "db", mock_db), patch.object(candidate_queue, "schedule_refill") as mock_refill:
+        candidate = await candidate_queue.pop_candidate(123456, filters)
+
+    assert candidate == 42
+    mock_refill.assert_called_once_with(123456, filters)
+
+
+@pytest.mark.asyncio
+async def test_pop_candidate_empty_queue():
+    filters = DiscoveryFilters()
+    mock_queues = MagicMock()
+    mock_queues.find_one_and_update = AsyncMock(return_value=None)
+
+    mock_db = MagicMock()
+    mock_db.__getitem__.return_value = mock_queues
+
+    with patch.object(db_instance, "db", mock_db), patch.object(candidate_queue, "schedule_refill") as mock_refill:
+        candidate = await candidate_queue.pop_candidate(123456, filters)
+
+    assert candidate is None
+    mock_refill.assert_called_once_with(123456, filters)
+
+
+@pytest.mark.asyncio
+async def test_refill_queue_excludes_seen_and_queued():
+    filters = DiscoveryFilters()
+
+    mock_queues = MagicMock()
+    mock_queues.find_one = AsyncMock(return_value={"candidates": [7]})
+    mock_queues.update_one = AsyncMock()
+
+    mock_users_cursor = MagicMock()
+    mock_users_cursor.to_list = AsyncMock(return_value=[{"isu": 5}, {"isu": 8}, {"isu": 9}])
+    mock_users = MagicMock()
+    mock_users.aggregate.return_value = mock_users_cursor
+
+    mock_db = MagicMock()
+    mock_db.__getitem__.side_effect = lambda name: {
+        candidate_queue.QUEUE_COLLECTION: mock_queues,
+        "users": mock_users,
+    }[name]
+
+    with patch.object(db_instance, "db", mock_db), patch.object(
+        candidate_queue.seen_set, "get_seen", AsyncMock(return_value=array("q", [5]))
+    ):
+        added = await candidate_queue.refill_queue(123456, filters, batch_size=2)
+
+    assert added == 2
+    pipeline = mock_users.aggregate.call_args.args[0]
+    assert pipeline[0]["$match"]["isu"]["$nin"] == [7]
+    assert pipeline[-2] == {"$sample": {"size": 3}}
+    update = mock_queues.update_one.call_args.args[1]
+    assert update["$push"]["candidates"] == {"$each": [8, 9]}
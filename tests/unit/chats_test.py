@@ -28,11 +28,14 @@ async def test_create_chat_success():
     payload = CreateChat(isu_1=123456, isu_2=789012)
 
     with patch("app.api.chats.db_instance.create_chat", new_callable=AsyncMock) as mock_create_chat:
+        mock_create_chat.return_value = "existing_chat"
         result = await create_chat(payload)
-        assert "chat_id" in result
-        assert isinstance(result["chat_id"], str)
 
-        mock_create_chat.assert_awaited_once_with(chat_id=result["chat_id"], isu_1=payload.isu_1, isu_2=payload.isu_2)
+        # Для пары, у которой уже есть чат, возвращается его chat_id
+        assert result == {"chat_id": "existing_chat"}
+        kwargs = mock_create_chat.call_args.kwargs
+        assert isinstance(kwargs["chat_id"], str)
+        assert (kwargs["isu_1"], kwargs["isu_2"]) == (payload.isu_1, payload.isu_2)
 
 
 @pytest.mark.asyncio
@@ -1,7 +1,10 @@
+import asyncio
+import io
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 from bson import ObjectId
+from minio.deleteobjects import DeleteError
 
 from app.utils.db import Database
 
@@ -347,12 +350,13 @@ def db_instance_for_minio():
     return db
 
 
-def test_upload_file_to_minio(db_instance_for_minio):
+@pytest.mark.asyncio
+async def test_upload_file_to_minio(db_instance_for_minio):
     data = b"something"
     filename = "test.txt"
     content_type = "text/plain"
 
-    result = db_instance_for_minio.upload_file_to_minio(data, filename, content_type)
+    result = await db_instance_for_minio.upload_file_to_minio(data, filename, content_type)
 
     db_instance_for_minio.minio_instance.put_object.assert_called_once_with(
         db_instance_for_minio.minio_bucket_name,
@@ -366,11 +370,119 @@ def test_upload_file_to_minio(db_instance_for_minio):
     assert result == f"{db_instance_for_minio.minio_bucket_name}/{filename}"
 
 
-def test_uplod_json_to_minio(db_instance_for_minio):
+@pytest.mark.asyncio
+async def test_remove_object_strips_bucket_prefix(db_instance_for_minio):
+    db = db_instance_for_minio
+
+    await db.remove_object(f"{db.minio_bucket_name}/carousel/1.png")
+
+    db.minio_instance.remove_object.assert_called_once_with(db.minio_bucket_name, "carousel/1.png")
+    assert db.storage.stats()["completed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_upload_media_file_stores_image_variants(db_instance_for_minio):
+    db = db_instance_for_minio
+    variants = {"thumb": b"t", "card": b"c", "full": b"f"}
+    upload = io.BytesIO(b"image bytes")
+
+    with patch("app.utils.db.images.render_variants", AsyncMock(return_value=variants)):
+        key = await db.upload_media_file(upload, "carousel/1_abc", "jpg", "image/jpeg")
+
+    assert key == f"{db.minio_bucket_name}/carousel/1_abc_full.webp"
+    uploaded = sorted(call.args[1] for call in db.minio_instance.put_object.call_args_list)
+    assert uploaded == ["carousel/1_abc_card.webp", "carousel/1_abc_full.webp", "carousel/1_abc_thumb.webp"]
+    assert all(call.kwargs["content_type"] == "image/webp" for call in db.minio_instance.put_object.call_args_list)
+
+
+@pytest.mark.asyncio
+async def test_upload_media_file_keeps_other_files_as_is(db_instance_for_minio):
+    db = db_instance_for_minio
+    upload = io.BytesIO(b"not an image")
+
+    video_key = await db.upload_media_file(upload, "media/chat/1_abc", "mp4", "video/mp4")
+    broken_key = await db.upload_media_file(io.BytesIO(b"broken"), "logos/1_abc", "png", "image/png")
+
+    assert video_key == f"{db.minio_bucket_name}/media/chat/1_abc.mp4"
+    assert broken_key == f"{db.minio_bucket_name}/logos/1_abc.png"
+    assert db.minio_instance.put_object.call_args_list[0].args[2] is upload
+
+
+@pytest.mark.asyncio
+async def test_upload_media_files_bounds_concurrency_and_rolls_back(db_instance_for_minio):
+    db = db_instance_for_minio
+    db.upload_concurrency = 2
+    running = 0
+    max_running = 0
+
+    async def fake_upload(file, base_name, extension, content_type):
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        if base_name == "bad":
+            raise RuntimeError("upload failed")
+        return f"bucket/{base_name}.{extension}"
+
+    uploads = [(None, f"photo{i}", "jpg", "image/jpeg") for i in range(5)]
+    with patch.object(db, "upload_media_file", side_effect=fake_upload), patch.object(
+        db, "remove_object", AsyncMock()
+    ) as mock_remove:
+        keys = await db.upload_media_files(uploads)
+        assert keys == [f"bucket/photo{i}.jpg" for i in range(5)]
+        assert max_running == 2
+        mock_remove.assert_not_called()
+
+        with pytest.raises(RuntimeError):
+            await db.upload_media_files([*uploads[:2], (None, "bad", "jpg", "image/jpeg")])
+
+    assert sorted(call.args[0] for call in mock_remove.call_args_list) == ["bucket/photo0.jpg", "bucket/photo1.jpg"]
+
+
+@pytest.mark.asyncio
+async def test_remove_object_removes_image_variants(db_instance_for_minio):
+    db = db_instance_for_minio
+
+    await db.remove_object(f"{db.minio_bucket_name}/carousel/1_abc_full.webp")
+
+    removed = [call.args[1] for call in db.minio_instance.remove_object.call_args_list]
+    assert removed == ["carousel/1_abc_thumb.webp", "carousel/1_abc_card.webp", "carousel/1_abc_full.webp"]
+
+
+@pytest.mark.asyncio
+async def test_remove_objects_returns_failed_keys(db_instance_for_minio):
+    db = db_instance_for_minio
+    db.minio_instance.remove_objects.return_value = iter([DeleteError("AccessDenied", "Access Denied", "b.png", None)])
+
+    failed = await db.remove_objects(["a.png", "b.png"])
+
+    assert failed == ["b.png"]
+    bucket, objects = db.minio_instance.remove_objects.call_args.args
+    assert bucket == db.minio_bucket_name
+    assert [obj._name for obj in objects] == ["a.png", "b.png"]
+
+
+def test_presign_many_reuses_cached_urls(db_instance_for_minio):
+    db = db_instance_for_minio
+    db.minio_instance.presigned_get_object.side_effect = lambda bucket, key, expires: f"signed/{key}"
+    logo = f"{db.minio_bucket_name}/logos/1.png"
+
+    first = db.presign_many([logo, "photos/1.png", logo])
+    second = db.presign_many(["photos/1.png"])
+
+    assert first == {logo: "signed/logos/1.png", "photos/1.png": "signed/photos/1.png"}
+    assert second == {"photos/1.png": "signed/photos/1.png"}
+    assert db.minio_instance.presigned_get_object.call_count == 2
+    assert db.presign_cache.stats()["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_uplod_json_to_minio(db_instance_for_minio):
     data = {"key": "value"}
     filename = "test.json"
 
-    result = db_instance_for_minio.uplod_json_to_minio(data, filename)
+    result = await db_instance_for_minio.uplod_json_to_minio(data, filename)
 
     args, kwargs = db_instance_for_minio.minio_calendar_instance.put_object.call_args
     assert args[0] == db_instance_for_minio.minio_calendar_bucket_name
@@ -380,7 +492,8 @@ def test_uplod_json_to_minio(db_instance_for_minio):
     assert result == f"{db_instance_for_minio.minio_calendar_bucket_name}/{filename}"
 
 
-def test_get_json_from_minio_success(db_instance_for_minio):
+@pytest.mark.asyncio
+async def test_get_json_from_minio_success(db_instance_for_minio):
     filename = "schedule_123.json"
     mock_json_data = {"a": "b"}
 
@@ -393,7 +506,7 @@ def test_get_json_from_minio_success(db_instance_for_minio):
     db_instance_for_minio.minio_calendar_instance.get_object.return_value = mock_response
 
     with patch("json.load", side_effect=mock_json_load):
-        result = db_instance_for_minio.get_json_from_minio(filename)
+        result = await db_instance_for_minio.get_json_from_minio(filename)
 
     db_instance_for_minio.minio_calendar_instance.get_object.assert_called_once_with(
         db_instance_for_minio.minio_calendar_bucket_name,
@@ -405,21 +518,23 @@ def test_get_json_from_minio_success(db_instance_for_minio):
     assert result == mock_json_data
 
 
-def test_get_json_from_minio_failure(db_instance_for_minio):
+@pytest.mark.asyncio
+async def test_get_json_from_minio_failure(db_instance_for_minio):
     filename = "no.json"
 
     db_instance_for_minio.minio_calendar_instance.get_object.side_effect = Exception("File not found")
 
     with pytest.raises(ValueError) as exc_info:
-        db_instance_for_minio.get_json_from_minio(filename)
+        await db_instance_for_minio.get_json_from_minio(filename)
 
     assert "Failed to get json calendar from minio: File not found" in str(exc_info.value)
 
 
-def test_delete_json_from_minio_success(db_instance_for_minio):
+@pytest.mark.asyncio
+async def test_delete_json_from_minio_success(db_instance_for_minio):
     filename = "test.json"
 
-    db_instance_for_minio.delete_json_from_minio(filename)
+    await db_instance_for_minio.delete_json_from_minio(filename)
 
     db_instance_for_minio.minio_calendar_instance.remove_object.assert_called_once_with(
         db_instance_for_minio.minio_calendar_bucket_name,
@@ -427,12 +542,91 @@ def test_delete_json_from_minio_success(db_instance_for_minio):
     )
 
 
-def test_delete_json_from_minio_failure(db_instance_for_minio):
+@pytest.mark.asyncio
+async def test_delete_json_from_minio_failure(db_instance_for_minio):
     filename = "no.json"
 
     db_instance_for_minio.minio_calendar_instance.remove_object.side_effect = Exception("Remove error")
 
     with pytest.raises(ValueError) as exc_info:
-        db_instance_for_minio.delete_json_from_minio(filename)
+        await db_instance_for_minio.delete_json_from_minio(filename)
 
     assert "Failed to remove calendar data from minio: Remove error" in str(exc_info.value)
+
+
+@pytest.mark.asyncio
+async def test_like_user_upserts_without_match(db_instance):
+    mock_likes = MagicMock()
+    mock_likes.update_one = AsyncMock()
+    mock_likes.find_one = AsyncMock(return_value=None)
+    db_instance.db.__getitem__.return_value = mock_likes
+
+    result = await db_instance.like_user(1, 2)
+
+    assert result == {"matched": False, "chat_id": None}
+    like_filter, like_update = mock_likes.update_one.call_args.args
+    assert like_filter == {"user_id": 1, "target_id": 2}
+    assert "$setOnInsert" in like_update
+    assert mock_likes.update_one.call_args.kwargs["upsert"] is True
+
+
+@pytest.mark.asyncio
+async def test_like_user_mutual_reuses_pair_chat(db_instance):
+    mock_likes = MagicMock()
+    mock_likes.update_one = AsyncMock()
+    mock_likes.find_one = AsyncMock(return_value={"_id": ObjectId()})
+    mock_chats = MagicMock()
+    mock_chats.find_one_and_update = AsyncMock(return_value={"chat_id": "existing_chat"})
+    db_instance.db.__getitem__.side_effect = lambda name: {"likes": mock_likes, "chats": mock_chats}[name]
+
+    result = await db_instance.like_user(5, 3)
+
+    assert result == {"matched": True, "chat_id": "existing_chat"}
+    chat_filter = mock_chats.find_one_and_update.call_args.args[0]
+    assert chat_filter == {"pair": "3_5"}
+    assert mock_chats.find_one_and_update.call_args.kwargs["upsert"] is True
+
+
+@pytest.mark.asyncio
+async def test_create_chat_upserts_by_pair(db_instance):
+    mock_chats = MagicMock()
+    mock_chats.find_one_and_update = AsyncMock(return_value={"chat_id": "existing_chat"})
+    db_instance.db.__getitem__.return_value = mock_chats
+
+    chat_id = await db_instance.create_chat("new_chat", 5, 3)
+
+    assert chat_id == "existing_chat"
+    chat_filter, chat_update = mock_chats.find_one_and_update.call_args.args
+    assert chat_filter == {"pair": "3_5"}
+    assert chat_update["$setOnInsert"]["chat_id"] == "new_chat"
+    assert mock_chats.find_one_and_update.call_args.kwargs["upsert"] is True
+
+
+@pytest.mark.asyncio
+async def test_superlike_user_records_both_likes_in_one_write(db_instance):
+    mock_likes = MagicMock()
+    mock_likes.bulk_write = AsyncMock()
+    mock_chats = MagicMock()
+    mock_chats.find_one_and_update = AsyncMock(return_value={"chat_id": "chat"})
+    db_instance.db.__getitem__.side_effect = lambda name: {"likes": mock_likes, "chats": mock_chats}[name]
+
+    result = await db_instance.superlike_user(1, 2)
+
+    assert result == {"matched": True, "chat_id": "chat"}
+    operations = mock_likes.bulk_write.call_args.args[0]
+    assert [operation._filter for operation in operations] == [
+        {"user_id": 1, "target_id": 2},
+        {"user_id": 2, "target_id": 1},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_dislike_user_goes_through_write_buffer(db_instance):
+    db_instance.dislikes_buffer = MagicMock()
+    db_instance.dislikes_buffer.add = AsyncMock()
+
+    await db_instance.dislike_user(1, 2)
+
+    document = db_instance.dislikes_buffer.add.call_args.args[0]
+    assert document["user_id"] == 1
+    assert document["target_id"] == 2
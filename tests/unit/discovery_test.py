@@ -0,0 +1,102 @@
+from datetime import datetime
+from unittest.mock import patch
+
+import pytest
+
+from app.models.match import DiscoveryFilters
+from app.utils import discovery
+from app.utils.indexes import INDEXES
+
+
+def test_parse_height():
+    assert discovery.parse_height("180.5 cm") == 180.5
+    assert discovery.parse_height("") is None
+    assert discovery.parse_height(None) is None
+
+
+def test_parse_birthdate():
+    assert discovery.parse_birthdate("2004-09-06") == datetime(2004, 9, 6)
+    assert discovery.parse_birthdate("") is None
+
+
+def test_typed_discovery_fields():
+    user = {
+        "mainFeatures": [
+            {"text": "175.0 cm", "icon": "height"},
+            {"text": "Male", "icon": "gender"},
+            {"text": "2000-01-01", "icon": "birthdate"},
+            [],
+        ],
+        "relationship_preferences": [{"id": "abc", "text": "Dates", "icon": "relationship_preferences"}],
+    }
+
+    fields = discovery.typed_discovery_fields(user)
+
+    assert fields == {
+        "birthdate": datetime(2000, 1, 1),
+        "height_cm": 175.0,
+        "gender": "male",
+        "relationship_pref_ids": ["abc"],
+        "schema_version": discovery.USER_SCHEMA_VERSION,
+    }
+
+
+def test_birthdate_bounds():
+    bounds = discovery.birthdate_bounds(18, 30)
+    assert bounds["$gt"] < bounds["$lte"]
+    assert bounds["$lte"].year - bounds["$gt"].year == 13
+
+
+def test_build_discovery_pipeline_uses_typed_fields_when_ready():
+    filters = DiscoveryFilters(gender="Female", relationship_preferences=["abc"])
+
+    with patch.object(discovery, "_typed_fields_ready", True):
+        pipeline = discovery.build_discovery_pipeline(1, [2, 3], filters, sample_size=5)
+
+    match = pipeline[0]["$match"]
+    assert match["isu"] == {"$ne": 1, "$nin": [2, 3]}
+    assert match["gender"] == "female"
+    assert match["height_cm"] == {"$gte": 75.0, "$lte": 300.0}
+    assert match["relationship_pref_ids"] == {"$in": ["abc"]}
+    assert pipeline[-1] == {"$sample": {"size": 5}}
+
+
+def test_build_discovery_pipeline_legacy_until_backfilled():
+    with patch.object(discovery, "_typed_fields_ready", False):
+        pipeline = discovery.build_discovery_pipeline(1, [], DiscoveryFilters())
+
+    assert "birthdateObj" in pipeline[1]["$addFields"]
+
+
+def test_build_discovery_pipeline_random_key_wraps_around():
+    filters = DiscoveryFilters()
+
+    with patch.object(discovery, "_typed_fields_ready", True), patch.object(discovery.random, "random", return_value=0.4):
+        pipeline = discovery.build_discovery_pipeline(
+            1, [], filters, sample_size=3, sampling=discovery.SAMPLING_RANDOM_KEY
+        )
+
+    assert all("$sample" not in stage for stage in pipeline)
+    assert pipeline[1] == {"$match": {"rand": {"$gte": 0.4}}}
+    assert pipeline[2] == {"$sort": {"rand": 1}}
+    wrap = pipeline[4]["$unionWith"]
+    assert wrap["coll"] == "users"
+    assert wrap["pipeline"][1] == {"$match": {"rand": {"$lt": 0.4}}}
+    assert pipeline[-1] == {"$limit": 3}
+
+
+@pytest.mark.parametrize("gender", ["Everyone", "Female"])
+def test_random_key_stages_seek_by_rand_index(gender):
+    filters = DiscoveryFilters(gender=gender)
+
+    with patch.object(discovery, "_typed_fields_ready", True):
+        pipeline = discovery.build_discovery_pipeline(
+            1, [], filters, sample_size=3, sampling=discovery.SAMPLING_RANDOM_KEY
+        )
+
+    # Сортировка по rand идет по индексу, только если перед rand в ключе стоят
+    # одни поля с условием равенства из $match
+    equality = [field for field, condition in pipeline[0]["$match"].items() if not isinstance(condition, dict)]
+    keys = [[field for field, _ in index.document["key"].items()] for index in INDEXES["users"]]
+    assert [*equality, "rand"] in [key[: len(equality) + 1] for key in keys]
+    assert pipeline[2] == {"$sort": {"rand": 1}}
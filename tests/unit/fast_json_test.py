@@ -0,0 +1,69 @@
+import datetime
+
+import pytest
+from bson import ObjectId
+from fastapi import APIRouter, FastAPI
+from httpx import AsyncClient
+from pydantic import BaseModel
+
+from app.utils.fast_json import FastJSONResponse, FastJSONRoute, dumps
+
+
+class Item(BaseModel):
+    name: str
+
+
+@pytest.fixture
+def app():
+    router = APIRouter(route_class=FastJSONRoute)
+
+    @router.get("/document")
+    async def get_document():
+        return {"_id": ObjectId("65f000000000000000000001"), "created_at": datetime.datetime(2024, 9, 1, 12, 30)}
+
+    @router.post("/created", status_code=201)
+    async def create():
+        return {"ids": {ObjectId("65f000000000000000000002")}}
+
+    @router.get("/model", response_model=Item)
+    async def get_model():
+        return {"name": "item", "extra": "dropped"}
+
+    app = FastAPI(default_response_class=FastJSONResponse)
+    app.include_router(router)
+    return app
+
+
+def test_dumps_bson_types():
+    document = {
+        "_id": ObjectId("65f000000000000000000001"),
+        "nested": [{"chat": ObjectId("65f000000000000000000002")}],
+        "created_at": datetime.datetime(2024, 9, 1, 12, 30),
+        "item": Item(name="item"),
+        1: "non-str key",
+    }
+
+    assert dumps(document) == (
+        b'{"_id":"65f000000000000000000001","nested":[{"chat":"65f000000000000000000002"}],'
+        b'"created_at":"2024-09-01T12:30:00","item":{"name":"item"},"1":"non-str key"}'
+    )
+
+
+def test_dumps_rejects_unknown_types():
+    with pytest.raises(TypeError):
+        dumps({"value": object()})
+
+
+@pytest.mark.asyncio
+async def test_route_encodes_raw_documents(app):
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        document = await ac.get("/document")
+        created = await ac.post("/created")
+        model = await ac.get("/model")
+
+    assert document.status_code == 200
+    assert document.json() == {"_id": "65f000000000000000000001", "created_at": "2024-09-01T12:30:00"}
+    assert created.status_code == 201
+    assert created.json() == {"ids": ["65f000000000000000000002"]}
+    # response_model остается на стандартном пути с валидацией
+    assert model.json() == {"name": "item"}
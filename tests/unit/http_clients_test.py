@@ -0,0 +1,55 @@
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from aiohttp import ClientConnectionError, DummyCookieJar
+
+from app.utils.http_clients import HTTP_LIMIT_PER_HOST, KEYCLOAK, MY_ITMO, HttpClients, UpstreamClient
+
+
+@pytest.mark.asyncio
+async def test_session_is_shared_and_configured():
+    client = UpstreamClient(KEYCLOAK)
+    session = client.session
+
+    assert client.session is session
+    assert session.connector.limit_per_host == HTTP_LIMIT_PER_HOST
+    assert isinstance(session.cookie_jar, DummyCookieJar)
+    assert session.timeout.sock_connect is not None and session.timeout.sock_read is not None
+
+    await client.close()
+    assert session.closed
+    # После закрытия сессия пересоздается при следующем обращении
+    assert client.session is not session
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_request_records_latency_and_errors():
+    client = UpstreamClient(MY_ITMO)
+    session = MagicMock(closed=False)
+    session.request = AsyncMock(side_effect=[MagicMock(status=200), MagicMock(status=503), ClientConnectionError()])
+
+    with patch.object(UpstreamClient, "session", session):
+        assert (await client.get("https://my.itmo.ru/ok")).status == 200
+        assert (await client.post("https://my.itmo.ru/busy", data={})).status == 503
+        with pytest.raises(ClientConnectionError):
+            await client.get("https://my.itmo.ru/down")
+
+    session.request.assert_any_await("POST", "https://my.itmo.ru/busy", data={})
+    stats = client.stats()
+    assert stats["requests"] == 3
+    assert stats["errors"] == 2
+    assert stats["p50_ms"] <= stats["p95_ms"] <= stats["max_ms"]
+
+
+@pytest.mark.asyncio
+async def test_registry_starts_and_closes_all_upstreams():
+    clients = HttpClients()
+    clients.start()
+
+    assert clients.get(KEYCLOAK) is clients.get(KEYCLOAK)
+    assert set(clients.stats()) == {KEYCLOAK, MY_ITMO}
+    assert all(stats["open"] for stats in clients.stats().values())
+
+    await clients.close()
+    assert not any(stats["open"] for stats in clients.stats().values())
@@ -0,0 +1,64 @@
+import io
+
+import pytest
+from PIL import Image
+
+from app.utils import images
+
+
+def make_image(size=(3000, 2000), mode="RGB", image_format="JPEG", color="red"):
+    output = io.BytesIO()
+    Image.new(mode, size, color=color).save(output, image_format)
+    return output.getvalue()
+
+
+def test_variant_keys():
+    key = images.variant_name("carousel/1_abc", images.FULL)
+
+    assert key == "carousel/1_abc_full.webp"
+    assert images.variant_key(key, images.THUMB) == "carousel/1_abc_thumb.webp"
+    assert images.variant_keys(key) == [
+        "carousel/1_abc_thumb.webp",
+        "carousel/1_abc_card.webp",
+        "carousel/1_abc_full.webp",
+    ]
+    # Старые загрузки без вариантов
+    assert images.variant_key("carousel/1_abc.jpg", images.CARD) == "carousel/1_abc.jpg"
+    assert images.variant_keys("carousel/1_abc.jpg") == ["carousel/1_abc.jpg"]
+
+
+def test_is_image():
+    assert images.is_image(make_image())
+    assert images.is_image(make_image(mode="RGBA", image_format="PNG"))
+    assert not images.is_image(b"fake image data")
+    assert not images.is_image(make_image(mode="P", image_format="GIF"))
+
+
+def test_render_variants_bounds_size_and_encodes_webp():
+    variants = images._render_variants(make_image())
+
+    assert set(variants) == set(images.VARIANTS)
+    for variant, max_side in images.VARIANTS.items():
+        with Image.open(io.BytesIO(variants[variant])) as image:
+            assert image.format == "WEBP"
+            assert max(image.size) == max_side
+
+
+def test_render_variants_keeps_small_images_and_alpha():
+    variants = images._render_variants(make_image(size=(100, 50), mode="RGBA", image_format="PNG", color=(255, 0, 0, 128)))
+
+    with Image.open(io.BytesIO(variants[images.FULL])) as image:
+        assert image.size == (100, 50)
+        assert image.mode == "RGBA"
+
+
+@pytest.mark.asyncio
+async def test_render_variants_in_process_pool():
+    try:
+        variants = await images.render_variants(make_image(size=(800, 600)))
+        assert await images.render_variants(b"not an image") is None
+    finally:
+        images.shutdown()
+
+    with Image.open(io.BytesIO(variants[images.CARD])) as image:
+        assert image.size == (640, 480)
@@ -0,0 +1,100 @@
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from bson import ObjectId
+from pymongo.errors import OperationFailure
+
+from app.utils import indexes
+from app.utils.db import db_instance
+
+
+def test_declared_indexes_cover_hot_collections():
+    for collection_name in ["users", "likes", "dislikes", "chats", "messages", "stories", "premium", "results"]:
+        assert indexes.INDEXES[collection_name], f"No indexes declared for {collection_name}"
+
+
+def test_candidate_queues_expire():
+    ttl = [model.document for model in indexes.INDEXES["candidate_queues"] if "expireAfterSeconds" in model.document]
+    assert [index["key"] for index in ttl] == [{"updated_at": 1}]
+
+
+@pytest.mark.asyncio
+async def test_ensure_indexes_continues_after_conflict():
+    mock_collection = MagicMock()
+    mock_collection.create_indexes = AsyncMock(side_effect=[OperationFailure("conflict")] + [["ok"]] * 100)
+
+    mock_collection.index_information = AsyncMock(return_value={"_id_": {}, "user_target_unique": {}})
+
+    mock_db = MagicMock()
+    mock_db.__getitem__.return_value = mock_collection
+
+    with patch.object(db_instance, "db", mock_db), pytest.raises(indexes.IndexCreationError) as exc_info:
+        await indexes.ensure_indexes()
+
+    total = sum(len(models) for models in indexes.INDEXES.values())
+    assert mock_collection.create_indexes.await_count == total
+    assert sum(len(names) for names in exc_info.value.created.values()) == total - 1
+    assert len(exc_info.value.failures) == 1
+
+
+@pytest.mark.asyncio
+async def test_ensure_indexes_dedupes_likes_before_unique_index():
+    mock_collection = MagicMock()
+    mock_collection.create_indexes = AsyncMock(return_value=["ok"])
+    mock_collection.index_information = AsyncMock(return_value={"_id_": {}, "user_target": {}})
+    mock_collection.drop_index = AsyncMock()
+
+    mock_db = MagicMock()
+    mock_db.__getitem__.return_value = mock_collection
+
+    with patch.object(db_instance, "db", mock_db), patch.object(
+        indexes.likes_dedupe, "run_dedupe", AsyncMock(return_value=3)
+    ) as mock_dedupe, patch.dict(indexes.INDEXES, {"likes": indexes.INDEXES["likes"]}, clear=True):
+        await indexes.ensure_indexes()
+
+    mock_dedupe.assert_awaited_once()
+    mock_collection.drop_index.assert_awaited_once_with("user_target")
+    created = [call.args[0][0].document["name"] for call in mock_collection.create_indexes.await_args_list]
+    assert created == ["user_target_unique", "target_recent"]
+
+
+@pytest.mark.asyncio
+async def test_report_indexes():
+    stats = [
+        {"name": "_id_", "accesses": {"ops": 0}},
+        {"name": "user_target_unique", "accesses": {"ops": 12}},
+        {"name": "old_index", "accesses": {"ops": 0}},
+    ]
+    mock_cursor = MagicMock()
+    mock_cursor.to_list = AsyncMock(return_value=stats)
+    mock_collection = MagicMock()
+    mock_collection.aggregate.return_value = mock_cursor
+
+    mock_db = MagicMock()
+    mock_db.__getitem__.return_value = mock_collection
+
+    with patch.object(db_instance, "db", mock_db), patch.dict(
+        indexes.INDEXES, {"likes": indexes.INDEXES["likes"]}, clear=True
+    ):
+        report = await indexes.report_indexes()
+
+    mock_collection.aggregate.assert_called_once_with([{"$indexStats": {}}])
+    assert report == {"likes": {"missing": ["target_recent"], "unused": ["old_index"], "undeclared": ["old_index"]}}
+
+
+@pytest.mark.asyncio
+async def test_likes_dedupe_keeps_earliest_like():
+    first, second, third = ObjectId(), ObjectId(), ObjectId()
+    mock_cursor = MagicMock()
+    mock_cursor.to_list = AsyncMock(return_value=[{"ids": [third, first, second], "count": 3}])
+    mock_collection = MagicMock()
+    mock_collection.aggregate.return_value = mock_cursor
+    mock_collection.delete_many = AsyncMock(return_value=MagicMock(deleted_count=2))
+
+    mock_db = MagicMock()
+    mock_db.__getitem__.return_value = mock_collection
+
+    with patch.object(db_instance, "db", mock_db):
+        assert await indexes.likes_dedupe.run_dedupe() == 2
+
+    mock_collection.delete_many.assert_awaited_once_with({"_id": {"$in": [second, third]}})
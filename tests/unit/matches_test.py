@@ -1,10 +1,12 @@
+from array import array
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
+from bson import ObjectId
 from fastapi import FastAPI
 from httpx import AsyncClient
 
-from app.api.matches import router
+from app.api.matches import CARD_PROJECTION, router
 from app.utils.db import db_instance
 
 
@@ -15,6 +17,14 @@ def app():
     return app
 
 
+@pytest.fixture(autouse=True)
+def mock_seen_set():
+    with patch("app.api.matches.seen_set.get_seen", AsyncMock(return_value=array("q"))), patch(
+        "app.api.matches.seen_set.mark_seen", AsyncMock()
+    ) as mock_mark_seen:
+        yield mock_mark_seen
+
+
 @pytest.mark.asyncio
 async def test_get_random_person_success(app):
     user_id = 123456
@@ -58,7 +68,9 @@ async def test_get_random_person_success(app):
         "users": mock_users_collection,
     }[name]
 
-    with patch.object(db_instance, "db", mock_db):
+    with patch.object(db_instance, "db", mock_db), patch(
+        "app.api.matches.candidate_queue.pop_candidate", AsyncMock(return_value=None)
+    ):
         async with AsyncClient(app=app, base_url="http://test") as ac:
             response = await ac.get("/random_person", params={"user_id": user_id})
 
@@ -108,7 +120,9 @@ async def test_get_random_person_no_person_available(app):
         "users": mock_users_collection,
     }[name]
 
-    with patch.object(db_instance, "db", mock_db):
+    with patch.object(db_instance, "db", mock_db), patch(
+        "app.api.matches.candidate_queue.pop_candidate", AsyncMock(return_value=None)
+    ):
         async with AsyncClient(app=app, base_url="http://test") as ac:
             response = await ac.get("/random_person", params={"user_id": user_id})
 
@@ -116,6 +130,187 @@ async def test_get_random_person_no_person_available(app):
         assert response.json() == {"detail": "No more persons available"}
 
 
+@pytest.mark.asyncio
+async def test_get_random_person_from_queue(app):
+    user_id = 123456
+    mock_person = {"_id": "some_id", "isu": 654321, "username": "Queued", "logo": "", "photos": []}
+
+    mock_users_collection = MagicMock()
+    mock_users_collection.find_one = AsyncMock(return_value=mock_person)
+
+    mock_db = MagicMock()
+    mock_db.__getitem__.side_effect = lambda name: {"users": mock_users_collection}[name]
+
+    with patch.object(db_instance, "db", mock_db), patch(
+        "app.api.matches.candidate_queue.pop_candidate", AsyncMock(return_value=654321)
+    ):
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.get("/random_person", params={"user_id": user_id})
+
+    assert response.status_code == 200
+    assert response.json()["profile"]["isu"] == 654321
+    mock_users_collection.find_one.assert_awaited_once_with({"isu": 654321}, None)
+    mock_users_collection.aggregate.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_get_random_person_explicit_sampling_bypasses_queue(app):
+    mock_users_cursor = AsyncMock()
+    mock_users_cursor.to_list.return_value = [{"_id": "a", "isu": 1, "logo": "", "photos": []}]
+    mock_users_collection = MagicMock()
+    mock_users_collection.aggregate.return_value = mock_users_cursor
+
+    mock_db = MagicMock()
+    mock_db.__getitem__.side_effect = lambda name: {"users": mock_users_collection}[name]
+
+    with patch.object(db_instance, "db", mock_db), patch(
+        "app.api.matches.candidate_queue.pop_candidate", AsyncMock(return_value=654321)
+    ) as mock_pop_candidate:
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.get("/random_person", params={"user_id": 123456, "sampling": "random_key"})
+
+    assert response.status_code == 200
+    assert response.json()["profile"]["isu"] == 1
+    mock_pop_candidate.assert_not_called()
+    pipeline = mock_users_collection.aggregate.call_args.args[0]
+    assert any("$unionWith" in stage for stage in pipeline)
+
+
+@pytest.mark.asyncio
+async def test_get_random_people_returns_distinct_unseen_deck(app):
+    bucket = db_instance.minio_bucket_name
+    people = [
+        {"_id": "a", "isu": 1, "logo": f"{bucket}/logos/1.png", "photos": [f"{bucket}/carousel/1.jpg"]},
+        {"_id": "b", "isu": 2, "logo": "", "photos": []},
+        {"_id": "c", "isu": 1, "logo": "", "photos": []},
+        {"_id": "d", "isu": 3, "logo": f"{bucket}/logos/1.png", "photos": []},
+        {"_id": "e", "isu": 4, "logo": "", "photos": []},
+    ]
+
+    mock_users_cursor = AsyncMock()
+    mock_users_cursor.to_list.return_value = people
+    mock_users_collection = MagicMock()
+    mock_users_collection.aggregate.return_value = mock_users_cursor
+
+    mock_db = MagicMock()
+    mock_db.__getitem__.side_effect = lambda name: {"users": mock_users_collection}[name]
+
+    with patch.object(db_instance, "db", mock_db), patch(
+        "app.api.matches.seen_set.get_seen", AsyncMock(return_value=array("q", [2]))
+    ), patch.object(db_instance, "generate_presigned_url", side_effect=lambda key: f"signed/{key}") as mock_presign:
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.get("/random_people", params={"user_id": 123456, "count": 3})
+
+    assert response.status_code == 200
+    profiles = response.json()["profiles"]
+    assert [profile["isu"] for profile in profiles] == [1, 3, 4]
+    assert profiles[0]["logo"] == "signed/logos/1.png"
+    assert profiles[0]["photos"] == ["signed/carousel/1.jpg"]
+    assert profiles[1]["logo"] == "signed/logos/1.png"
+    assert mock_presign.call_count == 2
+    mock_users_collection.aggregate.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_get_random_people_random_key_sampling(app):
+    mock_users_cursor = AsyncMock()
+    mock_users_cursor.to_list.return_value = [{"_id": "a", "isu": 1, "logo": "", "photos": []}]
+    mock_users_collection = MagicMock()
+    mock_users_collection.aggregate.return_value = mock_users_cursor
+
+    mock_db = MagicMock()
+    mock_db.__getitem__.side_effect = lambda name: {"users": mock_users_collection}[name]
+
+    with patch.object(db_instance, "db", mock_db):
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.get("/random_people", params={"user_id": 123456, "sampling": "random_key"})
+            invalid = await ac.get("/random_people", params={"user_id": 123456, "sampling": "bogus"})
+
+    assert response.status_code == 200
+    pipeline = mock_users_collection.aggregate.call_args.args[0]
+    assert any("$unionWith" in stage for stage in pipeline)
+    assert invalid.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_get_random_people_memory_sampling(app):
+    mock_users_cursor = AsyncMock()
+    mock_users_cursor.to_list.return_value = [{"_id": "a", "isu": 7, "logo": "", "photos": []}]
+    mock_users_collection = MagicMock()
+    mock_users_collection.find.return_value = mock_users_cursor
+
+    mock_db = MagicMock()
+    mock_db.__getitem__.side_effect = lambda name: {"users": mock_users_collection}[name]
+
+    mock_index = MagicMock(ready=True)
+    mock_index.sample.return_value = [7]
+
+    with patch.object(db_instance, "db", mock_db), patch("app.api.matches.user_index", mock_index):
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.get("/random_people", params={"user_id": 123456, "sampling": "memory"})
+
+    assert response.status_code == 200
+    assert [profile["isu"] for profile in response.json()["profiles"]] == [7]
+    mock_users_collection.find.assert_called_once_with({"isu": {"$in": [7]}}, None)
+    mock_users_collection.aggregate.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_get_random_people_ranked(app):
+    pool = [{"_id": str(i), "isu": i, "logo": "", "photos": []} for i in range(1, 6)]
+    mock_users_cursor = AsyncMock()
+    mock_users_cursor.to_list.return_value = pool
+    mock_users_collection = MagicMock()
+    mock_users_collection.aggregate.return_value = mock_users_cursor
+    mock_users_collection.find_one = AsyncMock(return_value={"isu": 123456})
+
+    mock_results_cursor = AsyncMock()
+    mock_results_cursor.to_list.return_value = []
+    mock_results_collection = MagicMock()
+    mock_results_collection.find.return_value = mock_results_cursor
+
+    mock_db = MagicMock()
+    mock_db.__getitem__.side_effect = lambda name: {
+        "users": mock_users_collection,
+        "results": mock_results_collection,
+    }[name]
+
+    mock_ranker = MagicMock()
+    mock_ranker.rank.side_effect = lambda user, candidates, quiz_scores, k: candidates[::-1][:k]
+
+    with patch.object(db_instance, "db", mock_db), patch.dict(
+        "app.api.matches.RANKERS", {"compatibility": mock_ranker}
+    ):
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.get(
+                "/random_people", params={"user_id": 123456, "count": 2, "ranking": "compatibility"}
+            )
+
+    assert response.status_code == 200
+    assert [profile["isu"] for profile in response.json()["profiles"]] == [5, 4]
+    pipeline = mock_users_collection.aggregate.call_args.args[0]
+    assert pipeline[-1] == {"$sample": {"size": 200}}
+    assert len(mock_ranker.rank.call_args.args[1]) == 5
+
+
+@pytest.mark.asyncio
+async def test_get_random_people_none_available(app):
+    mock_users_cursor = AsyncMock()
+    mock_users_cursor.to_list.return_value = []
+    mock_users_collection = MagicMock()
+    mock_users_collection.aggregate.return_value = mock_users_cursor
+
+    mock_db = MagicMock()
+    mock_db.__getitem__.side_effect = lambda name: {"users": mock_users_collection}[name]
+
+    with patch.object(db_instance, "db", mock_db):
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.get("/random_people", params={"user_id": 123456})
+
+    assert response.status_code == 404
+    assert response.json() == {"detail": "No more persons available"}
+
+
 @pytest.mark.asyncio
 async def test_like_person_success(app):
     payload = {"user_id": 123456, "target_id": 654321}
@@ -133,7 +328,22 @@ async def test_like_person_success(app):
 
 
 @pytest.mark.asyncio
-async def test_dislike_person_success(app):
+async def test_superlike_person_uses_atomic_path(app, mock_seen_set):
+    payload = {"user_id": 123456, "target_id": 654321}
+    mock_result = {"matched": True, "chat_id": "chat"}
+
+    with patch.object(db_instance, "superlike_user", AsyncMock(return_value=mock_result)) as mock_superlike:
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.post("/superlike_person", json=payload)
+
+    assert response.status_code == 200
+    assert response.json() == {"message": "You have a match!", "matched": True, "chat_id": "chat"}
+    mock_superlike.assert_awaited_once_with(123456, 654321)
+    mock_seen_set.assert_awaited_once_with(123456, 654321)
+
+
+@pytest.mark.asyncio
+async def test_dislike_person_success(app, mock_seen_set):
     payload = {"user_id": 123456, "target_id": 654321}
 
     with patch.object(db_instance, "dislike_user", AsyncMock(return_value=None)):
@@ -142,49 +352,203 @@ async def test_dislike_person_success(app):
 
         assert response.status_code == 200
         assert response.json() == {"message": "person disliked successfully"}
+        mock_seen_set.assert_awaited_once_with(123456, 654321)
+
+
+@pytest.mark.asyncio
+async def test_get_random_person_skips_seen(app):
+    user_id = 123456
+    seen_person = {"_id": "a", "isu": 111111, "logo": "", "photos": []}
+    fresh_person = {"_id": "b", "isu": 222222, "logo": "", "photos": []}
+
+    mock_users_cursor = AsyncMock()
+    mock_users_cursor.to_list.return_value = [seen_person, fresh_person]
+    mock_users_collection = MagicMock()
+    mock_users_collection.aggregate.return_value = mock_users_cursor
+
+    mock_db = MagicMock()
+    mock_db.__getitem__.side_effect = lambda name: {"users": mock_users_collection}[name]
+
+    with patch.object(db_instance, "db", mock_db), patch(
+        "app.api.matches.candidate_queue.pop_candidate", AsyncMock(return_value=None)
+    ), patch("app.api.matches.seen_set.get_seen", AsyncMock(return_value=array("q", [111111]))):
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.get("/random_person", params={"user_id": user_id})
+
+    assert response.status_code == 200
+    assert response.json()["profile"]["isu"] == 222222
+
+
+@pytest.mark.asyncio
+async def test_get_random_person_falls_back_to_nin_when_sample_is_all_seen(app):
+    user_id = 123456
+    seen = array("q", [111111, 333333])
+    fresh_person = {"_id": "b", "isu": 222222, "logo": "", "photos": []}
+
+    # Выборка заполнена целиком (1 + 2 с запасом), но все в ней уже просмотрены
+    sampled_cursor = AsyncMock()
+    sampled_cursor.to_list.return_value = [{"isu": 111111}, {"isu": 333333}, {"isu": 111111}]
+    fallback_cursor = AsyncMock()
+    fallback_cursor.to_list.return_value = [fresh_person]
+    mock_users_collection = MagicMock()
+    mock_users_collection.aggregate.side_effect = [sampled_cursor, fallback_cursor]
+
+    mock_db = MagicMock()
+    mock_db.__getitem__.side_effect = lambda name: {"users": mock_users_collection}[name]
+
+    with patch.object(db_instance, "db", mock_db), patch(
+        "app.api.matches.candidate_queue.pop_candidate", AsyncMock(return_value=None)
+    ), patch("app.api.matches.seen_set.get_seen", AsyncMock(return_value=seen)):
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.get("/random_person", params={"user_id": user_id})
+
+    assert response.status_code == 200
+    assert response.json()["profile"]["isu"] == 222222
+    fallback_pipeline = mock_users_collection.aggregate.call_args.args[0]
+    assert fallback_pipeline[0]["$match"]["isu"]["$nin"] == [111111, 333333]
+
+
+def _liked_me_db(*batches):
+    mock_likes_collection = MagicMock()
+    cursors = []
+    for batch in batches:
+        cursor = AsyncMock()
+        cursor.to_list.return_value = batch
+        cursors.append(cursor)
+    mock_likes_collection.aggregate.side_effect = cursors
+
+    mock_db = MagicMock()
+    mock_db.__getitem__.side_effect = lambda name: {"likes": mock_likes_collection}[name]
+    return mock_db, mock_likes_collection
 
 
 @pytest.mark.asyncio
 async def test_get_matches_success(app):
     isu = 123456
-    mock_likes = [{"user_id": 654321}]
-    mock_users = [
-        {
-            "isu": 654321,
-            "username": "Jane Doe",
-            "bio": "A match",
-            "logo": "https://example.com/logo.png",
-            "photos": [],
-            "mainFeatures": [],
-            "interests": [],
-            "itmo": [],
-            "gender_preferences": [],
-            "relationship_preferences": [],
-            "isStudent": True,
+    like_id = ObjectId()
+    bucket = db_instance.minio_bucket_name
+    mock_user = {
+        "isu": 654321,
+        "username": "Jane Doe",
+        "bio": "A match",
+        "logo": f"{bucket}/logos/654321.png",
+        "photos": [f"{bucket}/carousel/654321.jpg"],
+        "mainFeatures": [],
+        "interests": [],
+        "itmo": [],
+        "gender_preferences": [],
+        "relationship_preferences": [],
+        "isStudent": True,
+    }
+    mock_db, mock_likes_collection = _liked_me_db([{"_id": like_id, "user_id": 654321, "user": [mock_user]}])
+
+    with patch.object(db_instance, "db", mock_db), patch.object(
+        db_instance, "generate_presigned_url", side_effect=lambda key: f"signed/{key}"
+    ):
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.get("/liked_me", params={"isu": isu})
+
+        assert response.status_code == 200
+        assert response.json() == {
+            "profiles": [
+                {
+                    **mock_user,
+                    "logo": "signed/logos/654321.png",
+                    "photos": ["signed/carousel/654321.jpg"],
+                }
+            ],
+            "next_cursor": None,
         }
+        pipeline = mock_likes_collection.aggregate.call_args.args[0]
+        assert pipeline[0] == {"$match": {"target_id": isu}}
+        assert pipeline[3]["$lookup"]["pipeline"] == [{"$project": CARD_PROJECTION}]
+
+
+@pytest.mark.asyncio
+async def test_get_matches_selected_fields(app):
+    mock_user = {"isu": 654321, "username": "Jane Doe", "logo": "meet/logos/654321.png"}
+    mock_db, mock_likes_collection = _liked_me_db([{"_id": ObjectId(), "user_id": 654321, "user": [mock_user]}])
+
+    with patch.object(db_instance, "db", mock_db), patch.object(
+        db_instance, "presign_many", return_value={"meet/logos/654321.png": "signed"}
+    ) as mock_presign_many:
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.get("/liked_me", params={"isu": 123456, "fields": "username,logo"})
+            invalid = await ac.get("/liked_me", params={"isu": 123456, "fields": "username,rand"})
+
+    assert response.status_code == 200
+    assert response.json()["profiles"] == [{"isu": 654321, "username": "Jane Doe", "logo": "signed"}]
+    pipeline = mock_likes_collection.aggregate.call_args.args[0]
+    assert pipeline[3]["$lookup"]["pipeline"] == [{"$project": {"isu": 1, "username": 1, "logo": 1, "_id": 0}}]
+    # Фотографии не запрошены и не подписываются
+    mock_presign_many.assert_called_once()
+    assert invalid.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_get_matches_paginates_and_skips_seen(app):
+    isu = 123456
+    cursor = ObjectId()
+    like_ids = [ObjectId() for _ in range(4)]
+    first_batch = [
+        {"_id": like_ids[0], "user_id": 1, "user": [{"isu": 1}]},
+        {"_id": like_ids[1], "user_id": 2, "user": [{"isu": 2}]},
+    ]
+    second_batch = [
+        {"_id": like_ids[2], "user_id": 3, "user": [{"isu": 3}]},
+        {"_id": like_ids[3], "user_id": 4, "user": [{"isu": 4}]},
     ]
+    mock_db, mock_likes_collection = _liked_me_db(first_batch, second_batch)
 
-    mock_likes_cursor = AsyncMock()
-    mock_likes_cursor.to_list.return_value = mock_likes
+    with patch.object(db_instance, "db", mock_db), patch(
+        "app.api.matches.seen_set.get_seen", AsyncMock(return_value=array("q", [2]))
+    ):
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.get("/liked_me", params={"isu": isu, "limit": 2, "cursor": str(cursor)})
 
-    mock_users_cursor = AsyncMock()
-    mock_users_cursor.to_list.return_value = mock_users
+    assert response.status_code == 200
+    body = response.json()
+    assert [profile["isu"] for profile in body["profiles"]] == [1, 3]
+    assert body["next_cursor"] == str(like_ids[2])
 
-    mock_likes_collection = MagicMock()
-    mock_likes_collection.find.return_value = mock_likes_cursor
+    first_match = mock_likes_collection.aggregate.call_args_list[0].args[0][0]["$match"]
+    second_match = mock_likes_collection.aggregate.call_args_list[1].args[0][0]["$match"]
+    assert first_match == {"target_id": isu, "_id": {"$lt": cursor}}
+    assert second_match == {"target_id": isu, "_id": {"$lt": like_ids[1]}}
+
+
+@pytest.mark.asyncio
+async def test_get_matches_invalid_cursor(app):
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.get("/liked_me", params={"isu": 123456, "cursor": "not-an-id"})
+
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid cursor"}
 
-    mock_users_collection = MagicMock()
-    mock_users_collection.find.return_value = mock_users_cursor
+
+@pytest.mark.asyncio
+async def test_block_person_queues_chat_media_for_removal(app):
+    mock_chats_collection = MagicMock()
+    mock_chats_collection.find_one_and_delete = AsyncMock(side_effect=[{"chat_id": "chat-1"}, None])
+
+    mock_media_cursor = AsyncMock()
+    mock_media_cursor.to_list.return_value = [{"_id": "m1", "path": "bucket/media/chat-1/1.png"}]
+    mock_media_collection = MagicMock()
+    mock_media_collection.find.return_value = mock_media_cursor
+    mock_media_collection.delete_many = AsyncMock()
 
     mock_db = MagicMock()
-    mock_db.__getitem__.side_effect = lambda name: {
-        "likes": mock_likes_collection,
-        "users": mock_users_collection,
-    }[name]
+    mock_db.__getitem__.side_effect = lambda name: {"chats": mock_chats_collection, "media": mock_media_collection}[name]
 
-    with patch.object(db_instance, "db", mock_db):
+    with patch.object(db_instance, "db", mock_db), patch(
+        "app.api.matches.storage_gc.enqueue", AsyncMock()
+    ) as mock_enqueue:
         async with AsyncClient(app=app, base_url="http://test") as ac:
-            response = await ac.get("/liked_me", params={"isu": isu})
+            response = await ac.post("/block_person", json={"user_id": 1, "target_id": 2})
+            missing = await ac.post("/block_person", json={"user_id": 1, "target_id": 2})
 
-        assert response.status_code == 200
-        assert response.json() == mock_users
+    assert response.status_code == 200
+    mock_media_collection.find.assert_called_once_with({"chat_id": "chat-1"}, {"path": 1})
+    mock_enqueue.assert_called_once_with(["bucket/media/chat-1/1.png"])
+    mock_media_collection.delete_many.assert_called_once_with({"_id": {"$in": ["m1"]}})
+    assert missing.status_code == 404
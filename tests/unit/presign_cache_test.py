@@ -0,0 +1,52 @@
+from datetime import timedelta
+
+from app.utils.presign_cache import PresignCache, presign_window
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_reuses_url_for_half_of_lifetime():
+    clock = FakeClock()
+    cache = PresignCache(clock=clock)
+    hour = timedelta(hours=1)
+
+    assert cache.get("bucket", "a.png", hour) is None
+    cache.put("bucket", "a.png", hour, "url-1")
+
+    clock.now = 1799
+    assert cache.get("bucket", "a.png", hour) == "url-1"
+    # Другой класс срока жизни - отдельная запись
+    assert cache.get("bucket", "a.png", timedelta(hours=3)) is None
+
+    clock.now = 1800
+    assert cache.get("bucket", "a.png", hour) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 3
+
+
+def test_evicts_least_recently_used():
+    cache = PresignCache(max_size=2)
+    hour = timedelta(hours=1)
+
+    cache.put("bucket", "a", hour, "url-a")
+    cache.put("bucket", "b", hour, "url-b")
+    cache.get("bucket", "a", hour)
+    cache.put("bucket", "c", hour, "url-c")
+
+    assert cache.get("bucket", "b", hour) is None
+    assert cache.get("bucket", "a", hour) == "url-a"
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["size"] == 2
+
+
+def test_presign_window_changes_every_half_lifetime():
+    hour = timedelta(hours=1)
+
+    assert presign_window(hour, now=0) == presign_window(hour, now=1799)
+    assert presign_window(hour, now=1800) == presign_window(hour, now=0) + 1
@@ -9,6 +9,8 @@ from httpx import AsyncClient
 
 from app.api.profile import router
 from app.utils.db import db_instance
+from app.utils.profile_version import profile_etag
+from app.utils.projection import DEFAULT_PROFILE_PROJECTION
 
 
 @pytest.fixture
@@ -18,6 +20,12 @@ def app():
     return app
 
 
+@pytest.fixture(autouse=True)
+def mock_gc_enqueue():
+    with patch("app.api.profile.storage_gc.enqueue", AsyncMock()) as mock_enqueue:
+        yield mock_enqueue
+
+
 @pytest.mark.asyncio
 async def test_update_bio_success(app):
     isu = 123456
@@ -35,7 +43,9 @@ async def test_update_bio_success(app):
 
         assert response.status_code == 200
         assert response.json() == {"message": "bio updated successfully"}
-        mock_user_collection.update_one.assert_called_once_with({"isu": isu}, {"$set": {"bio": bio}})
+        mock_user_collection.update_one.assert_called_once_with(
+            {"isu": isu}, {"$set": {"bio": bio}, "$inc": {"version": 1}}
+        )
 
 
 @pytest.mark.asyncio
@@ -74,7 +84,9 @@ async def test_update_username_success(app):
 
         assert response.status_code == 200
         assert response.json() == {"message": "username updated successfully"}
-        mock_user_collection.update_one.assert_called_once_with({"isu": isu}, {"$set": {"username": username}})
+        mock_user_collection.update_one.assert_called_once_with(
+            {"isu": isu}, {"$set": {"username": username}, "$inc": {"version": 1}}
+        )
 
 
 @pytest.mark.asyncio
@@ -94,7 +106,9 @@ async def test_update_username_user_not_found(app):
 
         assert response.status_code == 404
         assert response.json() == {"detail": "User not found or username not updated"}
-        mock_user_collection.update_one.assert_called_once_with({"isu": isu}, {"$set": {"username": username}})
+        mock_user_collection.update_one.assert_called_once_with(
+            {"isu": isu}, {"$set": {"username": username}, "$inc": {"version": 1}}
+        )
 
 
 @pytest.mark.asyncio
@@ -115,10 +129,61 @@ async def test_update_height_success(app):
         assert response.status_code == 200
         assert response.json() == {"message": "height updated successfully"}
         mock_user_collection.update_one.assert_called_once_with(
-            {"isu": isu}, {"$set": {"mainFeatures.0.text": f"{height} cm"}}
+            {"isu": isu}, {"$set": {"mainFeatures.0.text": f"{height} cm", "height_cm": height}, "$inc": {"version": 1}}
         )
 
 
+@pytest.mark.asyncio
+async def test_patch_profile_applies_single_set(app):
+    isu = 123456
+
+    with patch.object(db_instance, "get_collection") as mock_get_collection:
+        mock_user_collection = AsyncMock()
+        mock_user_collection.find_one_and_update.return_value = {"version": 4}
+        mock_get_collection.return_value = mock_user_collection
+
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.patch(
+                f"/{isu}", json={"bio": "new bio", "height": 180.5, "languages": ["English"], "smoking": "No"}
+            )
+
+        assert response.status_code == 200
+        assert response.json() == {"message": "profile updated successfully", "version": 4}
+        mock_user_collection.find_one_and_update.assert_called_once()
+        query, update = mock_user_collection.find_one_and_update.call_args.args
+        assert query == {"isu": isu}
+        assert update == {
+            "$set": {
+                "bio": "new bio",
+                "mainFeatures.0.text": "180.5 cm",
+                "height_cm": 180.5,
+                "mainFeatures.7": [{"text": "English", "icon": "languages"}],
+                "mainFeatures.9.text": "No",
+            },
+            "$inc": {"version": 1},
+        }
+
+
+@pytest.mark.asyncio
+async def test_patch_profile_validation_and_not_found(app):
+    with patch.object(db_instance, "get_collection") as mock_get_collection:
+        mock_user_collection = AsyncMock()
+        mock_user_collection.find_one_and_update.return_value = None
+        mock_get_collection.return_value = mock_user_collection
+
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            empty = await ac.patch("/123456", json={})
+            unknown = await ac.patch("/123456", json={"isu": 1})
+            invalid = await ac.patch("/123456", json={"height": -5})
+            missing = await ac.patch("/123456", json={"bio": "bio"})
+
+        assert empty.status_code == 400
+        assert unknown.status_code == 422
+        assert invalid.status_code == 422
+        assert missing.status_code == 404
+        assert missing.json() == {"detail": "User not found"}
+
+
 @pytest.mark.asyncio
 async def test_update_height_user_not_found(app):
     isu = 123456
@@ -156,7 +221,7 @@ async def test_update_weight_success(app):
         assert response.status_code == 200
         assert response.json() == {"message": "weight updated successfully"}
         mock_user_collection.update_one.assert_called_once_with(
-            {"isu": isu}, {"$set": {"mainFeatures.2.text": f"{weight} kg"}}
+            {"isu": isu}, {"$set": {"mainFeatures.2.text": f"{weight} kg"}, "$inc": {"version": 1}}
         )
 
 
@@ -371,7 +436,7 @@ async def test_update_relationship_preferences_user_not_found(app):
 
 
 @pytest.mark.asyncio
-async def test_update_logo_success(app):
+async def test_update_logo_success(app, mock_gc_enqueue):
     isu = 123456
     file_content = b"image data"
     file = BytesIO(file_content)
@@ -382,11 +447,11 @@ async def test_update_logo_success(app):
         mock_user_collection = AsyncMock()
         mock_db_instance.get_collection.return_value = mock_user_collection
 
-        mock_db_instance.upload_file_to_minio.return_value = (
-            "https://minio.example.com/logos/123_12345678123456781234567812345678.png"
+        mock_db_instance.upload_media_file = AsyncMock(
+            return_value="https://minio.example.com/logos/123_12345678123456781234567812345678.png"
         )
 
-        mock_user_collection.update_one.return_value.modified_count = 1
+        mock_user_collection.find_one_and_update.return_value = {"logo": "bucket/logos/old.png"}
 
         async with AsyncClient(app=app, base_url="http://test") as ac:
             response = await ac.put(
@@ -399,6 +464,7 @@ async def test_update_logo_success(app):
             "message": "logo updated successfully",
             "logo_url": "https://minio.example.com/logos/123_12345678123456781234567812345678.png",
         }
+        mock_gc_enqueue.assert_called_once_with(["bucket/logos/old.png"])
 
 
 @pytest.mark.asyncio
@@ -413,11 +479,11 @@ async def test_update_logo_user_not_found(app):
         mock_user_collection = AsyncMock()
         mock_db_instance.get_collection.return_value = mock_user_collection
 
-        mock_db_instance.upload_file_to_minio.return_value = (
-            "https://minio.example.com/logos/123_12345678123456781234567812345678.png"
+        mock_db_instance.upload_media_file = AsyncMock(
+            return_value="https://minio.example.com/logos/123_12345678123456781234567812345678.png"
         )
 
-        mock_user_collection.update_one.return_value.modified_count = 0
+        mock_user_collection.find_one_and_update.return_value = None
 
         async with AsyncClient(app=app, base_url="http://test") as ac:
             response = await ac.put(
@@ -461,7 +527,13 @@ async def test_get_profile_success(app):
             "presigned/photo1.png",
             "presigned/photo2.png",
         ]
-        mock_user_collection.find_one.assert_called_once_with({"isu": isu})
+        mock_user_collection.find_one.assert_called_once_with({"isu": isu}, DEFAULT_PROFILE_PROJECTION)
+
+
+def test_default_profile_projection_hides_internal_fields():
+    for field in ("rand", "schema_version", "height_cm", "relationship_pref_ids", "birthdate", "gender"):
+        assert DEFAULT_PROFILE_PROJECTION[field] == 0
+    assert "mainFeatures" not in DEFAULT_PROFILE_PROJECTION
 
 
 @pytest.mark.asyncio
@@ -478,7 +550,138 @@ async def test_get_profile_user_not_found(app):
 
         assert response.status_code == 404
         assert response.json() == {"detail": "User not found"}
-        mock_user_collection.find_one.assert_awaited_once_with({"isu": isu})
+        mock_user_collection.find_one.assert_awaited_once_with({"isu": isu}, DEFAULT_PROFILE_PROJECTION)
+
+
+@pytest.mark.asyncio
+async def test_get_profile_selected_fields(app):
+    isu = 123456
+
+    with patch.object(db_instance, "get_collection") as mock_get_collection, patch.object(
+        db_instance, "presign_many", return_value={}
+    ) as mock_presign_many:
+        mock_user_collection = AsyncMock()
+        mock_user_collection.find_one.return_value = {"isu": isu, "username": "user", "version": 3}
+        mock_get_collection.return_value = mock_user_collection
+
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.get(f"/get_profile/{isu}", params={"fields": "username"})
+            invalid = await ac.get(f"/get_profile/{isu}", params={"fields": "password"})
+
+        assert response.status_code == 200
+        assert response.json() == {"profile": {"isu": isu, "username": "user"}}
+        assert response.headers["ETag"] == profile_etag(isu, 3, fields=["isu", "username"])
+        assert response.headers["ETag"].startswith(f'W/"{isu}-3-f')
+        mock_user_collection.find_one.assert_awaited_once_with(
+            {"isu": isu}, {"isu": 1, "username": 1, "_id": 0, "version": 1}
+        )
+        mock_presign_many.assert_called_once_with([])
+        assert invalid.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_get_profile_etag_depends_on_fields(app):
+    isu = 123456
+    user_data = {"_id": ObjectId(), "isu": isu, "logo": "", "photos": [], "version": 3}
+    partial_etag = profile_etag(isu, 3, fields=["isu", "username"])
+
+    with patch.object(db_instance, "get_collection") as mock_get_collection, patch(
+        "app.api.profile.presign_window", return_value=42
+    ):
+        mock_user_collection = AsyncMock()
+        mock_user_collection.find_one.side_effect = [{"version": 3}, user_data, {"version": 3}]
+        mock_get_collection.return_value = mock_user_collection
+
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            full = await ac.get(f"/get_profile/{isu}", headers={"If-None-Match": partial_etag})
+            reordered = await ac.get(
+                f"/get_profile/{isu}", params={"fields": "username,isu"}, headers={"If-None-Match": partial_etag}
+            )
+
+        # ETag частичного ответа не подтверждает кэш полного профиля
+        assert full.status_code == 200
+        assert full.headers["ETag"] == f'W/"{isu}-3-p42"'
+        assert reordered.status_code == 304
+
+
+@pytest.mark.asyncio
+async def test_get_profile_returns_etag(app):
+    isu = 123456
+    user_data = {"_id": ObjectId(), "isu": isu, "logo": "", "photos": [], "version": 7}
+
+    with patch.object(db_instance, "get_collection") as mock_get_collection, patch(
+        "app.api.profile.presign_window", return_value=42
+    ):
+        mock_user_collection = AsyncMock()
+        mock_user_collection.find_one.return_value = user_data
+        mock_get_collection.return_value = mock_user_collection
+
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.get(f"/get_profile/{isu}")
+
+        assert response.status_code == 200
+        assert response.headers["ETag"] == f'W/"{isu}-7-p42"'
+        mock_user_collection.find_one.assert_called_once_with({"isu": isu}, DEFAULT_PROFILE_PROJECTION)
+
+
+@pytest.mark.asyncio
+async def test_get_profile_not_modified(app):
+    isu = 123456
+
+    with patch.object(db_instance, "get_collection") as mock_get_collection, patch.object(
+        db_instance, "presign_many"
+    ) as mock_presign_many, patch("app.api.profile.presign_window", return_value=42):
+        mock_user_collection = AsyncMock()
+        mock_user_collection.find_one.return_value = {"version": 7}
+        mock_get_collection.return_value = mock_user_collection
+
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.get(f"/get_profile/{isu}", headers={"If-None-Match": f'W/"{isu}-7-p42"'})
+
+        assert response.status_code == 304
+        assert response.headers["ETag"] == f'W/"{isu}-7-p42"'
+        mock_user_collection.find_one.assert_called_once_with({"isu": isu}, {"_id": 0, "version": 1})
+        mock_presign_many.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_get_profile_stale_etag(app):
+    isu = 123456
+    user_data = {"_id": ObjectId(), "isu": isu, "logo": "", "photos": [], "version": 8}
+
+    with patch.object(db_instance, "get_collection") as mock_get_collection, patch(
+        "app.api.profile.presign_window", return_value=42
+    ):
+        mock_user_collection = AsyncMock()
+        mock_user_collection.find_one.side_effect = [{"version": 8}, user_data]
+        mock_get_collection.return_value = mock_user_collection
+
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.get(f"/get_profile/{isu}", headers={"If-None-Match": f'W/"{isu}-7-p42"'})
+
+        assert response.status_code == 200
+        assert response.headers["ETag"] == f'W/"{isu}-8-p42"'
+        assert response.json()["profile"]["version"] == 8
+
+
+@pytest.mark.asyncio
+async def test_get_profile_expired_presign_window(app):
+    isu = 123456
+    user_data = {"_id": ObjectId(), "isu": isu, "logo": "", "photos": [], "version": 7}
+
+    with patch.object(db_instance, "get_collection") as mock_get_collection, patch(
+        "app.api.profile.presign_window", return_value=43
+    ):
+        mock_user_collection = AsyncMock()
+        mock_user_collection.find_one.side_effect = [{"version": 7}, user_data]
+        mock_get_collection.return_value = mock_user_collection
+
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.get(f"/get_profile/{isu}", headers={"If-None-Match": f'W/"{isu}-7-p42"'})
+
+        # Профиль не менялся, но ссылки из закэшированного ответа уже могли истечь
+        assert response.status_code == 200
+        assert response.headers["ETag"] == f'W/"{isu}-7-p43"'
 
 
 @pytest.mark.asyncio
@@ -507,7 +710,8 @@ async def test_update_gender_preference_success(app):
                             "icon": "gender_preferences",
                         }
                     ]
-                }
+                },
+                "$inc": {"version": 1},
             },
         )
 
@@ -538,13 +742,14 @@ async def test_update_gender_preference_user_not_found(app):
                             "icon": "gender_preferences",
                         }
                     ]
-                }
+                },
+                "$inc": {"version": 1},
             },
         )
 
 
 @pytest.mark.asyncio
-async def test_update_carousel_photo_success(app):
+async def test_update_carousel_photo_success(app, mock_gc_enqueue):
     isu = 123456
     old_photo_url = "old_photo.png"
     new_file_content = b"new image data"
@@ -569,8 +774,7 @@ async def test_update_carousel_photo_success(app):
 
         mock_user_collection.find_one.return_value = user_data
 
-        mock_db_instance.minio_instance.remove_object.return_value = None
-        mock_db_instance.upload_file_to_minio.return_value = new_file_url
+        mock_db_instance.upload_media_file = AsyncMock(return_value=new_file_url)
 
         mock_user_collection.update_one.return_value.modified_count = 1
 
@@ -586,10 +790,8 @@ async def test_update_carousel_photo_success(app):
             "message": "carousel photo updated successfully",
             "new_photo_url": new_file_url,
         }
-        mock_db_instance.minio_instance.remove_object.assert_called_once_with(
-            mock_db_instance.minio_bucket_name, old_photo_url
-        )
-        mock_db_instance.upload_file_to_minio.assert_called_once()
+        mock_gc_enqueue.assert_called_once_with([old_photo_url])
+        mock_db_instance.upload_media_file.assert_called_once()
         mock_user_collection.update_one.assert_called_once()
 
 
@@ -603,6 +805,7 @@ async def test_update_carousel_photo_user_not_found(app):
     new_file.content_type = "image/png"
 
     with patch("app.api.profile.db_instance") as mock_db_instance:
+        mock_db_instance.upload_media_file = AsyncMock()
         mock_user_collection = AsyncMock()
         mock_db_instance.get_collection.return_value = mock_user_collection
 
@@ -631,6 +834,7 @@ async def test_update_carousel_photo_old_photo_not_found(app):
     user_data = {"isu": isu, "photos": {"carousel": ["photo1.png", "photo2.png"]}}
 
     with patch("app.api.profile.db_instance") as mock_db_instance:
+        mock_db_instance.upload_media_file = AsyncMock()
         mock_user_collection = AsyncMock()
         mock_db_instance.get_collection.return_value = mock_user_collection
 
@@ -648,7 +852,7 @@ async def test_update_carousel_photo_old_photo_not_found(app):
 
 
 @pytest.mark.asyncio
-async def test_delete_carousel_photo_success(app):
+async def test_delete_carousel_photo_success(app, mock_gc_enqueue):
     isu = 123456
     photo_url = "photo_to_delete.png"
 
@@ -660,7 +864,6 @@ async def test_delete_carousel_photo_success(app):
 
         mock_user_collection.find_one.return_value = user_data
 
-        mock_db_instance.minio_instance.remove_object.return_value = None
 
         mock_user_collection.update_one.return_value.modified_count = 1
 
@@ -669,9 +872,7 @@ async def test_delete_carousel_photo_success(app):
 
         assert response.status_code == 200
         assert response.json() == {"message": "carousel photo deleted successfully"}
-        mock_db_instance.minio_instance.remove_object.assert_called_once_with(
-            mock_db_instance.minio_bucket_name, photo_url
-        )
+        mock_gc_enqueue.assert_called_once_with([photo_url])
         mock_user_collection.update_one.assert_called_once()
 
 
@@ -731,7 +932,7 @@ async def test_update_worldview_success(app):
         assert response.status_code == 200
         assert response.json() == {"message": "worldview updated successfully"}
         mock_user_collection.update_one.assert_called_once_with(
-            {"isu": isu}, {"$set": {"mainFeatures.5.text": worldview}}
+            {"isu": isu}, {"$set": {"mainFeatures.5.text": worldview}, "$inc": {"version": 1}}
         )
 
 
@@ -753,7 +954,7 @@ async def test_update_worldview_user_not_found(app):
         assert response.status_code == 404
         assert response.json() == {"detail": "User not found or worldview not updated"}
         mock_user_collection.update_one.assert_called_once_with(
-            {"isu": isu}, {"$set": {"mainFeatures.5.text": worldview}}
+            {"isu": isu}, {"$set": {"mainFeatures.5.text": worldview}, "$inc": {"version": 1}}
         )
 
 
@@ -775,7 +976,7 @@ async def test_update_children_success(app):
         assert response.status_code == 200
         assert response.json() == {"message": "children updated successfully"}
         mock_user_collection.update_one.assert_called_once_with(
-            {"isu": isu}, {"$set": {"mainFeatures.6.text": children}}
+            {"isu": isu}, {"$set": {"mainFeatures.6.text": children}, "$inc": {"version": 1}}
         )
 
 
@@ -797,7 +998,7 @@ async def test_update_children_user_not_found(app):
         assert response.status_code == 404
         assert response.json() == {"detail": "User not found or children not updated"}
         mock_user_collection.update_one.assert_called_once_with(
-            {"isu": isu}, {"$set": {"mainFeatures.6.text": children}}
+            {"isu": isu}, {"$set": {"mainFeatures.6.text": children}, "$inc": {"version": 1}}
         )
 
 
@@ -826,7 +1027,8 @@ async def test_update_languages_success(app):
                         {"text": "English", "icon": "languages"},
                         {"text": "Russian", "icon": "languages"},
                     ]
-                }
+                },
+                "$inc": {"version": 1},
             },
         )
 
@@ -868,7 +1070,7 @@ async def test_update_alcohol_success(app):
         assert response.status_code == 200
         assert response.json() == {"message": "alcohol updated successfully"}
         mock_user_collection.update_one.assert_called_once_with(
-            {"isu": isu}, {"$set": {"mainFeatures.8.text": alcohol}}
+            {"isu": isu}, {"$set": {"mainFeatures.8.text": alcohol}, "$inc": {"version": 1}}
         )
 
 
@@ -910,7 +1112,7 @@ async def test_update_smoking_success(app):
         assert response.status_code == 200
         assert response.json() == {"message": "Smoking updated successfully"}
         mock_user_collection.update_one.assert_called_once_with(
-            {"isu": isu}, {"$set": {"mainFeatures.9.text": smoking}}
+            {"isu": isu}, {"$set": {"mainFeatures.9.text": smoking}, "$inc": {"version": 1}}
         )
 
 
@@ -932,3 +1134,44 @@ async def test_update_smoking_user_not_found(app):
         assert response.status_code == 404
         assert response.json() == {"detail": "User not found or smoking not updated"}
         mock_user_collection.update_one.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_get_profile_cards_batch(app):
+    users = [
+        {"isu": 2, "username": "second", "logo": "", "photos": []},
+        {"isu": 1, "username": "first", "logo": "meet/logos/1.png", "photos": ["meet/carousel/1.png"]},
+    ]
+
+    with patch.object(db_instance, "get_collection") as mock_get_collection, patch.object(
+        db_instance, "presign_many", side_effect=lambda keys, variant=None: {key: f"{variant}/{key}" for key in keys}
+    ) as mock_presign_many:
+        mock_user_collection = MagicMock()
+        mock_user_collection.find.return_value.to_list = AsyncMock(return_value=users)
+        mock_get_collection.return_value = mock_user_collection
+
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.post("/batch", json={"isus": [1, 2, 3, 1]})
+
+        assert response.status_code == 200
+        assert response.json() == {
+            "profiles": [
+                {"isu": 1, "username": "first", "logo": "thumb/meet/logos/1.png", "photo": "card/meet/carousel/1.png"},
+                {"isu": 2, "username": "second", "logo": None, "photo": None},
+            ],
+            "missing": [3],
+        }
+        query, projection = mock_user_collection.find.call_args.args
+        assert query == {"isu": {"$in": [1, 2, 3]}}
+        assert projection["photos"] == {"$slice": 1}
+        assert mock_presign_many.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_get_profile_cards_batch_limits(app):
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        empty = await ac.post("/batch", json={"isus": []})
+        too_many = await ac.post("/batch", json={"isus": list(range(301))})
+
+    assert empty.status_code == 422
+    assert too_many.status_code == 422
@@ -0,0 +1,84 @@
+from datetime import datetime
+from unittest.mock import patch
+
+import numpy as np
+
+from app.utils.ranking import CompatibilityRanker, popcount, top_k
+
+
+def make_user(isu, interests, preferences=(), birthdate=datetime(2000, 1, 1), faculty="", course=""):
+    return {
+        "isu": isu,
+        "birthdate": birthdate,
+        "interests": [{"text": tag, "icon": "tag"} for tag in interests],
+        "relationship_preferences": [{"id": pref} for pref in preferences],
+        "itmo": [{"text": faculty, "icon": "faculty"}, {"text": course, "icon": "course"}],
+    }
+
+
+def test_popcount():
+    words = np.array([[0b1011, 0], [np.iinfo(np.uint64).max, 1]], dtype=np.uint64)
+    assert popcount(words).tolist() == [3, 65]
+
+
+def test_top_k_orders_by_score():
+    scores = np.array([0.1, 0.9, 0.5, 0.7], dtype=np.float32)
+    assert top_k(scores, 2).tolist() == [1, 3]
+    assert top_k(scores, 10).tolist() == [1, 3, 2, 0]
+
+
+def test_rank_prefers_shared_interests_and_faculty():
+    user = make_user(1, ["Music", "Chess"], ["dates"], faculty="FITIP", course="3")
+    stranger = make_user(2, ["Football"], ["friends"], birthdate=datetime(1990, 1, 1), faculty="Other", course="1")
+    partial = make_user(3, ["Music"], ["dates"], faculty="Other", course="3")
+    twin = make_user(4, ["Music", "Chess"], ["dates"], faculty="FITIP", course="3")
+
+    ranked = CompatibilityRanker().rank(user, [stranger, partial, twin], {}, 3)
+
+    assert [candidate["isu"] for candidate in ranked] == [4, 3, 2]
+
+
+def test_rank_uses_quiz_similarity():
+    user = make_user(1, [])
+    close = make_user(2, [])
+    far = make_user(3, [])
+    quiz_scores = {1: {"t": 80.0}, 2: {"t": 75.0}, 3: {"t": 10.0}}
+
+    ranked = CompatibilityRanker().rank(user, [far, close], quiz_scores, 1)
+
+    assert [candidate["isu"] for candidate in ranked] == [2]
+
+
+def test_encode_legacy_birthdate_from_main_features():
+    user = {"isu": 1, "mainFeatures": [{"text": "2000-01-01", "icon": "birthdate"}]}
+    features = CompatibilityRanker().encode([user], {})
+    assert 20 < features.age[0] < 40
+
+
+def test_encode_reuses_cached_features_until_version_changes():
+    ranker = CompatibilityRanker()
+    user = {**make_user(1, ["Music"]), "version": 1}
+
+    with patch.object(ranker, "encode_user", wraps=ranker.encode_user) as mock_encode_user:
+        first = ranker.encode([user], {})
+        second = ranker.encode([user], {})
+        changed = ranker.encode([{**make_user(1, ["Chess"]), "version": 2}], {})
+
+    assert mock_encode_user.call_count == 2
+    assert np.array_equal(first.interests, second.interests)
+    assert not np.array_equal(first.interests, changed.interests[:, : first.interests.shape[1]])
+
+
+def test_rank_with_small_cache_and_growing_vocabulary():
+    ranker = CompatibilityRanker(cache_size=2)
+    user = make_user(1, ["Music"], faculty="FITIP")
+    ranker.rank(user, [make_user(2, ["Chess"]), make_user(3, ["Music"])], {}, 2)
+
+    # Новые теги расширяют битовые маски, переполненный кэш сбрасывается
+    many_tags = [f"Tag {i}" for i in range(100)]
+    candidates = [make_user(4, many_tags), make_user(5, ["Music"], faculty="FITIP"), make_user(6, ["Chess"])]
+    ranked = ranker.rank(user, candidates, {}, 3)
+
+    expected = CompatibilityRanker().rank(user, candidates, {}, 3)
+    assert [candidate["isu"] for candidate in ranked] == [candidate["isu"] for candidate in expected]
+    assert ranked[0]["isu"] == 5
@@ -138,20 +138,21 @@ async def test_upload_logo_success():
             "upload_file_to_minio",
             return_value="http://minio.test/logos/logo.jpg",
         ):
-            mock_update_result = MagicMock()
-            mock_update_result.modified_count = 1
-            mock_users_collection.update_one.return_value = mock_update_result
+            mock_users_collection.find_one_and_update.return_value = {"logo": "meet/logos/old.jpg"}
 
-            async with AsyncClient(app=app, base_url="http://test") as ac:
-                files = {"file": ("logo.jpg", b"fake image data", "image/jpeg")}
-                params = {"isu": 123456}
-                response = await ac.post("/auth/register/upload_logo", params=params, files=files)
+            with patch("app.api.register.storage_gc.enqueue", AsyncMock()) as mock_enqueue:
+                async with AsyncClient(app=app, base_url="http://test") as ac:
+                    files = {"file": ("logo.jpg", b"fake image data", "image/jpeg")}
+                    params = {"isu": 123456}
+                    response = await ac.post("/auth/register/upload_logo", params=params, files=files)
 
             assert response.status_code == 200
             assert response.json() == {
                 "message": "Avatar uploaded successfully",
                 "avatar_url": "http://minio.test/logos/logo.jpg",
             }
+            # Прежний логотип уходит на удаление
+            mock_enqueue.assert_awaited_once_with(["meet/logos/old.jpg"])
 
 
 @pytest.mark.asyncio
@@ -164,17 +165,17 @@ async def test_upload_logo_user_not_found():
             "upload_file_to_minio",
             return_value="http://minio.test/logos/logo.jpg",
         ):
-            mock_update_result = MagicMock()
-            mock_update_result.modified_count = 0
-            mock_users_collection.update_one.return_value = mock_update_result
+            mock_users_collection.find_one_and_update.return_value = None
 
-            async with AsyncClient(app=app, base_url="http://test") as ac:
-                files = {"file": ("logo.jpg", b"fake image data", "image/jpeg")}
-                params = {"isu": 123456}
-                response = await ac.post("/auth/register/upload_logo", params=params, files=files)
+            with patch("app.api.register.storage_gc.enqueue", AsyncMock()) as mock_enqueue:
+                async with AsyncClient(app=app, base_url="http://test") as ac:
+                    files = {"file": ("logo.jpg", b"fake image data", "image/jpeg")}
+                    params = {"isu": 123456}
+                    response = await ac.post("/auth/register/upload_logo", params=params, files=files)
 
             assert response.status_code == 404
             assert response.json() == {"detail": "User not found or logo not uploaded"}
+            mock_enqueue.assert_awaited_once_with(["http://minio.test/logos/logo.jpg"])
 
 
 @pytest.mark.asyncio
@@ -190,26 +191,27 @@ async def test_upload_carousel_success():
             ]
             mock_upload.side_effect = mock_file_urls
 
-            mock_update_result = MagicMock()
-            mock_update_result.modified_count = 1
-            mock_users_collection.update_one.return_value = mock_update_result
+            old_photos = ["meet/carousel/old1.jpg", "meet/carousel/old2.jpg"]
+            mock_users_collection.find_one_and_update.return_value = {"photos": old_photos}
 
-            async with AsyncClient(app=app, base_url="http://test") as ac:
-                files = [
-                    ("files", ("image1.jpg", b"fake image data 1", "image/jpeg")),
-                    ("files", ("image2.jpg", b"fake image data 2", "image/jpeg")),
-                    ("files", ("image3.jpg", b"fake image data 3", "image/jpeg")),
-                ]
-                params = {"isu": 123456}
-                response = await ac.post("/auth/register/upload_carousel", params=params, files=files)
+            with patch("app.api.register.storage_gc.enqueue", AsyncMock()) as mock_enqueue:
+                async with AsyncClient(app=app, base_url="http://test") as ac:
+                    files = [
+                        ("files", ("image1.jpg", b"fake image data 1", "image/jpeg")),
+                        ("files", ("image2.jpg", b"fake image data 2", "image/jpeg")),
+                        ("files", ("image3.jpg", b"fake image data 3", "image/jpeg")),
+                    ]
+                    params = {"isu": 123456}
+                    response = await ac.post("/auth/register/upload_carousel", params=params, files=files)
 
             assert response.status_code == 200
-            assert response.json() == {
-                "message": "Carousel photos uploaded successfully",
-                "carousel_urls": mock_file_urls,
-            }
+            # Файлы загружаются параллельно, порядок вызовов мока не фиксирован
+            assert response.json()["message"] == "Carousel photos uploaded successfully"
+            assert sorted(response.json()["carousel_urls"]) == mock_file_urls
 
             assert mock_upload.call_count == 3
+            # Замененные фото уходят на удаление
+            mock_enqueue.assert_awaited_once_with(old_photos)
 
 
 @pytest.mark.asyncio
@@ -217,7 +219,9 @@ async def test_upload_carousel_user_not_found():
     mock_users_collection = AsyncMock()
 
     with patch.object(db_instance, "get_collection", return_value=mock_users_collection):
-        with patch.object(db_instance, "upload_file_to_minio") as mock_upload:
+        with patch.object(db_instance, "upload_file_to_minio") as mock_upload, patch.object(
+            db_instance, "remove_object"
+        ) as mock_remove:
             mock_file_urls = [
                 "http://minio.test/carousel/image1.jpg",
                 "http://minio.test/carousel/image2.jpg",
@@ -225,9 +229,7 @@ async def test_upload_carousel_user_not_found():
             ]
             mock_upload.side_effect = mock_file_urls
 
-            mock_update_result = MagicMock()
-            mock_update_result.modified_count = 0
-            mock_users_collection.update_one.return_value = mock_update_result
+            mock_users_collection.find_one_and_update.return_value = None
 
             async with AsyncClient(app=app, base_url="http://test") as ac:
                 files = [
@@ -240,6 +242,7 @@ async def test_upload_carousel_user_not_found():
 
             assert response.status_code == 404
             assert response.json() == {"detail": "User not found or carousel photos not updated"}
+            assert sorted(call.args[0] for call in mock_remove.call_args_list) == mock_file_urls
 
 
 @pytest.mark.asyncio
@@ -259,7 +262,7 @@ async def test_select_username_success():
         assert response.status_code == 200
         assert response.json() == {"message": "Username updated successfully"}
         mock_user_collection.update_one.assert_called_once_with(
-            {"isu": payload["isu"]}, {"$set": {"username": payload["username"]}}
+            {"isu": payload["isu"]}, {"$set": {"username": payload["username"]}, "$inc": {"version": 1}}
         )
 
 
@@ -280,7 +283,7 @@ async def test_select_username_user_not_found():
         assert response.status_code == 404
         assert response.json() == {"detail": "User not found or username not updated"}
         mock_user_collection.update_one.assert_called_once_with(
-            {"isu": payload["isu"]}, {"$set": {"username": payload["username"]}}
+            {"isu": payload["isu"]}, {"$set": {"username": payload["username"]}, "$inc": {"version": 1}}
         )
 
 
@@ -302,7 +305,10 @@ async def test_select_preferences_success():
         assert response.json() == {"message": "Gender preference updated successfully"}
         mock_user_collection.update_one.assert_called_once_with(
             {"isu": payload["isu"]},
-            {"$set": {"gender_preferences": [{"text": "Female", "icon": "gender_preferences"}]}},
+            {
+                "$set": {"gender_preferences": [{"text": "Female", "icon": "gender_preferences"}]},
+                "$inc": {"version": 1},
+            },
         )
 
 
@@ -324,7 +330,10 @@ async def test_select_preferences_user_not_found():
         assert response.json() == {"detail": "User not found or preference not updated"}
         mock_user_collection.update_one.assert_called_once_with(
             {"isu": payload["isu"]},
-            {"$set": {"gender_preferences": [{"text": "Female", "icon": "gender_preferences"}]}},
+            {
+                "$set": {"gender_preferences": [{"text": "Female", "icon": "gender_preferences"}]},
+                "$inc": {"version": 1},
+            },
         )
 
 
@@ -0,0 +1,136 @@
+import datetime
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from fastapi import FastAPI
+from httpx import AsyncClient
+from pymongo.errors import DuplicateKeyError
+
+from app.api.calendar import router as calendar_router
+from app.utils import schedule_refresh
+from app.utils.db import db_instance
+
+
+def make_db(collection):
+    mock_db = MagicMock()
+    mock_db.__getitem__.side_effect = lambda name: {schedule_refresh.JOBS_COLLECTION: collection}[name]
+    return mock_db
+
+
+def make_job(attempts=1):
+    return {"_id": 1, "isu": 123456, "token": "token", "run_id": "run", "attempts": attempts}
+
+
+@pytest.mark.asyncio
+async def test_enqueue_upserts_job_and_starts_processing():
+    mock_collection = MagicMock()
+    mock_collection.update_one = AsyncMock()
+
+    with patch.object(db_instance, "db", make_db(mock_collection)), patch.object(
+        schedule_refresh, "process_due", AsyncMock(return_value=1)
+    ) as mock_process_due:
+        assert await schedule_refresh.enqueue(123456, "token")
+        await next(iter(schedule_refresh._background_tasks))
+
+    query, update = mock_collection.update_one.call_args.args
+    assert query["isu"] == 123456
+    assert update["$set"]["token"] == "token"
+    assert update["$set"]["status"] == schedule_refresh.STATUS_PENDING
+    assert mock_collection.update_one.call_args.kwargs == {"upsert": True}
+    mock_process_due.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_enqueue_deduplicates_running_or_fresh_job():
+    mock_collection = MagicMock()
+    mock_collection.update_one = AsyncMock(side_effect=DuplicateKeyError("isu"))
+
+    with patch.object(db_instance, "db", make_db(mock_collection)), patch.object(
+        schedule_refresh, "process_due", AsyncMock()
+    ) as mock_process_due:
+        assert not await schedule_refresh.enqueue(123456, "token")
+
+    mock_process_due.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_run_marks_job_done_and_drops_token():
+    mock_collection = MagicMock()
+    mock_collection.update_one = AsyncMock()
+
+    with patch.object(db_instance, "db", make_db(mock_collection)), patch.object(
+        schedule_refresh, "refresh_schedule", AsyncMock()
+    ) as mock_refresh:
+        await schedule_refresh.run(make_job())
+
+    mock_refresh.assert_awaited_once_with(123456, "token")
+    query, update = mock_collection.update_one.call_args.args
+    assert query == {"_id": 1, "run_id": "run"}
+    assert update["$set"]["status"] == schedule_refresh.STATUS_DONE
+    assert update["$unset"] == {"token": ""}
+
+
+@pytest.mark.asyncio
+async def test_run_retries_with_backoff_then_fails():
+    mock_collection = MagicMock()
+    mock_collection.update_one = AsyncMock()
+    error = schedule_refresh.ScheduleFetchError("my.itmo.ru responded with 502")
+
+    with patch.object(db_instance, "db", make_db(mock_collection)), patch.object(
+        schedule_refresh, "refresh_schedule", AsyncMock(side_effect=error)
+    ):
+        await schedule_refresh.run(make_job(attempts=2))
+        retry = mock_collection.update_one.call_args.args[1]
+        await schedule_refresh.run(make_job(attempts=schedule_refresh.MAX_ATTEMPTS))
+        failed = mock_collection.update_one.call_args.args[1]
+
+    assert retry["$set"]["status"] == schedule_refresh.STATUS_PENDING
+    assert retry["$set"]["not_before"] > datetime.datetime.now() + datetime.timedelta(seconds=50)
+    assert failed["$set"]["status"] == schedule_refresh.STATUS_FAILED
+    assert failed["$unset"] == {"token": ""}
+
+
+@pytest.mark.asyncio
+async def test_run_does_not_retry_rejected_token():
+    mock_collection = MagicMock()
+    mock_collection.update_one = AsyncMock()
+    error = schedule_refresh.ScheduleFetchError("my.itmo.ru rejected the token (401)", retryable=False)
+
+    with patch.object(db_instance, "db", make_db(mock_collection)), patch.object(
+        schedule_refresh, "refresh_schedule", AsyncMock(side_effect=error)
+    ):
+        await schedule_refresh.run(make_job())
+
+    assert mock_collection.update_one.call_args.args[1]["$set"]["status"] == schedule_refresh.STATUS_FAILED
+
+
+def test_backoff_is_exponential_and_capped():
+    assert schedule_refresh.backoff(1) == schedule_refresh.BACKOFF_BASE
+    assert schedule_refresh.backoff(3) == schedule_refresh.BACKOFF_BASE * 4
+    assert schedule_refresh.backoff(20) == schedule_refresh.BACKOFF_MAX
+
+
+@pytest.mark.asyncio
+async def test_process_due_drains_claimed_jobs():
+    with patch.object(schedule_refresh, "claim", AsyncMock(side_effect=[make_job(), make_job(), None])), patch.object(
+        schedule_refresh, "run", AsyncMock()
+    ) as mock_run:
+        assert await schedule_refresh.process_due() == 2
+
+    assert mock_run.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_schedule_status_endpoint():
+    app = FastAPI()
+    app.include_router(calendar_router)
+
+    with patch.object(
+        schedule_refresh, "get_status", AsyncMock(side_effect=[{"isu": 123456, "status": "done"}, None])
+    ):
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            found = await ac.get("/schedule_status/123456")
+            missing = await ac.get("/schedule_status/654321")
+
+    assert found.json() == {"isu": 123456, "status": "done"}
+    assert missing.status_code == 404
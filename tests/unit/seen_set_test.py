@@ -0,0 +1,80 @@
+from array import array
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from app.utils import seen_set
+from app.utils.db import db_instance
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    seen_set._cache.clear()
+    yield
+    seen_set._cache.clear()
+
+
+def test_contains_and_filter_unseen():
+    seen = array("q", [3, 7, 11])
+    assert seen_set.contains(seen, 7)
+    assert not seen_set.contains(seen, 8)
+    assert seen_set.filter_unseen(seen, [1, 3, 8, 11, 12]) == [1, 8, 12]
+
+
+def test_sample_size_for_is_bounded():
+    assert seen_set.sample_size_for(array("q", [1, 2]), 5) == 7
+    assert seen_set.sample_size_for(array("q", range(1000)), 5) == 5 + seen_set.OVERSAMPLE_LIMIT
+
+
+def test_sample_exhausted_only_for_full_sample():
+    seen = array("q", [1, 2, 3])
+    assert seen_set.sample_exhausted(seen, [1, 2, 3], 1, 3)
+    assert not seen_set.sample_exhausted(seen, [1, 2, 4], 1, 3)
+    # Неполная выборка - в нее попал весь пул, искать больше негде
+    assert not seen_set.sample_exhausted(seen, [1, 2], 1, 3)
+
+
+@pytest.mark.asyncio
+async def test_get_seen_bootstraps_from_likes_and_dislikes():
+    mock_seen_sets = MagicMock()
+    mock_seen_sets.find_one = AsyncMock(return_value=None)
+    mock_seen_sets.update_one = AsyncMock()
+    mock_likes = MagicMock()
+    mock_likes.distinct = AsyncMock(return_value=[9, 2])
+    mock_dislikes = MagicMock()
+    mock_dislikes.distinct = AsyncMock(return_value=[5, 2])
+
+    mock_db = MagicMock()
+    mock_db.__getitem__.side_effect = lambda name: {
+        seen_set.SEEN_COLLECTION: mock_seen_sets,
+        "likes": mock_likes,
+        "dislikes": mock_dislikes,
+    }[name]
+
+    with patch.object(db_instance, "db", mock_db):
+        seen = await seen_set.get_seen(1)
+        cached = await seen_set.get_seen(1)
+
+    assert list(seen) == [2, 5, 9]
+    assert cached is seen
+    mock_seen_sets.find_one.assert_awaited_once()
+    update = mock_seen_sets.update_one.call_args.args[1]
+    assert update["$addToSet"] == {"ids": {"$each": [2, 5, 9]}}
+
+
+@pytest.mark.asyncio
+async def test_mark_seen_updates_store_and_cache():
+    mock_seen_sets = MagicMock()
+    mock_seen_sets.find_one = AsyncMock(return_value={"ids": [10, 30]})
+    mock_seen_sets.update_one = AsyncMock()
+
+    mock_db = MagicMock()
+    mock_db.__getitem__.return_value = mock_seen_sets
+
+    with patch.object(db_instance, "db", mock_db):
+        await seen_set.mark_seen(1, 20)
+        seen = await seen_set.get_seen(1)
+
+    assert list(seen) == [10, 20, 30]
+    mock_seen_sets.update_one.assert_awaited_once()
+    assert mock_seen_sets.update_one.call_args.args[1]["$addToSet"] == {"ids": 20}
@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+
+from app.utils import single_flight
+from app.utils.single_flight import SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_execution():
+    group = SingleFlight("test_share")
+    started = asyncio.Event()
+    release = asyncio.Event()
+    calls = []
+
+    async def operation(value):
+        calls.append(value)
+        started.set()
+        await release.wait()
+        return value * 2
+
+    first = asyncio.create_task(group.do("key", operation, 21))
+    await started.wait()
+    second = asyncio.create_task(group.do("key", operation, 21))
+    other = asyncio.create_task(group.do("other", operation, 1))
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await asyncio.gather(first, second, other) == [42, 42, 2]
+    assert calls == [21, 1]
+    assert group.stats() == {"in_flight": 0, "executions": 2, "shared": 1}
+    assert single_flight.stats()["test_share"] == group.stats()
+
+
+@pytest.mark.asyncio
+async def test_exception_is_shared_and_key_is_released():
+    group = SingleFlight("test_errors")
+    release = asyncio.Event()
+
+    async def failing():
+        await release.wait()
+        raise ValueError("upstream failed")
+
+    callers = [asyncio.create_task(group.do("key", failing)) for _ in range(3)]
+    await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(*callers, return_exceptions=True)
+
+    assert all(isinstance(result, ValueError) for result in results)
+    assert group.stats()["executions"] == 1
+
+    async def succeeding():
+        return "ok"
+
+    # После завершения ключ свободен: следующий вызов выполняется заново
+    assert await group.do("key", succeeding) == "ok"
+    assert group.stats()["executions"] == 2
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_cancel_shared_call():
+    group = SingleFlight("test_cancel")
+    release = asyncio.Event()
+
+    async def operation():
+        await release.wait()
+        return "done"
+
+    cancelled = asyncio.create_task(group.do("key", operation))
+    waiting = asyncio.create_task(group.do("key", operation))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await waiting == "done"
+    assert cancelled.cancelled()
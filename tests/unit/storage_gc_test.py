@@ -0,0 +1,128 @@
+import datetime
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from app.utils import storage_gc
+from app.utils.db import db_instance
+
+
+def make_db(collections):
+    mock_db = MagicMock()
+    mock_db.__getitem__.side_effect = lambda name: collections[name]
+    return mock_db
+
+
+def async_iter(items):
+    async def iterate():
+        for item in items:
+            yield item
+
+    cursor = MagicMock()
+    cursor.__aiter__.side_effect = lambda: iterate()
+    return cursor
+
+
+@pytest.mark.asyncio
+async def test_enqueue_cleans_keys_and_skips_empty():
+    mock_gc_collection = MagicMock()
+    mock_gc_collection.bulk_write = AsyncMock()
+
+    with patch.object(db_instance, "db", make_db({storage_gc.GC_COLLECTION: mock_gc_collection})):
+        await storage_gc.enqueue([f"{db_instance.minio_bucket_name}/logos/1.png", None, ""])
+        await storage_gc.enqueue([])
+
+    requests = mock_gc_collection.bulk_write.call_args.args[0]
+    assert [request._doc["key"] for request in requests] == ["logos/1.png"]
+    assert requests[0]._doc["not_before"] > datetime.datetime.now()
+    mock_gc_collection.bulk_write.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_collect_removes_batch_and_retries_failures():
+    batch = [{"_id": 1, "key": "carousel/1_a_full.webp"}, {"_id": 2, "key": "logos/2.png"}]
+    mock_cursor = MagicMock()
+    mock_cursor.limit.return_value = mock_cursor
+    mock_cursor.to_list = AsyncMock(return_value=batch)
+    mock_gc_collection = MagicMock()
+    mock_gc_collection.find.return_value = mock_cursor
+    mock_gc_collection.delete_many = AsyncMock()
+    mock_gc_collection.update_many = AsyncMock()
+
+    with patch.object(db_instance, "db", make_db({storage_gc.GC_COLLECTION: mock_gc_collection})), patch.object(
+        db_instance, "remove_objects", AsyncMock(return_value=["logos/2.png"])
+    ) as mock_remove:
+        removed = await storage_gc.collect()
+
+    assert removed == 1
+    assert mock_remove.call_args.args[0] == [
+        "carousel/1_a_thumb.webp",
+        "carousel/1_a_card.webp",
+        "carousel/1_a_full.webp",
+        "logos/2.png",
+    ]
+    assert mock_gc_collection.delete_many.call_args_list[0].args[0] == {"_id": {"$in": [1]}}
+    assert mock_gc_collection.update_many.call_args.args[0] == {"_id": {"$in": [2]}}
+
+
+@pytest.mark.asyncio
+async def test_reconcile_queues_old_unreferenced_objects():
+    bucket = db_instance.minio_bucket_name
+    old = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=2)
+    fresh = datetime.datetime.now(datetime.timezone.utc)
+
+    def collection(documents):
+        mock_collection = MagicMock()
+        mock_collection.find.return_value = async_iter(documents)
+        return mock_collection
+
+    mock_gc_collection = MagicMock()
+    mock_gc_collection.distinct = AsyncMock(return_value=["logos/queued.png"])
+    mock_db = make_db(
+        {
+            "users": collection([{"logo": f"{bucket}/logos/1.png", "photos": [f"{bucket}/carousel/1_a_full.webp"]}]),
+            "stories": collection([]),
+            "media": collection([{"path": f"{bucket}/media/c/1.mp4"}]),
+            "uploads": collection([]),
+            storage_gc.GC_COLLECTION: mock_gc_collection,
+        }
+    )
+    objects = {
+        "logos/": [("logos/1.png", old), ("logos/orphan.png", old), ("logos/new.png", fresh), ("logos/queued.png", old)],
+        "carousel/": [("carousel/1_a_thumb.webp", old), ("carousel/2_b_card.webp", old)],
+        "stories/": [],
+        "media/": [("media/c/1.mp4", old)],
+    }
+
+    with patch.object(db_instance, "db", mock_db), patch.object(
+        db_instance, "list_objects", AsyncMock(side_effect=lambda prefix: objects[prefix])
+    ), patch("app.utils.storage_gc.enqueue", AsyncMock()) as mock_enqueue:
+        dry = await storage_gc.reconcile(dry_run=True)
+        mock_enqueue.assert_not_called()
+        orphaned = await storage_gc.reconcile()
+
+    assert dry == orphaned == ["logos/orphan.png", "carousel/2_b_card.webp"]
+    mock_enqueue.assert_called_once_with(orphaned, delay=datetime.timedelta(0))
+
+
+@pytest.mark.asyncio
+async def test_expire_uploads_aborts_stale_multipart_uploads():
+    mock_uploads = MagicMock()
+    mock_uploads.find_one_and_update = AsyncMock(
+        side_effect=[
+            {"_id": 1, "key": "stories/1_a.mp4", "multipart_id": "mp-1"},
+            {"_id": 2, "key": "logos/1_b.jpg"},
+            None,
+        ]
+    )
+
+    with patch.object(db_instance, "db", make_db({"uploads": mock_uploads})), patch.object(
+        db_instance, "abort_multipart_upload", AsyncMock()
+    ) as mock_abort:
+        assert await storage_gc.expire_uploads() == 2
+
+    mock_abort.assert_awaited_once_with("stories/1_a.mp4", "mp-1")
+    query, update = mock_uploads.find_one_and_update.call_args.args
+    assert query["status"] == {"$in": ["pending", "completing"]}
+    assert query["created_at"]["$lt"] <= datetime.datetime.now() - storage_gc.UPLOAD_STALE_AFTER
+    assert update == {"$set": {"status": "expired"}}
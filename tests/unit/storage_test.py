@@ -0,0 +1,50 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.utils.storage import StorageExecutor
+
+
+@pytest.mark.asyncio
+async def test_run_keeps_event_loop_responsive():
+    executor = StorageExecutor(max_workers=2)
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.01)
+
+    ticker_task = asyncio.create_task(ticker())
+    thread_names = await asyncio.gather(
+        executor.run(lambda: time.sleep(0.1) or threading.current_thread().name),
+        executor.run(lambda: time.sleep(0.1) or threading.current_thread().name),
+    )
+    ticker_task.cancel()
+
+    assert all(name.startswith("storage") for name in thread_names)
+    assert ticks >= 5
+    assert executor.stats()["completed"] == 2
+    executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_run_propagates_errors_and_counts_failures():
+    executor = StorageExecutor(max_workers=1)
+
+    def fail():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        await executor.run(fail)
+
+    assert await executor.run(lambda a, b=0: a + b, 1, b=2) == 3
+    stats = executor.stats()
+    assert stats["failed"] == 1
+    assert stats["completed"] == 2
+    assert stats["active"] == 0
+    assert stats["queued"] == 0
+    executor.shutdown()
@@ -0,0 +1,205 @@
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from bson import ObjectId
+from fastapi import FastAPI
+from httpx import AsyncClient
+
+from app.api.uploads import MULTIPART_THRESHOLD, PART_SIZE, router
+from app.utils.db import db_instance
+
+
+@pytest.fixture
+def app():
+    app = FastAPI()
+    app.include_router(router)
+    return app
+
+
+def make_db(upload=None, exists=False):
+    mock_uploads_collection = MagicMock()
+    mock_uploads_collection.insert_one = AsyncMock(return_value=MagicMock(inserted_id=ObjectId()))
+    mock_uploads_collection.find_one_and_update = AsyncMock(return_value=upload)
+    mock_uploads_collection.count_documents = AsyncMock(return_value=int(exists))
+    mock_uploads_collection.update_one = AsyncMock()
+
+    mock_users_collection = MagicMock()
+    mock_users_collection.update_one = AsyncMock(return_value=MagicMock(matched_count=1))
+    mock_users_collection.find_one_and_update = AsyncMock(return_value={"logo": "meet/logos/1_old.jpg"})
+
+    mock_db = MagicMock()
+    mock_db.__getitem__.side_effect = lambda name: {
+        "uploads": mock_uploads_collection,
+        "users": mock_users_collection,
+    }[name]
+    return mock_db, mock_uploads_collection, mock_users_collection
+
+
+@pytest.mark.asyncio
+async def test_initiate_single_put(app):
+    mock_db, mock_uploads_collection, _ = make_db()
+
+    with patch.object(db_instance, "db", mock_db), patch.object(
+        db_instance, "presign_upload", AsyncMock(return_value="https://minio/put")
+    ):
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.post(
+                "/initiate",
+                json={"isu": 1, "target": "logo", "filename": "me.jpg", "content_type": "image/jpeg", "size": 1000},
+            )
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["url"] == "https://minio/put"
+    assert body["key"].startswith("logos/1_") and body["key"].endswith(".jpg")
+    upload = mock_uploads_collection.insert_one.call_args.args[0]
+    assert upload["status"] == "pending"
+    assert "multipart_id" not in upload
+
+
+@pytest.mark.asyncio
+async def test_initiate_multipart_and_validation(app):
+    mock_db, mock_uploads_collection, _ = make_db()
+    size = MULTIPART_THRESHOLD + PART_SIZE + 1
+
+    with patch.object(db_instance, "db", mock_db), patch.object(
+        db_instance, "create_multipart_upload", AsyncMock(return_value="mp-1")
+    ), patch.object(
+        db_instance, "presign_upload_part", AsyncMock(side_effect=lambda key, upload_id, n, exp: f"part-{n}")
+    ):
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.post(
+                "/initiate",
+                json={"isu": 1, "target": "story", "filename": "a.mp4", "content_type": "video/mp4", "size": size},
+            )
+            wrong_type = await ac.post(
+                "/initiate",
+                json={"isu": 1, "target": "logo", "filename": "a.mp4", "content_type": "video/mp4", "size": 10},
+            )
+            no_chat = await ac.post(
+                "/initiate",
+                json={"isu": 1, "target": "chat_media", "filename": "a.txt", "content_type": "text/plain", "size": 10},
+            )
+
+    assert response.status_code == 200
+    assert response.json()["part_urls"] == ["part-1", "part-2", "part-3"]
+    assert mock_uploads_collection.insert_one.call_args.args[0]["multipart_id"] == "mp-1"
+    assert wrong_type.status_code == 400
+    assert no_chat.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_complete_attaches_carousel_photo(app):
+    upload_id = ObjectId()
+    upload = {"_id": upload_id, "isu": 1, "target": "carousel", "key": "carousel/1_a.jpg", "size": 1000}
+    mock_db, mock_uploads_collection, mock_users_collection = make_db(upload)
+
+    with patch.object(db_instance, "db", mock_db), patch.object(
+        db_instance, "stat_object", AsyncMock(return_value=MagicMock(size=1000, content_type="image/jpeg"))
+    ):
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.post("/complete", json={"upload_id": str(upload_id)})
+
+    assert response.status_code == 200
+    file_url = f"{db_instance.minio_bucket_name}/carousel/1_a.jpg"
+    assert response.json() == {"message": "Upload completed successfully", "url": file_url}
+    mock_users_collection.update_one.assert_called_once_with(
+        {"isu": 1}, {"$push": {"photos": file_url}, "$inc": {"version": 1}}
+    )
+    assert mock_uploads_collection.update_one.call_args.args[1]["$set"]["status"] == "completed"
+
+
+@pytest.mark.asyncio
+async def test_complete_replaces_logo_and_queues_old_one(app):
+    upload_id = ObjectId()
+    upload = {"_id": upload_id, "isu": 1, "target": "logo", "key": "logos/1_a.jpg", "size": 1000}
+    mock_db, _, mock_users_collection = make_db(upload)
+
+    with patch.object(db_instance, "db", mock_db), patch.object(
+        db_instance, "stat_object", AsyncMock(return_value=MagicMock(size=1000, content_type="image/jpeg"))
+    ), patch("app.api.uploads.storage_gc.enqueue", AsyncMock()) as mock_enqueue:
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.post("/complete", json={"upload_id": str(upload_id)})
+
+    assert response.status_code == 200
+    file_url = f"{db_instance.minio_bucket_name}/logos/1_a.jpg"
+    assert mock_users_collection.find_one_and_update.call_args.args == (
+        {"isu": 1},
+        {"$set": {"logo": file_url}, "$inc": {"version": 1}},
+    )
+    mock_enqueue.assert_awaited_once_with(["meet/logos/1_old.jpg"])
+
+
+@pytest.mark.asyncio
+async def test_complete_rejects_missing_or_mismatched_objects(app):
+    upload_id = ObjectId()
+    upload = {"_id": upload_id, "isu": 1, "target": "logo", "key": "logos/1_a.jpg", "size": 1000}
+    mock_db, mock_uploads_collection, mock_users_collection = make_db(upload)
+
+    with patch.object(db_instance, "db", mock_db), patch.object(
+        db_instance, "stat_object", AsyncMock(side_effect=[Exception("NoSuchKey"), MagicMock(size=5, content_type="image/jpeg")])
+    ), patch.object(db_instance, "remove_object", AsyncMock()) as mock_remove:
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            missing = await ac.post("/complete", json={"upload_id": str(upload_id)})
+            mismatched = await ac.post("/complete", json={"upload_id": str(upload_id)})
+
+    assert missing.status_code == 400
+    assert mismatched.status_code == 400
+    mock_remove.assert_called_once_with("logos/1_a.jpg")
+    mock_users_collection.update_one.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_complete_rejects_unexpected_content_type(app):
+    upload_id = ObjectId()
+    upload = {"_id": upload_id, "isu": 1, "target": "logo", "key": "logos/1_a.jpg", "size": 1000}
+    mock_db, mock_uploads_collection, mock_users_collection = make_db(upload)
+
+    with patch.object(db_instance, "db", mock_db), patch.object(
+        db_instance, "stat_object", AsyncMock(return_value=MagicMock(size=1000, content_type="text/html"))
+    ), patch.object(db_instance, "remove_object", AsyncMock()) as mock_remove:
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.post("/complete", json={"upload_id": str(upload_id)})
+
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Content type text/html is not allowed"}
+    mock_remove.assert_called_once_with("logos/1_a.jpg")
+    assert mock_uploads_collection.update_one.call_args.args[1] == {"$set": {"status": "rejected"}}
+    mock_users_collection.find_one_and_update.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_complete_releases_upload_when_attach_fails(app):
+    upload_id = ObjectId()
+    upload = {"_id": upload_id, "isu": 1, "target": "logo", "key": "logos/1_a.jpg", "size": 1000}
+    mock_db, mock_uploads_collection, mock_users_collection = make_db(upload)
+    mock_users_collection.find_one_and_update.side_effect = [None, Exception("connection reset")]
+
+    with patch.object(db_instance, "db", mock_db), patch.object(
+        db_instance, "stat_object", AsyncMock(return_value=MagicMock(size=1000, content_type="image/jpeg"))
+    ), patch.object(db_instance, "remove_object", AsyncMock()) as mock_remove:
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            not_found = await ac.post("/complete", json={"upload_id": str(upload_id)})
+            statuses = [call.args[1]["$set"]["status"] for call in mock_uploads_collection.update_one.call_args_list]
+            with pytest.raises(Exception, match="connection reset"):
+                await ac.post("/complete", json={"upload_id": str(upload_id)})
+
+    # Пользователя нет - объект удаляется, загрузка отклоняется
+    assert not_found.status_code == 404
+    assert statuses == ["rejected"]
+    mock_remove.assert_called_once_with("logos/1_a.jpg")
+    # Временная ошибка - загрузка возвращается в pending и не зависает в completing
+    assert mock_uploads_collection.update_one.call_args.args[1] == {"$set": {"status": "pending"}}
+
+
+@pytest.mark.asyncio
+async def test_complete_unknown_or_repeated_upload(app):
+    mock_db, _, _ = make_db(None, exists=True)
+
+    with patch.object(db_instance, "db", mock_db):
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            repeated = await ac.post("/complete", json={"upload_id": str(ObjectId())})
+            invalid = await ac.post("/complete", json={"upload_id": "nope"})
+
+    assert repeated.status_code == 409
+    assert invalid.status_code == 400
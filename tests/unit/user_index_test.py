@@ -0,0 +1,118 @@
+from array import array
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from dateutil.relativedelta import relativedelta
+
+from app.models.match import DiscoveryFilters
+from app.utils.user_index import UserIndex
+
+
+def years_ago(years):
+    return datetime.now() - relativedelta(years=years, days=10)
+
+
+def make_user(isu, age=20, height=170.0, gender="female", preferences=("dates",)):
+    return {
+        "isu": isu,
+        "birthdate": years_ago(age),
+        "height_cm": height,
+        "gender": gender,
+        "relationship_pref_ids": list(preferences),
+        "schema_version": 2,
+    }
+
+
+def make_filters(**overrides):
+    return DiscoveryFilters(**{"gender": "Everyone", "min_age": 18, "max_age": 60, **overrides})
+
+
+def test_sample_applies_filters():
+    index = UserIndex()
+    index.load(
+        [
+            make_user(1),
+            make_user(2, gender="male"),
+            make_user(3, age=40),
+            make_user(4, height=190.0),
+            make_user(5, preferences=("friends",)),
+            make_user(6),
+        ]
+    )
+
+    filters = make_filters(
+        gender="Female", max_age=30, min_height=160, max_height=180, relationship_preferences=["dates"]
+    )
+
+    assert sorted(index.sample(1, filters, array("q"), 10)) == [6]
+    assert index.sample(1, make_filters(gender="Other"), array("q"), 10) == []
+
+
+def test_sample_excludes_seen_and_limits_size():
+    index = UserIndex()
+    index.load([make_user(isu) for isu in range(1, 11)])
+
+    result = index.sample(1, make_filters(), array("q", [2, 3, 4]), 3)
+
+    assert len(result) == 3
+    assert not {1, 2, 3, 4} & set(result)
+
+
+def test_load_falls_back_to_main_features():
+    index = UserIndex()
+    index.load(
+        [
+            {
+                "isu": 1,
+                "mainFeatures": [
+                    {"text": "180 cm", "icon": "height"},
+                    {"text": "male", "icon": "gender"},
+                    {"text": years_ago(25).strftime("%Y-%m-%d"), "icon": "birthdate"},
+                ],
+                "relationship_preferences": [{"id": "dates"}],
+            }
+        ]
+    )
+
+    filters = make_filters(gender="male", min_age=20, max_age=30, min_height=175, max_height=185)
+    assert index.sample(0, filters, array("q"), 1) == [1]
+
+
+def test_patch_updates_and_appends_rows():
+    index = UserIndex()
+    index.load([make_user(1)])
+
+    # До построения снимка изменения игнорируются
+    index.patch(1, height_cm=190.0)
+    assert index.height[0] == 170.0
+
+    index.ready = True
+    index.patch(1, height_cm=190.0, relationship_pref_ids=["friends"])
+    for isu in range(2, 1100):
+        index.patch(isu, birthdate=years_ago(20), height_cm=170.0, gender="male")
+    index.remove(5)
+
+    tall = make_filters(min_height=185, max_height=195, relationship_preferences=["friends"])
+    assert index.sample(0, tall, array("q"), 10) == [1]
+    assert len(index.sample(0, make_filters(gender="male"), array("q"), 2000)) == 1097
+    assert index.stats()["users"] == 1098
+
+
+@pytest.mark.asyncio
+async def test_build_from_collection():
+    cursor = MagicMock()
+    cursor.batch_size.return_value = cursor
+    cursor.to_list = AsyncMock(return_value=[make_user(1), make_user(2)])
+    collection = MagicMock()
+    collection.find.return_value = cursor
+
+    index = UserIndex()
+    await index.build(collection)
+
+    stats = index.stats()
+    assert stats["ready"] is True
+    assert stats["users"] == 2
+    assert stats["column_bytes"] > 0
+    assert stats["last_build_seconds"] is not None
+
@@ -0,0 +1,42 @@
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from app.migrations import user_schema_v2
+
+
+def _cursor(result):
+    cursor = MagicMock()
+    cursor.sort.return_value = cursor
+    cursor.limit.return_value = cursor
+    cursor.to_list = AsyncMock(return_value=result)
+    return cursor
+
+
+@pytest.mark.asyncio
+async def test_run_backfill_retries_users_changed_mid_batch():
+    users = MagicMock()
+    migrations = MagicMock()
+    migrations.find_one = AsyncMock(return_value=None)
+    migrations.update_one = AsyncMock()
+
+    first = {"_id": 1, "mainFeatures": [{"text": "2000-01-01", "icon": "birthdate"}]}
+    second = {"_id": 2, "mainFeatures": [{"text": "Male", "icon": "gender"}]}
+    edited = {"_id": 2, "mainFeatures": [{"text": "Female", "icon": "gender"}]}
+    # Первый проход по _id, затем дочистка документа, измененного между чтением и записью
+    users.find.side_effect = [_cursor([first, second]), _cursor([]), _cursor([edited]), _cursor([])]
+    users.bulk_write = AsyncMock(side_effect=[MagicMock(matched_count=1), MagicMock(matched_count=1)])
+
+    with patch("app.migrations.user_schema_v2.db_instance") as mock_db, patch(
+        "app.migrations.user_schema_v2.set_typed_fields_ready"
+    ) as ready:
+        mock_db.db = {"users": users, "migrations": migrations}
+        migrated = await user_schema_v2.run_backfill(batch_size=2)
+
+    assert migrated == 2
+    assert users.find.call_args_list[2].args[0] == {"schema_version": {"$exists": False}}
+    retry = users.bulk_write.call_args_list[1].args[0][0]
+    assert retry._filter["mainFeatures"] == edited["mainFeatures"]
+    assert retry._doc["$set"]["gender"] == "female"
+    assert migrations.update_one.call_args_list[-1].args[1]["$set"]["completed"] is True
+    ready.assert_called_once()
@@ -0,0 +1,69 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from app.utils.write_buffer import WriteBehindBuffer
+
+
+@pytest.fixture
+def collection():
+    mock_collection = MagicMock()
+    mock_collection.insert_many = AsyncMock()
+    return mock_collection
+
+
+@pytest.mark.asyncio
+async def test_flushes_on_interval(collection):
+    buffer = WriteBehindBuffer("test", lambda: collection, flush_interval=0.01)
+
+    await buffer.add({"n": 1})
+    await buffer.add({"n": 2})
+    await asyncio.sleep(0.05)
+
+    collection.insert_many.assert_awaited_once_with([{"n": 1}, {"n": 2}], ordered=False)
+    assert buffer.stats()["pending"] == 0
+    assert buffer.stats()["last_batch_size"] == 2
+    await buffer.close()
+
+
+@pytest.mark.asyncio
+async def test_flushes_in_batches_of_max_size(collection):
+    buffer = WriteBehindBuffer("test", lambda: collection, max_batch_size=2, flush_interval=10)
+
+    for n in range(5):
+        await buffer.add({"n": n})
+    await buffer.close()
+
+    batches = [call.args[0] for call in collection.insert_many.await_args_list]
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    stats = buffer.stats()
+    assert stats["events"] == 5
+    assert stats["flushes"] == 3
+    assert stats["max_batch_size"] == 2
+
+
+@pytest.mark.asyncio
+async def test_caller_flushes_when_pending_limit_reached(collection):
+    buffer = WriteBehindBuffer("test", lambda: collection, max_batch_size=100, flush_interval=10, max_pending=3)
+
+    for n in range(3):
+        await buffer.add({"n": n})
+
+    collection.insert_many.assert_awaited_once()
+    assert buffer.stats()["pending"] == 0
+    await buffer.close()
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_requeues_within_bound(collection):
+    collection.insert_many.side_effect = Exception("mongo is down")
+    buffer = WriteBehindBuffer("test", lambda: collection, flush_interval=10, max_pending=10)
+
+    await buffer.add({"n": 1})
+    await buffer.close()
+
+    stats = buffer.stats()
+    assert stats["failed_flushes"] == 1
+    assert stats["pending"] == 1
+    assert stats["dropped"] == 0